@@ -0,0 +1,59 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+from loguru import logger
+from ..des.network import LatencyModel, run_with_deep_stack
+from .routing import DEFAULT_SIZES, FIELDS, IMPLEMENTATIONS, run_suite
+
+parser = argparse.ArgumentParser(description='routing benchmark of chord implementations over simulated rings.')
+parser.add_argument('-i', '--implementations', type=str, nargs='+', default=list(IMPLEMENTATIONS),
+                    choices=list(IMPLEMENTATIONS))
+parser.add_argument('-n', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='ring sizes to measure')
+parser.add_argument('--lookups', type=int, default=1000, help='lookups per ring')
+parser.add_argument('--puts', type=int, default=1000, help='puts per ring')
+parser.add_argument('--joins', type=int, default=None,
+                    help='nodes joining when measuring convergence, defaults to 10%% of the ring')
+parser.add_argument('--latency', type=str, default='lognormal:0.005,0.5',
+                    help='rpc round trip time distribution, see python -m chord_simulation.des --help')
+parser.add_argument('--interval', type=float, default=None,
+                    help='fixed virtual seconds between runs of every maintenance task, '
+                         'defaults to the adaptive per-task schedule')
+parser.add_argument('--max_settle', type=float, default=300, help='virtual seconds to wait for convergence')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('-f', '--format', type=str, default='json', choices=['json', 'csv'])
+parser.add_argument('-o', '--output', type=str, default=None, help='write results to this file instead of stdout')
+parser.add_argument('-v', '--verbose', action='store_true', help='keep node logs and prints')
+
+
+def main():
+    args = parser.parse_args()
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level='ERROR')
+
+    def progress(result):
+        print(f"{result['implementation']} n={result['nodes']}: hops p50={result['lookup_hops_p50']} "
+              f"lookup p99={result['lookup_latency_p99']:.4f}s convergence={result['convergence_time']} "
+              f"({result['wall_time']:.1f}s)", file=sys.stderr)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        results = run_with_deep_stack(run_suite, args.implementations, sorted(args.sizes), on_result=progress,
+                                      lookups=args.lookups, puts=args.puts, joins=args.joins,
+                                      latency=LatencyModel.parse(args.latency), interval=args.interval,
+                                      seed=args.seed, max_settle=args.max_settle)
+
+    with open(args.output, 'w', newline='') if args.output else contextlib.nullcontext(sys.stdout) as out:
+        if args.format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            json.dump(results, out, indent=2)
+            out.write('\n')
+
+
+if __name__ == '__main__':
+    main()
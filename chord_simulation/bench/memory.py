@@ -0,0 +1,101 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from ..chord.storage import STORE_CLASSES
+
+# 每种存储写入的键数，键值与路由基准一样为 key-<i> -> value-<i>
+DEFAULT_KEYS = 1000000
+# 基线：不带变更日志、Merkle 树与有序索引的普通 str -> str 字典，各存储的内存按它的倍数报告
+BASELINE = 'plain'
+STORES = {BASELINE: dict, **STORE_CLASSES}
+
+parser = argparse.ArgumentParser(description='memory benchmark of the in-memory key/value stores.')
+parser.add_argument('-s', '--stores', type=str, nargs='+', default=list(STORES), choices=list(STORES),
+                    help='stores to measure, plain is a bare str -> str dict used as the baseline')
+parser.add_argument('-n', '--keys', type=int, default=DEFAULT_KEYS, help='keys written into one store')
+parser.add_argument('--value_size', type=int, default=None,
+                    help='pad values to this many bytes, defaults to value-<i> as written by the routing benchmark')
+parser.add_argument('--lookups', type=int, default=100000, help='random reads timed after the writes')
+parser.add_argument('-o', '--output', type=str, default=None, help='write results to this file instead of stdout')
+parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+
+
+def rss_bytes() -> int:
+    """当前进程的常驻内存，读不到 /proc 时退化为峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure_store(store: str, keys: int, value_size=None, lookups=100000) -> dict:
+    """在当前进程中向一个存储写入 keys 个键，返回常驻内存的增量与读写耗时"""
+    store_class = STORES[store]
+    value = (lambda i: f'value-{i}'.ljust(value_size, 'x')) if value_size else (lambda i: f'value-{i}')
+    before = rss_bytes()
+    started = time.perf_counter()
+    kv = store_class()
+    for i in range(keys):
+        kv[f'key-{i}'] = value(i)
+    written = time.perf_counter()
+    step = max(1, keys // lookups) if lookups else 0
+    for i in range(0, keys, step) if step else ():
+        kv[f'key-{i}']
+    finished = time.perf_counter()
+    used = rss_bytes() - before
+    return {
+        'store': store,
+        'keys': len(kv),
+        'value_size': value_size,
+        'rss_bytes': used,
+        'bytes_per_key': used / keys if keys else None,
+        'rss_mib_per_million_keys': used / keys * 1e6 / 2 ** 20 if keys else None,
+        'write_seconds': written - started,
+        'lookup_us': (finished - written) / len(range(0, keys, step)) * 1e6 if step and keys else None,
+    }
+
+
+def run_in_subprocess(store: str, keys: int, value_size=None, lookups=100000) -> dict:
+    """每种存储在独立的进程中测量，分配器不会把前一种存储释放的内存留给后一种"""
+    command = [sys.executable, '-m', 'chord_simulation.bench.memory', '--child', store, '-n', str(keys),
+               '--lookups', str(lookups)]
+    if value_size:
+        command += ['--value_size', str(value_size)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure_store(args.child, args.keys, args.value_size, args.lookups)))
+        return
+
+    results = []
+    for store in args.stores:
+        result = run_in_subprocess(store, args.keys, args.value_size, args.lookups)
+        results.append(result)
+        print(f"{store}: {result['bytes_per_key']:.1f} B/key, {result['rss_mib_per_million_keys']:.1f} MiB per "
+              f"million keys, write {result['write_seconds']:.1f}s, lookup {result['lookup_us']:.2f}us",
+              file=sys.stderr)
+    # 各存储相对普通字典的内存倍数，大于 1 表示比普通字典占用更多
+    baseline = next((r for r in results if r['store'] == BASELINE), None)
+    if baseline and baseline['rss_bytes'] > 0:
+        for result in results:
+            result['vs_plain'] = result['rss_bytes'] / baseline['rss_bytes']
+            if result is not baseline:
+                print(f"{result['store']} / {BASELINE}: {result['vs_plain']:.2f}x", file=sys.stderr)
+
+    with open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout) as out:
+        json.dump(results, out, indent=2)
+        out.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import time
+from ..des.network import LatencyModel
+from ..des.simulator import ChordSimulator, summarize
+from ..implement.chord_basic_query import ChordNode as ChordNodeBasicQuery
+from ..implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+
+IMPLEMENTATIONS = {
+    'basic_query': ChordNodeBasicQuery,
+    'finger_table': ChordNodeFingerTable,
+}
+
+DEFAULT_SIZES = [2 ** i for i in range(3, 13)]  # 8 ... 4096
+
+# CSV 输出的列，与 benchmark_ring 返回的字段一一对应
+FIELDS = [
+    'implementation', 'nodes', 'seed', 'latency_model',
+    'lookups', 'lookup_failed', 'lookup_latency_p50', 'lookup_latency_p99',
+    'lookup_hops_mean', 'lookup_hops_p50', 'lookup_hops_p99', 'lookup_rpcs_mean',
+    'puts', 'put_failed', 'put_latency_p50', 'put_latency_p99', 'put_rpcs_mean',
+    'joins', 'converged', 'convergence_time', 'wall_time',
+]
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def benchmark_ring(implementation, num_nodes, lookups=1000, puts=1000, joins=None, latency: LatencyModel = None,
+                   interval=None, seed=0, check_interval=0.25, max_settle=300.0):
+    """
+    用离散事件模拟器测量一个 num_nodes 节点的环：
+    先从随机节点写入 puts 个键，再从随机节点查找 lookups 次，统计时延、跳数与每次操作的 RPC 数；
+    然后在 1 个虚拟秒内加入 joins 个节点（默认为节点数的 10%），统计环重新收敛所需的虚拟时间（精度为 check_interval）
+    """
+    wall_start = time.perf_counter()
+    joins = max(1, num_nodes // 10) if joins is None else joins
+    simulator = ChordSimulator(IMPLEMENTATIONS[implementation], latency, interval=interval, seed=seed)
+    with simulator.installed():
+        simulator.bootstrap(num_nodes)
+
+        put_results = [simulator.put(f'key-{i}', f'value-{i}') for i in range(puts)]
+        keys = list(simulator.data)
+        lookup_results = [simulator.lookup(simulator.rng.choice(keys)) for _ in range(lookups)] if keys else []
+
+        churn_start = simulator.loop.now
+        simulator.schedule_churn(joins, 0, 0, churn_start, churn_start + 1.0)
+        simulator.loop.run(until=churn_start + 1.0)
+        converged_at = simulator.settle(check_interval, max_settle)
+
+    put_latency = summarize([elapsed for _, _, elapsed in put_results])
+    lookup_latency = summarize([elapsed for _, _, elapsed in lookup_results])
+    hops = summarize([max(rpcs['lookup'] - 1, 0) for _, rpcs, _ in lookup_results])
+    return {
+        'implementation': implementation,
+        'nodes': num_nodes,
+        'seed': seed,
+        'latency_model': repr(simulator.transport.latency),
+        'lookups': len(lookup_results),
+        'lookup_failed': sum(1 for correct, _, _ in lookup_results if not correct),
+        'lookup_latency_p50': lookup_latency['p50'],
+        'lookup_latency_p99': lookup_latency['p99'],
+        'lookup_hops_mean': hops['mean'],
+        'lookup_hops_p50': hops['p50'],
+        'lookup_hops_p99': hops['p99'],
+        'lookup_rpcs_mean': _mean([sum(rpcs.values()) for _, rpcs, _ in lookup_results]),
+        'puts': len(put_results),
+        'put_failed': sum(1 for ok, _, _ in put_results if not ok),
+        'put_latency_p50': put_latency['p50'],
+        'put_latency_p99': put_latency['p99'],
+        'put_rpcs_mean': _mean([sum(rpcs.values()) for _, rpcs, _ in put_results]),
+        'joins': simulator.churn['joined'],
+        'converged': converged_at is not None,
+        'convergence_time': converged_at - churn_start if converged_at is not None else None,
+        'wall_time': time.perf_counter() - wall_start,
+    }
+
+
+def run_suite(implementations=tuple(IMPLEMENTATIONS), sizes=DEFAULT_SIZES, on_result=None, **kwargs):
+    """对每种实现与每个环大小运行 benchmark_ring，返回结果列表；on_result 在每组结果产生后调用"""
+    results = []
+    for implementation in implementations:
+        for num_nodes in sizes:
+            result = benchmark_ring(implementation, num_nodes, **kwargs)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
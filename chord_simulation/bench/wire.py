@@ -0,0 +1,130 @@
+import argparse
+import contextlib
+import json
+import random
+import sys
+import time
+from thriftpy2.thrift import TMessageType
+from thriftpy2.transport import TMemoryBuffer
+from ..chord.chord_base import TRANSFER_CHUNK_SIZE, chord_thrift, make_scan_page
+from ..chord.compression import CODECS, decode_items
+from ..chord.kv_store import KVStore
+from ..chord.wire import PROTOCOLS, TRANSPORTS, WireFormat
+
+# 批量传输的键数，键值与路由基准一样为 key-<i> -> value-<i>
+DEFAULT_KEYS = 100000
+# 填充值时使用的词表，模拟可压缩的文本数据
+WORDS = ('chord', 'ring', 'node', 'finger', 'successor', 'predecessor', 'replica', 'stabilize', 'lookup', 'key',
+         'value', 'table', 'hash', 'join', 'leave', 'data', 'store', 'sync', 'merkle', 'bucket')
+
+parser = argparse.ArgumentParser(description='bytes-on-wire and cpu benchmark of the bulk transfer encodings.')
+parser.add_argument('-p', '--protocols', type=str, nargs='+', default=list(PROTOCOLS), choices=list(PROTOCOLS))
+parser.add_argument('-t', '--transports', type=str, nargs='+', default=list(TRANSPORTS), choices=list(TRANSPORTS))
+parser.add_argument('-c', '--codecs', type=str, nargs='+', default=['none'] + list(CODECS),
+                    choices=['none'] + list(CODECS))
+parser.add_argument('-n', '--keys', type=int, default=DEFAULT_KEYS, help='keys transferred, in scan pages')
+parser.add_argument('--page_size', type=int, default=TRANSFER_CHUNK_SIZE, help='keys per scan page')
+parser.add_argument('--value_size', type=int, default=None,
+                    help='pad values with words to this many bytes, defaults to value-<i> as written by the routing '
+                         'benchmark')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('-o', '--output', type=str, default=None, help='write results to this file instead of stdout')
+
+
+def make_store(keys: int, value_size=None, seed=0) -> KVStore:
+    rng = random.Random(seed)
+    store = KVStore()
+    for i in range(keys):
+        value = f'value-{i}'
+        while value_size and len(value) < value_size:
+            value += ' ' + rng.choice(WORDS)
+        store[f'key-{i}'] = value[:value_size] if value_size else value
+    return store
+
+
+def scan_pages(store: KVStore, page_size: int) -> list:
+    """按节点的 scan 分页取出全部数据，返回各页的 (键值对, 游标, 是否已取完)"""
+    pages, cursor = [], ''
+    while True:
+        data, cursor, done = store.scan(cursor, page_size, None, None)
+        pages.append((data, cursor, done))
+        if done:
+            return pages
+
+
+def measure_wire(pages: list, wire: WireFormat, codec=None) -> dict:
+    """
+    按服务端的方式编码每一页 scan 的响应（压缩后写成 Thrift 消息），再按客户端的方式读出并解压，
+    统计线上的字节数与两端各自的 CPU 时间
+    """
+    codecs = [codec] if codec else []
+    protocol_factory, transport_factory = wire.protocol_factory(), wire.transport_factory()
+    messages, encode_seconds = [], 0.0
+    for seqid, (data, cursor, done) in enumerate(pages):
+        started = time.process_time()
+        buffer = TMemoryBuffer()
+        transport = transport_factory.get_transport(buffer)
+        protocol = protocol_factory.get_protocol(transport)
+        result = chord_thrift.ChordNode.scan_result(success=make_scan_page(data, cursor, done, codecs))
+        protocol.write_message_begin('scan', TMessageType.REPLY, seqid)
+        result.write(protocol)
+        protocol.write_message_end()
+        transport.flush()
+        messages.append(buffer.getvalue())
+        encode_seconds += time.process_time() - started
+
+    keys, decode_seconds = 0, 0.0
+    for message in messages:
+        started = time.process_time()
+        transport = transport_factory.get_transport(TMemoryBuffer(message))
+        protocol = protocol_factory.get_protocol(transport)
+        protocol.read_message_begin()
+        result = chord_thrift.ChordNode.scan_result()
+        result.read(protocol)
+        protocol.read_message_end()
+        page = result.success
+        data = decode_items(page.codec, page.payload) if page.codec else page.data
+        keys += len(data)
+        decode_seconds += time.process_time() - started
+
+    wire_bytes = sum(len(message) for message in messages)
+    return {
+        'protocol': wire.protocol,
+        'transport': wire.transport,
+        'codec': codec or 'none',
+        'keys': keys,
+        'pages': len(messages),
+        'wire_bytes': wire_bytes,
+        'bytes_per_key': wire_bytes / keys if keys else None,
+        'encode_seconds': encode_seconds,
+        'decode_seconds': decode_seconds,
+        'cpu_us_per_key': (encode_seconds + decode_seconds) / keys * 1e6 if keys else None,
+    }
+
+
+def main():
+    args = parser.parse_args()
+    pages = scan_pages(make_store(args.keys, args.value_size, args.seed), args.page_size)
+    results = []
+    for protocol in args.protocols:
+        for transport in args.transports:
+            for codec in args.codecs:
+                result = measure_wire(pages, WireFormat(protocol, transport), None if codec == 'none' else codec)
+                results.append(result)
+                print(f"{protocol}/{transport}/{result['codec']}: {result['wire_bytes'] / 2 ** 20:.2f} MiB "
+                      f"({result['bytes_per_key']:.1f} B/key), encode {result['encode_seconds']:.2f}s, "
+                      f"decode {result['decode_seconds']:.2f}s", file=sys.stderr)
+    if results and results[0]['wire_bytes']:
+        baseline = results[0]
+        for result in results[1:]:
+            print(f"{result['protocol']}/{result['transport']}/{result['codec']} vs {baseline['protocol']}/"
+                  f"{baseline['transport']}/{baseline['codec']}: {baseline['wire_bytes'] / result['wire_bytes']:.2f}x "
+                  f"fewer bytes", file=sys.stderr)
+
+    with open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout) as out:
+        json.dump(results, out, indent=2)
+        out.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import asyncio
+import time
+import traceback
+from thriftpy2.contrib.aio.client import TAsyncClient
+from thriftpy2.contrib.aio.socket import TAsyncSocket
+from thriftpy2.protocol.multiplex import TMultiplexedProtocol
+from thriftpy2.thrift import TApplicationException
+from thriftpy2.transport import TTransportException
+from loguru import logger
+from .connection_pool import MAX_CONNECTIONS_PER_ADDRESS, MAX_IDLE_PER_ADDRESS, IDLE_TIMEOUT, SOCKET_TIMEOUT
+from .connection_pool import BROKEN_CONNECTION_ERRORS
+from .wire import WireFormat, get_wire_format
+
+# 协程客户端额外可能遇到的连接断开与超时异常
+AIO_BROKEN_CONNECTION_ERRORS = BROKEN_CONNECTION_ERRORS + (asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+
+class AioPooledConnection:
+    """
+    协程连接池中的一条 Thrift 连接
+    """
+
+    def __init__(self, sock: TAsyncSocket, service, protocol):
+        self.sock = sock  # 底层 socket，打开后持有 asyncio 的 reader/writer
+        self.service = service
+        self.protocol = protocol
+        self.client = TAsyncClient(service, protocol)
+        self._vnode_clients = {}  # 虚拟节点 ID -> 在这条连接上按虚拟节点寻址的客户端
+        self.last_used = time.monotonic()  # 最近一次归还的时间
+        self.reused = False  # 是否从空闲连接中取出
+
+    @classmethod
+    async def open(cls, service, address, port, timeout=SOCKET_TIMEOUT, wire: WireFormat = None):
+        """建立连接，wire 为这条连接的协议与传输层，默认按地址取 get_wire_format"""
+        sock = TAsyncSocket(address, port, socket_timeout=timeout)
+        wire = wire or get_wire_format(address, port)
+        transport = wire.transport_factory(aio=True).get_transport(sock)
+        protocol = wire.protocol_factory(aio=True).get_protocol(transport)
+        await transport.open()  # 建立 TCP 连接，失败时抛出 TTransportException
+        return cls(sock, service, protocol)
+
+    def client_for(self, vnode=None):
+        """返回调用指定虚拟节点的客户端，见 PooledConnection.client_for"""
+        if vnode is None:
+            return self.client
+        client = self._vnode_clients.get(vnode)
+        if client is None:
+            protocol = TMultiplexedProtocol(self.protocol, str(vnode))
+            client = self._vnode_clients[vnode] = TAsyncClient(self.service, protocol)
+        return client
+
+    def is_healthy(self):
+        """检查空闲连接是否可用：对端关闭连接后 reader 会收到 EOF"""
+        if self.sock.raw_sock is None:
+            return False
+        return not self.sock.reader.at_eof() and not self.sock.writer.is_closing()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class AioConnectionPool:
+    """
+    事件循环内的 Thrift 连接池，按 (address, port) 复用连接。
+    只在创建它的事件循环中使用，不需要线程锁
+    """
+
+    def __init__(self, service, max_connections=MAX_CONNECTIONS_PER_ADDRESS, max_idle=MAX_IDLE_PER_ADDRESS,
+                 idle_timeout=IDLE_TIMEOUT, timeout=SOCKET_TIMEOUT):
+        self.service = service
+        self.max_connections = max_connections
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._released = asyncio.Condition()  # 有连接归还时通知等待者
+        self._idle = {}  # (address, port) -> 空闲连接列表，末尾为最近归还的连接
+        self._in_use = {}  # (address, port) -> 正在使用的连接数
+        self._next_sweep = time.monotonic() + idle_timeout  # 下一次清理所有地址空闲连接的时刻
+
+    async def acquire(self, address, port):
+        """取出一条可用连接，没有空闲连接时新建；连接失败抛出 TTransportException"""
+        key = (address, port)
+        deadline = time.monotonic() + self.timeout / 1000
+        while True:
+            self._evict_idle()
+            idle = self._idle.get(key)
+            while idle:
+                conn = idle.pop()
+                if conn.is_healthy() and time.monotonic() - conn.last_used < self.idle_timeout:
+                    conn.reused = True
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    return conn
+                conn.close()
+            if self._in_use.get(key, 0) < self.max_connections:
+                self._in_use[key] = self._in_use.get(key, 0) + 1
+                break
+            # 达到连接数上限，等待其他协程归还连接
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TTransportException(type=TTransportException.TIMED_OUT,
+                                          message=f"connection pool exhausted for {address}:{port}")
+            async with self._released:
+                try:
+                    await asyncio.wait_for(self._released.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+        try:
+            return await AioPooledConnection.open(self.service, address, port, self.timeout)
+        except Exception:
+            await self._release_slot(key)
+            raise
+
+    async def release(self, address, port, conn, broken=False):
+        """归还连接；broken 为 True 或空闲连接已满时直接关闭"""
+        key = (address, port)
+        idle = self._idle.setdefault(key, [])
+        if broken or len(idle) >= self.max_idle:
+            conn.close()
+        else:
+            conn.last_used = time.monotonic()
+            idle.append(conn)
+        self._evict_idle()
+        await self._release_slot(key)
+
+    async def _release_slot(self, key):
+        self._in_use[key] -= 1
+        async with self._released:
+            self._released.notify()
+
+    def _evict_idle(self):
+        """
+        关闭所有地址上超过 idle_timeout 未使用的空闲连接。
+        不再访问的对端的空闲连接也要关闭，否则一直占用文件描述符；每 idle_timeout 的一半最多清理一次
+        """
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.idle_timeout / 2
+        for key, idle in list(self._idle.items()):
+            alive = [conn for conn in idle if now - conn.last_used < self.idle_timeout]
+            for conn in idle:
+                if now - conn.last_used >= self.idle_timeout:
+                    conn.close()
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+
+    def has_idle(self, address, port) -> bool:
+        """最近归还的空闲连接是否仍可用，只检查而不检出"""
+        idle = self._idle.get((address, port))
+        return bool(idle) and idle[-1].is_healthy() and time.monotonic() - idle[-1].last_used < self.idle_timeout
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+
+class AioPooledClient:
+    """
+    绑定到某个地址的协程客户端代理，每次 RPC 从连接池借出连接，调用结束后归还；
+    复用的连接已被对端关闭时自动重连一次
+    """
+
+    def __init__(self, pool: AioConnectionPool, address, port, vnode=None):
+        self._pool = pool
+        self.address = address
+        self.port = port
+        self.vnode = vnode
+
+    def __getattr__(self, api):
+        if api not in self._pool.service.thrift_services:
+            raise AttributeError(f"{self.__class__.__name__} instance has no attribute '{api}'")
+
+        async def call(*args, **kwargs):
+            return await self._call(api, *args, **kwargs)
+
+        return call
+
+    async def _call(self, api, *args, **kwargs):
+        for attempt in range(2):
+            conn = await self._pool.acquire(self.address, self.port)
+            try:
+                result = await getattr(conn.client_for(self.vnode), api)(*args, **kwargs)
+            except TApplicationException:
+                # 服务端抛出的应用异常，连接本身仍然可用
+                await self._pool.release(self.address, self.port, conn)
+                raise
+            except AIO_BROKEN_CONNECTION_ERRORS as e:
+                await self._pool.release(self.address, self.port, conn, broken=True)
+                # 超时说明请求可能已被处理，不重试
+                timed_out = isinstance(e, asyncio.TimeoutError) or \
+                    (isinstance(e, TTransportException) and e.type == TTransportException.TIMED_OUT)
+                if attempt == 0 and conn.reused and not timed_out:
+                    logger.debug(f'reconnecting to {self.address}:{self.port} after {e!r}')
+                    continue
+                raise
+            except BaseException:
+                # 包括协程被取消的情况，连接上可能残留未读取的响应，不能再复用
+                await asyncio.shield(self._pool.release(self.address, self.port, conn, broken=True))
+                raise
+            await self._pool.release(self.address, self.port, conn)
+            return result
+
+
+_pools = {}
+
+
+def get_aio_pool(service) -> AioConnectionPool:
+    """获取当前事件循环中指定 Thrift 服务的连接池"""
+    key = (service, asyncio.get_running_loop())
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = AioConnectionPool(service)
+    return pool
+
+
+async def connect_aio(service, address, port, vnode=None):
+    """
+    获取指向指定地址（及其上的虚拟节点）的协程客户端代理，对端不在线时返回 None；
+    与 connect 相同，已有可用的空闲连接时不再检出连接探测
+    """
+    pool = get_aio_pool(service)
+    if pool.has_idle(address, port):
+        return AioPooledClient(pool, address, port, vnode)
+    try:
+        conn = await pool.acquire(address, port)
+    except Exception as e:
+        logger.warning(e)  # 记录警告信息
+        logger.warning(traceback.format_exc())  # 记录异常堆栈信息
+        return None
+    await pool.release(address, port, conn)
+    return AioPooledClient(pool, address, port, vnode)
@@ -1,12 +1,26 @@
+import functools
 import hashlib
 import thriftpy2
 import os
 import threading
+import time
 import traceback
-from thriftpy2.rpc import make_client
-from .struct_class import KeyValueResult, Node, M
+from collections import Counter
+from .transport import get_transport
+from .schedule import MaintenanceSchedule
+from .timer_wheel import get_timer_wheel
+from .compression import choose_codec, decode_items, enabled_codecs, encode_items, negotiate_codec
+from .merkle import bucket_arcs, buckets_in_arc, diff_buckets
+from .metrics import HOP_BUCKETS, InstrumentedClient, Metrics, get_rpc_metrics
+from .struct_class import KeyRange, KeyValueResult, KVStatus, LeaveReport, Node, NodeStats, RouteResult, ScanPage, TraceContext, M
+from .tracing import Span, new_trace
 from loguru import logger
 
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，没有时批量接口退化为列表
+    np = None
+
 # 获取当前文件的目录
 current_dir = os.path.dirname(os.path.abspath(__file__))
 # 构造 Thrift IDL 文件的路径
@@ -14,23 +28,50 @@ thrift_path = os.path.join(current_dir, '../idl/chord.thrift')
 # 加载 Thrift 文件，生成对应的 Python 模块
 chord_thrift = thriftpy2.load(thrift_path, module_name='chord_thrift')
 
+# 维护任务：方法名 -> (最短间隔, 最长间隔) 秒，同时到期的任务按此顺序执行。
+# 一轮没有发现变化时间隔加倍直到最长间隔，前驱、后继或后继列表变化后所有任务回到最短间隔
+MAINTENANCE_TASKS = {
+    '_stabilize': (0.5, 4.0),
+    '_fix_fingers': (0.5, 16.0),
+    '_check_predecessor': (0.5, 4.0),
+    'update_data': (1.0, 16.0),
+    '_log_self': (1.0, 1.0),
+}
+MAINTENANCE_BACKOFF = 2.0  # 退避倍数
+MAINTENANCE_JITTER = 0.1  # 每次等待的随机抖动比例
+
 
 class BaseChordNode:
     """
     Chord 节点的基本接口
     """
 
+    maintenance_tasks = MAINTENANCE_TASKS
+
     def __init__(self):
         self.logger = logger  # 日志记录器
-        self._interval = 1  # 定时器间隔
-        self.__timer = threading.Timer(self._interval, self.run_periodically)  # 创建定时器
-        self.__timer.start()  # 启动定时器
         self.predecessor = None  # 前驱节点初始化为 None
         self.successor = None  # 后继节点初始化为 None
+        self.successor_list = []  # 后继列表：[后继, 后继的后继, ...]，最多 SUCCESSOR_LIST_SIZE 项，稳定化时刷新
+        self._handed_off = None  # (原前驱 ID, 新前驱)：最近一次 notify 改归新前驱的区间，见 _handed_off_to
         self.node_id = 0  # id初始化为0
+        self.vnode_index = 0  # 在所在服务端上是第几个虚拟节点，见 vnode_id
+        self.siblings = []  # 同一服务端上的其他虚拟节点，见 virtual_nodes.colocate
+        self._unjoined_siblings = []  # 尚未加入环的其他虚拟节点，由第 0 个虚拟节点带领加入
+        self._lock = threading.RLock()  # 保护前驱、后继等环指针的读改写，持锁期间不发起 RPC
+        self._clock = time.monotonic  # 维护任务调度使用的时钟，模拟器中替换为虚拟时钟
+        self._ring_seen = None  # 上一次检查时的环指针，见 _check_ring_changed
+        self._maintenance_running = False  # 正在执行维护任务
+        self._maintenance_stopped = False  # 节点离开后不再安排维护任务
+        self.__timer = None  # 进程级时间轮上的定时句柄
+        self.metrics = Metrics()  # 本节点的请求、路由与维护任务指标，通过 get_stats 获取
+        self.replica_kv_stores = {}  # 前面第 2..N-1 个节点的副本：距离 -> KVStore，距离 1 即 predecessor_kv_store
+        self.configure_maintenance()
+        self.configure_replication()
+        self._start_periodic_tasks()  # 启动定时任务
 
-    def lookup(self, key: str) -> KeyValueResult:
-        """查找给定键的值，未实现的抽象方法"""
+    def lookup(self, key: str, trace: TraceContext = None) -> KeyValueResult:
+        """查找给定键的值，trace 不为 None 时在结果中返回经过的路径，未实现的抽象方法"""
         raise NotImplementedError
 
     def _lookup_local(self, key: str) -> KeyValueResult:
@@ -38,21 +79,222 @@ class BaseChordNode:
         raise NotImplementedError
 
     def find_successor(self, key_id: int) -> Node:
-        """查找给定键 ID 的后继节点，未实现的抽象方法"""
+        """查找给定键 ID 的后继节点"""
+        return self._find_successor(key_id, None)
+
+    def trace_find_successor(self, key_id: int, trace: TraceContext) -> RouteResult:
+        """带追踪的 find_successor，返回找到的节点以及经过的路径"""
+        span = Span(self.node_id, trace or new_trace())
+        node = self._find_successor(key_id, span)
+        return RouteResult(node, span.finish())
+
+    def _find_successor(self, key_id: int, span: Span) -> Node:
+        """查找给定键 ID 的后继节点，span 不为 None 时记录追踪，未实现的抽象方法"""
         raise NotImplementedError
 
+    def _forward_find_successor(self, client, key_id: int, span: Span) -> Node:
+        """把 find_successor 转发给下一跳，追踪时改用 trace_find_successor 取回下一跳之后的路径"""
+        if span is None:
+            return client.find_successor(key_id)
+        return self._call_traced(span, client, 'trace_find_successor', key_id).node
+
     def _closet_preceding_node(self, key_id: int) -> Node:
         """查找给定键 ID 的最近前驱节点，未实现的抽象方法"""
         raise NotImplementedError
 
-    def put(self, key: str, value: str) -> KeyValueResult:
-        """存储键值对，未实现的抽象方法"""
+    def put(self, key: str, value: str, trace: TraceContext = None) -> KeyValueResult:
+        """存储键值对，trace 不为 None 时在结果中返回经过的路径，未实现的抽象方法"""
         raise NotImplementedError
 
     def do_put(self, key: str, value: str, place: str) -> KeyValueResult:
         """存储键值对，未实现的抽象方法"""
         raise NotImplementedError
 
+    def _group_by_owner(self, keys):
+        """
+        按归属对键分组：返回本节点负责的键，以及按下一跳节点分组的其余键
+        下一跳分组的键为 (address, port)，值为 (下一跳节点, 键列表)
+        """
+        local_keys, forward = [], {}
+        for key in keys:
+            h = hash_func(key)
+            if is_between(Node(h, "", 0), self.predecessor, self.self_node):
+                local_keys.append(key)
+            else:
+                next_node = self._next_hop_to_owner(h)
+                forward.setdefault((next_node.address, next_node.port), (next_node, []))[1].append(key)
+        return local_keys, forward.values()
+
+    def multi_lookup(self, keys: list) -> list:
+        """批量查找，每个下一跳只转发一次"""
+        local_keys, forward = self._group_by_owner(keys)
+        results = self._read_replicas(local_keys, [self._lookup_local(key) for key in local_keys])
+        self._served_locally('lookup', len(results))
+        for next_node, sub_keys in forward:
+            results.extend(self._forwarded('lookup', connect_node(next_node).multi_lookup(sub_keys)))
+        return results
+
+    def multi_put(self, kvs: dict) -> list:
+        """批量存储，本节点负责的键写入本地并批量复制到后面的 N-1 个节点，其余键按下一跳分批转发"""
+        local_keys, forward = self._group_by_owner(kvs.keys())
+        local_kvs = {key: kvs[key] for key in local_keys}
+        results = self.multi_do_put(local_kvs, "self")
+        self._served_locally('put', len(results))
+        if local_kvs and not self._replicate('multi_do_put', (local_kvs,), f'{len(local_kvs)} keys'):
+            for result in results:
+                result.status = KVStatus.UNAVAILABLE
+        for next_node, sub_keys in forward:
+            results.extend(self._forwarded('put', connect_node(next_node).multi_put({key: kvs[key] for key in sub_keys})))
+        return results
+
+    def multi_do_put(self, kvs: dict, place: str) -> list:
+        """在本节点的指定存储区批量存储键值对，整批写入后只等待一次落盘"""
+        store = self._get_store(place)
+        store.update(kvs)
+        store.commit()
+        return [KeyValueResult(key, value, self.node_id) for key, value in kvs.items()]
+
+    def do_lookup(self, key: str, place: str) -> KeyValueResult:
+        """在本节点的指定存储区查找键，归属节点按读法定数读取副本时调用"""
+        value = self._get_store(place).get(key, None)
+        return KeyValueResult(key, value, self.node_id, KVStatus.VALID if value is not None else KVStatus.NOT_FOUND)
+
+    def multi_do_lookup(self, keys: list, place: str) -> list:
+        """在本节点的指定存储区批量查找"""
+        return [self.do_lookup(key, place) for key in keys]
+
+    def _replica_targets(self) -> list:
+        """
+        保存本节点数据副本的节点：沿后继列表取本节点之后的 N-1 个节点，返回 [(节点, 该节点上的存储区), ...]，
+        第 k 个后继把本节点的数据存入其 replica_place(k) 存储区。环中节点不足 N 个时只有现有的其他节点
+        """
+        targets, seen = [], {self.node_id}
+        for node in [self.successor] + self.successor_list:
+            if len(targets) >= self.replicas - 1:
+                break
+            if node is None or node.node_id in seen:
+                continue
+            seen.add(node.node_id)
+            targets.append((node, replica_place(len(targets) + 1)))
+        return targets
+
+    def _replica_store(self, place: str):
+        """replica_place(k) 存储区：前面第 k 个节点的副本，k 大于 1 的存储区在首次写入或同步时创建"""
+        distance = replica_distance(place)
+        if distance == 1:
+            return self.predecessor_kv_store
+        with self._lock:
+            store = self.replica_kv_stores.get(distance)
+            if store is None:
+                store = self.replica_kv_stores[distance] = self._open_store(place)
+        return store
+
+    def _replicate(self, api: str, args: tuple, desc: str) -> bool:
+        """
+        并发地把本地写入复制到后面的 N-1 个节点，api 为写入副本的 RPC，args 为除存储区以外的参数，desc 用于日志描述写入的内容。
+        本地的一份计入写法定数，凑齐 W 份即返回，其余副本在后台继续写入；确认不足 W 份时返回 False
+        """
+        targets = self._replica_targets()
+
+        def replicate_to(replica, place):
+            try:
+                client = connect_node(replica)
+                if client is None:
+                    raise ConnectionError('node is unreachable')
+                return getattr(client, api)(*args, place)
+            except Exception as e:
+                self.logger.warning(f"Failed to store {desc} in {place} replica {replica.node_id}: {e}")
+                return None
+
+        needed = min(self.write_quorum, len(targets) + 1) - 1
+        acks = call_quorum([functools.partial(replicate_to, replica, place) for replica, place in targets], needed)
+        return self._quorum_reached('put', len(acks), needed)
+
+    def _read_replicas(self, keys: list, local: list) -> list:
+        """
+        R 大于 1 时并发读取后面节点上 keys 的副本，只等最快应答的 R-1 个，与本地的结果 local 逐键合并；
+        R 为 1 时直接返回 local
+        """
+        if self.read_quorum <= 1 or not keys:
+            return local
+        targets = self._replica_targets()
+
+        def read_from(replica, place):
+            try:
+                client = connect_node(replica)
+                if client is None:
+                    raise ConnectionError('node is unreachable')
+                if len(keys) == 1:
+                    return [client.do_lookup(keys[0], place)]
+                return client.multi_do_lookup(keys, place)
+            except Exception as e:
+                self.logger.warning(f"Failed to read {len(keys)} keys from {place} replica {replica.node_id}: {e}")
+                return None
+
+        needed = min(self.read_quorum, len(targets) + 1) - 1
+        replies = call_quorum([functools.partial(read_from, replica, place) for replica, place in targets], needed)
+        return self._merge_reads(local, replies, needed)
+
+    def _merge_reads(self, local: list, replies: list, needed: int) -> list:
+        """按 resolve_reads 逐键合并本地与各副本的结果，应答的副本不足 needed 个时结果标记为 UNAVAILABLE"""
+        results = [resolve_reads([result] + [reply[i] for reply in replies]) for i, result in enumerate(local)]
+        if not self._quorum_reached('lookup', len(replies), needed):
+            for result in results:
+                result.status = KVStatus.UNAVAILABLE
+        return results
+
+    def _quorum_reached(self, op: str, acks: int, needed: int) -> bool:
+        """副本的应答是否达到法定数（不含本地的一份），未达到时记录下来"""
+        if acks >= needed:
+            return True
+        self.logger.warning(f"{op} quorum not reached on node {self.node_id}: {acks + 1} of {needed + 1} copies answered")
+        self.metrics.inc('quorum_failures_total', op=op)
+        return False
+
+    def _begin_span(self, trace: TraceContext):
+        """trace 不为 None 时开始记录本节点处理这次路由请求的过程"""
+        return Span(self.node_id, trace) if trace is not None else None
+
+    def _end_span(self, span: Span, result):
+        """把本节点这一跳加在下一跳返回的路径前面，写入返回给上一跳的结果"""
+        if span is not None:
+            result.trace = span.finish()
+        return result
+
+    def _finger_index(self, client) -> int:
+        """client 连接的下一跳在 finger table 中的最高下标，不是 finger（后继列表中的节点、刚改归的新前驱）时为 -1"""
+        fingers = getattr(self, 'finger_table', ())
+        for i in range(len(fingers) - 1, -1, -1):
+            finger = fingers[i][1]
+            if finger is not None and finger.address == client.address and finger.port == client.port:
+                return i
+        return -1
+
+    def _call_traced(self, span: Span, client, api: str, *args):
+        """调用下一跳的 api；span 不为 None 时附上追踪上下文，并记录等待下一跳的时间与它返回的路径"""
+        if span is None:
+            return getattr(client, api)(*args)
+        result = getattr(client, api)(*args, span.forward(self._finger_index(client)))
+        span.returned(result.trace)
+        return result
+
+    def _served_locally(self, op: str, count=1):
+        """记录本节点作为归属节点直接回答的 count 个 lookup/put 请求"""
+        if count:
+            self.metrics.inc('requests_total', count, op=op, served='local')
+            self.metrics.observe('route_hops', 0, HOP_BUCKETS, count, op=op)
+
+    def _forwarded(self, op: str, results):
+        """
+        记录本节点转发给下一跳的 lookup/put 请求：results 为下一跳返回的结果（单个或列表），
+        跳数加一后原样返回。route_hops 是从本节点到归属节点的跳数，多跳的请求在路径上的每个节点各记录一次
+        """
+        for result in results if isinstance(results, list) else (results,):
+            result.hops = (result.hops or 0) + 1
+            self.metrics.observe('route_hops', result.hops, HOP_BUCKETS, op=op)
+        self.metrics.inc('requests_total', len(results) if isinstance(results, list) else 1, op=op, served='forwarded')
+        return results
+
     def join(self, node: Node):
         """加入给定节点，未实现的抽象方法"""
         raise NotImplementedError
@@ -81,6 +323,132 @@ class BaseChordNode:
         """获取当前节点的后继节点"""
         return self.successor
 
+    def get_successor_list(self) -> list:
+        """获取当前节点的后继列表"""
+        return self.successor_list or [self.successor]
+
+    def _merge_successor_list(self, entries: list):
+        """
+        以当前后继开头、接上后继返回的后继列表，直到覆盖 SUCCESSOR_LIST_SIZE 个不同的服务端：
+        同一服务端上的虚拟节点会一起失效，只按项数截断时列表可能全部落在一台服务端上。
+        遇到本节点即停止，小环中绕回来的项是过时的，继续接下去会让失效节点在各节点的列表之间循环传递
+        """
+        successors = [self.successor]
+        endpoints = {(self.successor.address, self.successor.port)}
+        for node in entries:
+            if len(endpoints) >= SUCCESSOR_LIST_SIZE or node.node_id == self.node_id:
+                break
+            if all(node.node_id != s.node_id for s in successors):
+                successors.append(node)
+                endpoints.add((node.address, node.port))
+        self.successor_list = successors
+
+    def _accept_predecessor(self, node: Node):
+        """
+        notify 接受了更近的前驱，调用方持有 _lock。
+        (原前驱, 新前驱] 改归新前驱，而原前驱在下一轮稳定化之前仍把这段区间的请求转给本节点
+        """
+        predecessor = self.predecessor
+        # 原前驱是本节点自己（环中只有一个节点）时交出的是环上其余全部区间，之后会被更多节点细分，不能再往回交
+        handed_off = predecessor.valid and predecessor.node_id != self.node_id
+        self._handed_off = (predecessor.node_id, node) if handed_off else None
+        self.predecessor = node
+        self._membership_changed()
+
+    def _handed_off_to(self, key_id: int):
+        """key_id 位于最近改归新前驱的区间时返回该前驱，否则返回 None"""
+        handed_off = self._handed_off
+        if handed_off is not None and is_between(Node(key_id, "", 0), Node(handed_off[0], "", 0), handed_off[1]):
+            return handed_off[1]
+        return None
+
+    def _next_hop_to_owner(self, key_id: int) -> Node:
+        """
+        lookup/put 按归属节点转发的下一跳。本节点只会从尚未稳定化的原前驱处收到刚改归新前驱的区间的请求，
+        按指针继续路由会绕环回到原前驱形成环路，这段区间往回交给新前驱，由它在本地回答。
+        find_successor 不能这样往回走：它在键位于本节点与后继之间的节点结束，每一跳都必须逼近 key_id
+        """
+        return self._handed_off_to(key_id) or self._closet_preceding_node(key_id)
+
+    def _set_successor(self, successor: Node):
+        """
+        切换后继并相应调整后继列表：新后继在列表中时（原后继失效或离开）丢弃排在它前面的项，
+        不在列表中时（稳定化发现了更近的节点）原列表整体后移，调用方持有 _lock
+        """
+        ids = [node.node_id for node in self.successor_list]
+        rest = self.successor_list[ids.index(successor.node_id) + 1:] if successor.node_id in ids else self.successor_list
+        self.successor = successor
+        self._merge_successor_list(rest)
+
+    def _refresh_successor_list(self, successor_client):
+        """稳定化时从后继拉取其后继列表"""
+        entries = successor_client.get_successor_list()
+        with self._lock:
+            self._merge_successor_list(entries)
+
+    def _next_alive_successor(self):
+        """
+        按后继列表顺序返回第一个可连接的后继（跳过当前后继），都不可连接时返回 None。
+        不可连接的服务端上的其他虚拟节点（包括当前后继所在的服务端）不再逐个尝试
+        """
+        dead = {(self.successor.address, self.successor.port)}
+        for node in self.successor_list:
+            if node.node_id == self.successor.node_id or (node.address, node.port) in dead:
+                continue
+            if connect_node(node):
+                return node
+            dead.add((node.address, node.port))
+        return None
+
+    def _skipped_failed_successors(self, new_successor: Node) -> bool:
+        """
+        后继失效后切换到 new_successor 时，是否还越过了后继列表中其他失效的节点（如同一服务端上的多个虚拟节点一起失效）。
+        新后继的前驱副本只覆盖紧挨着它的那个失效节点，更前面的失效节点的数据只在本节点的后继副本中
+        """
+        following = self.successor_list[1] if len(self.successor_list) > 1 else None
+        return new_successor.node_id != self.node_id and (following is None or following.node_id != new_successor.node_id)
+
+    def _failed_before(self, new_successor: Node) -> int:
+        """
+        后继失效后切换到 new_successor 时越过的失效节点数，即它在后继列表中的位置；不在列表中时返回 0。
+        新后继的第 k 个前驱副本（k 不超过这个数）保存的都是失效节点的数据
+        """
+        for index, node in enumerate(self.successor_list):
+            if node.node_id == new_successor.node_id:
+                return index
+        return 0
+
+    def _join_siblings(self):
+        """
+        第 0 个虚拟节点所在的环中有了其他服务端的节点之后（本节点加入环，或其他节点经由本节点加入），
+        同一服务端上的其余虚拟节点经由它依次加入；只有一台服务端时只有第 0 个虚拟节点在环中
+        """
+        with self._lock:
+            if not self._unjoined_siblings or self.successor is None or self.successor.node_id == self.node_id:
+                return
+            siblings, self._unjoined_siblings = self._unjoined_siblings, []
+        for sibling in siblings:
+            sibling.join(self.self_node)
+            # 立即稳定化一次让后继接受它为前驱：依次加入的虚拟节点常落在同一段区间，
+            # 否则它们都以同一个节点为后继，要经过多轮周期性的稳定化才能理顺
+            sibling._stabilize()
+
+    def _leave_with_siblings(self) -> LeaveReport:
+        """第 0 个虚拟节点离开时，同一服务端上已经加入环的其他虚拟节点随后依次离开，返回合计的移交报告"""
+        report = self._graceful_leave()
+        if self.vnode_index != 0:
+            return report
+        for sibling in self.siblings:
+            if sibling in self._unjoined_siblings:
+                continue
+            sibling_report = sibling._graceful_leave()
+            report.keys += sibling_report.keys
+            report.bytes += sibling_report.bytes
+            report.chunks += sibling_report.chunks
+            report.duration += sibling_report.duration
+            report.complete = report.complete and sibling_report.complete
+        return report
+
     def get_id(self) -> int:
         """获取当前节点的后继节点"""
         return self.node_id
@@ -92,24 +460,135 @@ class BaseChordNode:
     def is_successor_alive(self):
         raise NotImplementedError
 
+    def configure_maintenance(self, tasks: dict = None, rng=None):
+        """按 {任务方法名: (最短间隔, 最长间隔)} 重新设置维护任务的调度，默认使用 maintenance_tasks"""
+        self._maintenance = MaintenanceSchedule(self.maintenance_tasks if tasks is None else tasks,
+                                                MAINTENANCE_BACKOFF, MAINTENANCE_JITTER, rng)
+
+    def configure_replication(self, replicas=None, write_quorum=None, read_quorum=None):
+        """
+        设置复制因子 N（归属节点及其后 N-1 个后继各存一份）、写法定数 W 与读法定数 R，两个法定数都计入归属节点本地的一份；
+        未给出的参数使用 REPLICATION_FACTOR、WRITE_QUORUM 与 READ_QUORUM
+        """
+        replicas = REPLICATION_FACTOR if replicas is None else replicas
+        write_quorum = WRITE_QUORUM if write_quorum is None else write_quorum
+        read_quorum = READ_QUORUM if read_quorum is None else read_quorum
+        check_replication(replicas, write_quorum, read_quorum)
+        self.replicas, self.write_quorum, self.read_quorum = replicas, write_quorum, read_quorum
+
+    def _start_periodic_tasks(self):
+        """在进程级时间轮上安排周期任务，同一进程中的节点共用时间轮的工作线程；协程实现中改为事件循环里的任务"""
+        self._maintenance.start(self._clock())
+        self._arm_timer()
+
+    def _stop_periodic_tasks(self):
+        """取消尚未执行的维护任务，节点离开环时调用"""
+        with self._lock:
+            self._maintenance_stopped = True
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+    def _arm_timer(self):
+        """按最早到期的维护任务重新设置定时"""
+        with self._lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            next_due = self._maintenance.next_due()
+            if next_due is None or self._maintenance_stopped:
+                return
+            self.__timer = get_timer_wheel().schedule(max(next_due - self._clock(), 0.0), self.run_periodically)
+
     def run_periodically(self):
         """定期运行的任务"""
+        if self._maintenance_stopped:
+            return  # 取消之前已经交给工作线程
+        self._run_periodic_tasks()
+        self._arm_timer()  # 重新设置定时器
+
+    def _run_periodic_tasks(self):
+        """执行已到期的维护任务，异常只记录不抛出；返回下一个任务到期的时刻"""
+        with self._lock:
+            if self._maintenance_running:
+                return self._maintenance.next_due()  # 提前唤醒的定时器与正在执行的一轮重叠
+            self._maintenance_running = True
         try:
-            self._stabilize()  # 稳定性检查
-            self._fix_fingers()  # 修复指针
-            self._check_predecessor()  # 检查前驱节点
-            self.update_data()  # 更新数据
-            # self.update_successor_kv_store() # 维护successor_kv_store
-            # self.update_predecessor_kv_store() # 维护predecessor_kv_store
-            self._log_self()  # 记录当前节点信息
+            for name in self._due_tasks():
+                before = self._maintenance_state(name)
+                started = time.perf_counter()
+                try:
+                    getattr(self, name)()
+                except Exception as e:
+                    self._task_failed(name, e)
+                    continue
+                finally:
+                    self.metrics.observe('maintenance_seconds', time.perf_counter() - started, task=name.lstrip('_'))
+                self._task_done(name, self._maintenance_state(name) != before)
+        finally:
+            self._maintenance_running = False
+        return self._maintenance.next_due()
 
-        except Exception as e:
-            self.logger.warning(e)  # 记录警告信息
-            self.logger.warning(traceback.format_exc())  # 记录异常堆栈信息
+    def _due_tasks(self) -> list:
+        """返回到期的维护任务；环指针在上一轮之后被 RPC 改变过时，所有任务先回到最短间隔"""
+        with self._lock:
+            now = self._clock()
+            self._check_ring_changed(now)
+            return self._maintenance.due(now)
+
+    def _task_done(self, name, changed: bool):
+        with self._lock:
+            now = self._clock()
+            self._maintenance.record(name, changed, now)
+            self._check_ring_changed(now)
+
+    def _task_failed(self, name, error: Exception):
+        """实现没有提供的任务从调度中移除，其余出错的任务按最短间隔重试"""
+        with self._lock:
+            if isinstance(error, NotImplementedError):
+                self._maintenance.remove(name)
+                return
+            self._maintenance.record(name, True, self._clock())
+        self.logger.warning(error)  # 记录警告信息
+        self.logger.warning(traceback.format_exc())  # 记录异常堆栈信息
+
+    def _ring_signature(self):
+        """前驱、后继与后继列表，任一变化都视为邻居发生了变动"""
+        predecessor, successor = self.predecessor, self.successor
+        return (predecessor and (predecessor.node_id, predecessor.valid), successor and successor.node_id,
+                [node.node_id for node in self.successor_list])
+
+    def _maintenance_state(self, name):
+        """判断一轮任务是否发现变化时比较的状态：修复 finger 比较 finger table，其余任务比较环指针"""
+        if name == '_fix_fingers':
+            return [None if finger is None else finger.node_id for _, finger in getattr(self, 'finger_table', ())]
+        return self._ring_signature()
+
+    def _check_ring_changed(self, now):
+        """调用方持有 _lock"""
+        signature = self._ring_signature()
+        if signature != self._ring_seen:
+            self._ring_seen = signature
+            self._maintenance.reset(now)
+
+    def _membership_changed(self, suspected=False):
+        """
+        RPC 改变了环指针（新前驱通知、邻居离开），或 suspected 为 True 时转发请求发现后继不可达：
+        所有任务回到最短间隔，正在退避等待的定时器提前唤醒。维护任务自身引起的变化在本轮结束时处理
+        """
+        with self._lock:
+            now = self._clock()
+            if suspected:
+                self._maintenance.reset(now)
+            else:
+                self._check_ring_changed(now)
+            if self._maintenance_running:
+                return
+        self._wake_maintenance()
 
-        # 重新设置定时器
-        self.__timer = threading.Timer(self._interval, self.run_periodically)
-        self.__timer.start()  # 启动下一个定时任务
+    def _wake_maintenance(self):
+        """维护任务的调度提前时重新设置计时，协程实现与模拟器各自覆盖"""
+        self._arm_timer()
 
     def migrate_data(self):
         raise NotImplementedError
@@ -117,7 +596,285 @@ class BaseChordNode:
     def check_and_clean_data(self):
         raise NotImplementedError
 
+    def _get_store(self, place: str):
+        """返回指定存储区（self/predecessor/successor/predecessor<k>）对应的本地存储"""
+        raise NotImplementedError
+
+    def _open_store(self, place: str):
+        """在本节点的存储后端中打开指定存储区，未实现的抽象方法"""
+        raise NotImplementedError
+
+    def _record_sync(self, sync_key: str, data: dict, deletes=()):
+        """记录一次副本同步从对端拉取的键数与字节数，sync_key 标识同步的本地存储区"""
+        data, deletes = data or {}, deletes or ()
+        sync_key = sync_key.partition(':')[0]  # run:<节点ID> 按存储区类别汇总
+        self.metrics.inc('sync_keys_total', len(data) + len(deletes), store=sync_key)
+        self.metrics.inc('sync_bytes_total', _chunk_bytes(data, deletes), store=sync_key)
+
+    def collect_stats(self) -> NodeStats:
+        """
+        本节点的指标快照：存储区大小、后继列表长度与各维护任务当前的间隔在此刻读取，
+        RPC 耗时来自进程级的客户端统计，见 get_rpc_metrics
+        """
+        for place in ("self", "predecessor", "successor"):
+            self.metrics.set('store_keys', len(self._get_store(place)), place=place)
+        for distance, store in list(self.replica_kv_stores.items()):
+            self.metrics.set('store_keys', len(store), place=replica_place(distance))
+        self.metrics.set('successor_list_size', len(self.successor_list))
+        for name, task in list(self._maintenance.tasks.items()):
+            self.metrics.set('maintenance_interval_seconds', task.interval, task=name.lstrip('_'))
+        return self.metrics.snapshot(self.node_id, get_rpc_metrics())
+
+    def get_stats(self) -> NodeStats:
+        """获取本节点的指标"""
+        return self.collect_stats()
+
     def get_all_data(self, place: str):
+        """返回指定存储区全部数据的副本，整个存储区在一条消息中，数据量大时应使用 scan 分页"""
+        return self._get_store(place).snapshot()
+
+    def scan(self, place: str, cursor: str, limit: int, start_id=None, end_id=None, codecs=None):
+        """
+        分页返回指定存储区中环上 ID 位于 (start_id, end_id] 的键值对，不给出区间时为整个存储区；
+        cursor 为上一页返回的游标，空串表示第一页。limit 不大于 0 时按 TRANSFER_CHUNK_SIZE，且不超过 MAX_SCAN_LIMIT。
+        codecs 为调用方能解压的算法，按其优先顺序选出本节点也启用的一个压缩本页，见 compression.encode_items
+        """
+        limit = min(limit, MAX_SCAN_LIMIT) if limit and limit > 0 else TRANSFER_CHUNK_SIZE
+        return make_scan_page(*self._get_store(place).scan(cursor, limit, start_id, end_id), codecs)
+
+    def get_codecs(self) -> list:
+        """本节点能解压的算法，邻居向本节点推送数据前据此协商"""
+        return enabled_codecs()
+
+    def get_changes_since(self, place: str, seq: int, epoch: str):
+        """获取指定存储区在序号 seq 之后的变更，无法增量回答时返回 resync 标记"""
+        return self._get_store(place).changes_since(seq, epoch)
+
+    def get_merkle_arc(self, place: str) -> list:
+        """指定存储区 Merkle 树分桶的弧 [start_id, end_id]，对端对账前改用同一段弧"""
+        return list(self._get_store(place).merkle.arc)
+
+    def get_merkle_hashes(self, place: str, level: int, indexes: list, start_id=None, end_id=None):
+        """获取指定存储区 Merkle 树某一层节点的摘要；给出的弧与树当前的弧不同时返回空列表"""
+        arc = None if start_id is None else (start_id, end_id)
+        return self._get_store(place).merkle_hashes(level, indexes, arc)
+
+    def get_bucket_data(self, place: str, buckets: list):
+        """获取指定存储区若干叶子桶内的键值对"""
+        return self._get_store(place).bucket_data(buckets)
+
+    def transfer_range(self, place: str, start_id: int, end_id: int, limit: int):
+        """分块返回指定存储区中环上 ID 位于 (start_id, end_id] 的键值对，调用方以返回的 last_id 作为下一块的起点"""
+        return KeyRange(*self._get_store(place).chunk_in_arc(start_id, end_id, limit))
+
+    def _pull_range(self, client, place: str, start_id: int, end_id: int, store) -> int:
+        """从对端 place 存储区分块拉取 (start_id, end_id] 内的键写入本地 store，返回拉取的键数"""
+        count = 0
+        for page in scan_pages(client, place, start_id, end_id):
+            store.update(page.data)
+            count += len(page.data)
+        return count
+
+    def _fetch_range(self, client, place: str, start_id: int, end_id: int, store) -> int:
+        """
+        把对端 place 存储区 (start_id, end_id] 内的键同步到本地 store。store 为空时分块拉取；
+        重启后已从磁盘载入数据时只经 Merkle 树对账，拉取弧上不一致的桶，返回写入与删除的键数
+        """
+        if not len(store):
+            return self._pull_range(client, place, start_id, end_id, store)
+        arcs = self._diff_arcs(client, place, store, (start_id, end_id))
+        return self._sync_buckets(client, place, store, arcs, arc=(start_id, end_id))
+
+    def _diff_arcs(self, client, place: str, store, within=None) -> list:
+        """
+        与对端 place 存储区的 Merkle 树对账，返回不一致的桶合并成的环上弧；within 为 (start_id, end_id) 时
+        只保留与该弧相交的桶。本地 store 先改用对端树分桶的弧，两边的桶才能逐个对比
+        """
+        start_id, end_id = client.get_merkle_arc(place)
+        tree = store.set_merkle_arc(start_id, end_id)
+        buckets = diff_buckets(tree, lambda level, indexes: client.get_merkle_hashes(place, level, indexes,
+                                                                                     start_id, end_id))
+        if within is not None:
+            buckets = buckets_in_arc(buckets, *within, tree.depth, tree.arc)
+        return bucket_arcs(buckets, tree.depth, tree.arc)
+
+    def _sync_buckets(self, client, place: str, store, arcs: list, sync_key=None, mirror=True, arc=None) -> int:
+        """
+        按 Merkle 对账得到的弧（见 _diff_arcs）逐页扫描对端 place 存储区，写入本地 store；mirror 时同时删除对端已没有的本地键，
+        arc 为 (start_id, end_id) 时只处理其中位于该弧上的键。每次只持有一页，返回写入与删除的键数
+        """
+        count = 0
+        for start_id, end_id in arcs:
+            previous = ''
+            for page in scan_pages(client, place, start_id, end_id):
+                data, stale = apply_scan_page(store, page, previous, start_id, end_id, mirror, arc)
+                if sync_key is not None:
+                    self._record_sync(sync_key, data, stale)
+                count += len(data) + len(stale)
+                previous = page.cursor
+        return count
+
+    def _merge_store(self, store):
+        """把本地另一个存储区分页并入自身数据，不复制整个存储区"""
+        cursor = ''
+        while True:
+            data, cursor, done = store.scan(cursor, TRANSFER_CHUNK_SIZE, None, None)
+            self.kv_store.update(data)
+            if done:
+                return
+
+    def _take_over_range(self, successor: Node):
+        """
+        加入时从后继拉取本节点接管的数据：后继原前驱 p 与本节点之间 (p, self] 的键，
+        以及本节点应持有的两份副本，后继 (self, successor] 的键与 p 的数据（后继的 predecessor 存储区），
+        只迁移这三段区间而不是后继的全部数据
+        """
+        client = connect_node(successor)
+        predecessor = client.get_predecessor()
+        start_id = predecessor.node_id if predecessor and predecessor.valid else successor.node_id
+        owned = self._fetch_range(client, "self", start_id, self.node_id, self.kv_store)
+        self._fetch_range(client, "self", self.node_id, successor.node_id, self.successor_kv_store)
+        self._fetch_range(client, "predecessor", successor.node_id, start_id, self.predecessor_kv_store)
+        self.logger.info(f'node {self.node_id} took over {owned} keys in ({start_id}, {self.node_id}] '
+                         f'from {successor.node_id}')
+
+    def accept_range(self, place: str, data: dict, deletes: list, codec=None, payload=None) -> int:
+        """接收邻居移交的一块数据写入指定存储区，返回确认写入与删除的键数；codec 不为空时数据压缩在 payload 中"""
+        if codec:
+            data = decode_items(codec, payload)
+        store = self._get_store(place)
+        for key in deletes:
+            store.pop(key, None)
+        store.update(data)
+        store.commit()  # 落盘之后才确认，移交方据此丢弃自己的数据
+        return len(data) + len(deletes)
+
+    def _send_chunk(self, client, chunk: 'HandoffChunk', report):
+        """发送一块移交数据并等待对端确认，确认的键数不符或调用失败时重试，重试耗尽后抛出异常"""
+        for attempt in range(HANDOFF_RETRIES):
+            try:
+                if chunk.acknowledged(client.accept_range(*chunk.args()), report):
+                    return
+            except Exception as e:
+                chunk.error = e
+            self.logger.warning(chunk.retry_message(attempt))
+        raise chunk.exhausted()
+
+    def _hand_off_store(self, client, place: str, store, report, codec=None, since=None):
+        """
+        把 store 的数据分块移交给对端的 place 存储区，codec 为与对端协商的压缩算法；
+        since 为 (seq, epoch) 时只补发其后的变更，见 _handoff_chunks
+        """
+        for data, deletes in self._handoff_chunks(store, since):
+            self._send_chunk(client, HandoffChunk(place, data, deletes, codec), report)
+
+    def _handoff_chunks(self, store, since=None):
+        """
+        逐块生成要移交的 (键值对, 删除的键)：since 为 None 时按环上 ID 顺序取 store 的全部数据；
+        为 (seq, epoch) 时取该序号之后的变更（移交期间的新写入与删除），日志不足时退回全部数据。
+        同步与协程实现共用，只有发送不同
+        """
+        if since is not None:
+            changes = store.changes_since(*since)
+            if not changes.resync:
+                items, deletes = list(changes.upserts.items()), changes.deletes
+                for index in range(0, max(len(items), 1), TRANSFER_CHUNK_SIZE):
+                    data = dict(items[index:index + TRANSFER_CHUNK_SIZE])
+                    if data or deletes:
+                        yield data, deletes
+                    deletes = []
+                return
+        start_id = self.node_id
+        while True:
+            data, last_id, done = store.chunk_in_arc(start_id, self.node_id, TRANSFER_CHUNK_SIZE)
+            if data:
+                yield data, []
+            if done:
+                return
+            start_id = last_id
+
+    def _replica_handoffs(self, successor_client, predecessor_client, successor_codec, predecessor_codec) -> list:
+        """
+        本节点数据移交之后要移交的副本 [(客户端, 对端存储区, 本地存储, 压缩算法), ...]：
+        离开后后继的前驱副本应为前驱的数据，前驱的后继副本应为后继原有的数据加上本节点移交的数据；
+        副本移交失败，以及后继的后继中的副本，都留给周期同步修复
+        """
+        return [(client, place, store, codec) for client, place, store, codec in (
+            (successor_client, "predecessor", self.predecessor_kv_store, successor_codec),
+            (predecessor_client, "successor", self.successor_kv_store, predecessor_codec),
+            (predecessor_client, "successor", self.kv_store, predecessor_codec)) if client is not None]
+
+    def _leave_aborted(self, report, started: float, error) -> LeaveReport:
+        """本节点数据移交失败，放弃离开，节点继续留在环中"""
+        self.logger.error(f'node {self.node_id} failed to hand off its data, staying in the ring: {error}')
+        report.duration = time.perf_counter() - started
+        return report
+
+    def _leave_finished(self, report, started: float) -> LeaveReport:
+        """数据移交完毕，本节点退出环：指针指向自身，清空本节点数据并停止维护任务"""
+        with self._lock:
+            self.predecessor = self.self_node
+            self.successor = self.self_node
+            self.successor_list = []
+        self.kv_store.clear()
+        self._stop_periodic_tasks()
+        report.duration = time.perf_counter() - started
+        self.logger.info(f'node {self.node_id} left the ring, handed off {report.keys} keys '
+                         f'({report.bytes} bytes, {report.chunks} chunks) in {report.duration:.3f}s')
+        return report
+
+    def _graceful_leave(self) -> LeaveReport:
+        """
+        主动离开：暂停邻居的稳定性检查，把本节点的数据分块移交给后继并逐块确认，
+        再把两份副本分别交给后继（前驱的数据）与前驱（后继的数据），然后让前驱与后继互相指向，
+        最后补发移交期间收到的写入。本节点数据移交失败时放弃离开，节点继续留在环中
+        """
+        started = time.perf_counter()
+        report = LeaveReport()
+        successor, predecessor = self.successor, self.predecessor
+        if successor.node_id == self.node_id:
+            self.logger.warning(f'node {self.node_id} is the only node in the ring, nothing to hand off to')
+            return report
+        successor_client = connect_node(successor)
+        predecessor_client = connect_node(predecessor) if predecessor.valid else None
+        neighbors = [client for client in (successor_client, predecessor_client) if client is not None]
+        for client in neighbors:
+            client.pause_stability_tests()
+        self.pause_stability_tests()
+        successor_codec = negotiate_codec(successor_client)  # 移交的数据按与各邻居协商的算法压缩
+        predecessor_codec = negotiate_codec(predecessor_client) if predecessor_client is not None else None
+
+        since = (self.kv_store.seq, self.kv_store.epoch)
+        try:
+            self._hand_off_store(successor_client, "self", self.kv_store, report, successor_codec)
+        except Exception as e:
+            for client in neighbors:
+                client.resume_stability_tests()
+            self.resume_stability_tests()
+            return self._leave_aborted(report, started, e)
+
+        for client, place, store, codec in self._replica_handoffs(successor_client, predecessor_client,
+                                                                  successor_codec, predecessor_codec):
+            try:
+                self._hand_off_store(client, place, store, report, codec)
+            except Exception as e:
+                self.logger.warning(f'replica handoff to {place} failed, left to periodic sync: {e}')
+
+        successor_client.update_predecessor(predecessor)
+        if predecessor_client is not None:
+            predecessor_client.update_successor(successor)
+        report.complete = True
+        try:
+            # 前驱与后继改为互指之后不再有写入进入本节点的区间，补发此前漏掉的变更
+            self._hand_off_store(successor_client, "self", self.kv_store, report, successor_codec, since)
+        except Exception as e:
+            report.complete = False
+            self.logger.error(f'node {self.node_id} failed to hand off writes received while leaving: {e}')
+        for client in neighbors:
+            client.resume_stability_tests()
+        return self._leave_finished(report, started)
+
+    def merge_replica(self, place: str):
         raise NotImplementedError
 
     def is_key_for_node(self, key: str):
@@ -141,36 +898,158 @@ class BaseChordNode:
     def update_data(self):
         raise NotImplementedError
 
+
+class HandoffChunk:
+    """
+    一块移交数据：按协商的算法编码，核对对端确认的键数并计入移交报告。
+    发送与重试由同步与协程实现各自完成，见 BaseChordNode._send_chunk
+    """
+
+    def __init__(self, place: str, data: dict, deletes: list, codec=None):
+        self.place = place
+        self.data = data
+        self.deletes = deletes
+        self.expected = len(data) + len(deletes)
+        self.codec, self.payload = encode_items(data, codec)
+        self.error = None  # 最近一次失败的原因
+
+    def args(self) -> tuple:
+        """accept_range 的参数，压缩后键值对只在 payload 中"""
+        return self.place, {} if self.codec else self.data, self.deletes, self.codec, self.payload
+
+    def acknowledged(self, acked: int, report) -> bool:
+        """对端确认了全部键时计入 report 并返回 True，否则记下原因等待重试"""
+        if acked != self.expected:
+            self.error = f'acknowledged {acked} of {self.expected} keys'
+            return False
+        report.keys += self.expected
+        report.bytes += _chunk_bytes(self.data, self.deletes)
+        report.chunks += 1
+        return True
+
+    def retry_message(self, attempt: int) -> str:
+        return f'handoff of {self.expected} keys to {self.place} failed (attempt {attempt + 1}): {self.error}'
+
+    def exhausted(self) -> RuntimeError:
+        return RuntimeError(f'handoff of {self.expected} keys to {self.place} failed: {self.error}')
+
+
+# 哈希结果的 LRU 缓存容量，客户端反复访问的热点键不必每次重新计算 SHA-1
+HASH_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=HASH_CACHE_SIZE)
+def _sha1_id(text: str) -> int:
+    digest = hashlib.sha1(text.encode('utf-8')).digest()  # 计算 SHA-1 摘要
+    return int.from_bytes(digest, 'big') % (2 ** M)  # 转换为整数并对 2^M 取模
+
+
+# 后继列表的长度 r，后继失效时依次切换到列表中下一个存活的节点，连续 r 个节点同时失效才需要沿环查找
+SUCCESSOR_LIST_SIZE = 4
+# 一轮稳定化中沿“后继的前驱”收紧后继的最多步数，同一区间内并发加入多个节点（如虚拟节点）时不必每轮只前进一个
+STABILIZE_STEPS = 8
+# 复制因子 N：每个键存于归属节点及其后 N-1 个后继，受后继列表长度限制，不超过 SUCCESSOR_LIST_SIZE + 1
+REPLICATION_FACTOR = 3
+# 写法定数 W：put 在包括本地在内的 W 份写入确认之后返回，其余副本在后台继续写入
+WRITE_QUORUM = 2
+# 读法定数 R：lookup 等到包括本地在内的 R 份应答后合并结果，为 1 时只读本地
+READ_QUORUM = 1
+# 节点加入时按区间迁移数据，每个 RPC 最多携带的键数
+TRANSFER_CHUNK_SIZE = 1000
+# scan 每页最多返回的键数，调用方要求更大的页时按此截断
+MAX_SCAN_LIMIT = 10000
+# 节点离开时向邻居移交数据，每块未被确认时的重试次数
+HANDOFF_RETRIES = 3
+
+
+def _chunk_bytes(data: dict, deletes=()) -> int:
+    """一块移交数据中键与值的字节数"""
+    return sum(len(key.encode('utf-8')) + len(value.encode('utf-8')) for key, value in data.items()) + \
+        sum(len(key.encode('utf-8')) for key in deletes)
+
+
 def hash_func(intput_str) -> int:
     """
-    使用 SHA-1 哈希函数
+    使用 SHA-1 哈希函数，结果按输入缓存
+    """
+    return _sha1_id(str(intput_str))
+
+
+def hash_many(keys):
+    """
+    批量计算键的环上 ID，安装了 NumPy 时返回 int64 数组，可直接交给 is_between_many 做区间判断
     """
-    sha1 = hashlib.sha1()  # 创建 SHA-1 哈希对象
-    sha1.update(str(intput_str).encode('utf-8'))  # 更新哈希对象
-    hash_hex = sha1.hexdigest()  # 获取哈希值的十六进制表示
-    hash_int = int(hash_hex, 16)  # 将十六进制转换为整数
-    hash_int = hash_int % (2 ** M)  # 对 2^M 取模
-    return hash_int  # 返回哈希值
+    ids = [_sha1_id(str(key)) for key in keys]
+    return np.array(ids, dtype=np.int64) if np is not None else ids
+
+
+def vnode_id(address, port, index=0) -> int:
+    """服务端上第 index 个虚拟节点的环上 ID，第 0 个即未启用虚拟节点时按地址与端口计算的节点 ID"""
+    return hash_func(f'{address}:{port}' if index == 0 else f'{address}:{port}#{index}')
+
+
+def check_replication(replicas: int, write_quorum: int, read_quorum: int):
+    """检查复制因子与读写法定数，不合法时抛出 ValueError"""
+    if not 1 <= replicas <= SUCCESSOR_LIST_SIZE + 1:
+        raise ValueError(f'replication factor must be between 1 and {SUCCESSOR_LIST_SIZE + 1}, '
+                         f'replicas are placed along the successor list of {SUCCESSOR_LIST_SIZE} nodes')
+    for name, quorum in (('write', write_quorum), ('read', read_quorum)):
+        if not 1 <= quorum <= replicas:
+            raise ValueError(f'{name} quorum must be between 1 and the replication factor {replicas}')
 
 
-def connect_address(address, port):
+def replica_place(distance: int) -> str:
+    """第 distance 个后继保存本节点数据的存储区：紧邻的后继为 predecessor，更远的为 predecessor<distance>"""
+    return "predecessor" if distance == 1 else f"predecessor{distance}"
+
+
+def replica_distance(place: str) -> int:
+    """replica_place 的逆运算"""
+    return int(place[len("predecessor"):] or 1)
+
+
+def resolve_reads(results: list) -> KeyValueResult:
+    """
+    合并同一个键在各副本上读到的结果，第一项为归属节点本地的结果。存储的值不带版本，只能按多数取值：
+    找到的值优先于未找到，出现次数相同时取排在前面（本地、应答更快的副本）的值
+    """
+    local = results[0]
+    found = [result for result in results if result.status == KVStatus.VALID]
+    if not found:
+        return local
+    counts = Counter(result.value for result in found)
+    best = max(found, key=lambda result: counts[result.value])  # 次数相同时 max 返回最前面的一项
+    return KeyValueResult(local.key, best.value, local.node_id, KVStatus.VALID)
+
+
+def call_quorum(calls: list, needed: int) -> list:
+    """经当前传输方式并发执行一组访问副本的调用，凑齐 needed 个成功即返回，见 ThriftTransport.call_quorum"""
+    return get_transport().call_quorum(calls, needed)
+
+
+def connect_address(address, port, vnode=None):
     """
     尝试连接指定的地址和端口，如果在线则返回节点对象，否则返回 None
+    默认通过 Thrift 连接池访问节点，进程内模拟时由 transport.set_transport 换成进程内传输。
+    vnode 为该地址上虚拟节点的 ID，None 表示第 0 个虚拟节点
     """
-    try:
-        node = make_client(chord_thrift.ChordNode, address, port)  # 创建 Thrift 客户端
-        return node  # 返回节点对象
-    except Exception as e:
-        logger.warning(e)  # 记录警告信息
-        logger.warning(traceback.format_exc())  # 记录异常堆栈信息
-        return None  # 返回 None
+    transport = get_transport()
+    client = transport.connect(chord_thrift.ChordNode, address, port, vnode)  # 通过当前传输方式获取客户端
+    if not getattr(transport, 'record_rpc_metrics', True):
+        return client
+    if client is None:
+        get_rpc_metrics().inc('rpc_connect_failures_total')
+        return None
+    return InstrumentedClient(client, get_rpc_metrics())  # 按 RPC 名记录调用耗时
 
 
 def connect_node(node: Node):
     """
-    尝试连接节点，如果节点在线则返回节点对象，否则返回 None
+    尝试连接节点，如果节点在线则返回节点对象，否则返回 None；
+    ID 不是按地址与端口计算出来的节点是服务端上的其他虚拟节点，按节点 ID 寻址
     """
-    return connect_address(node.address, node.port)  # 通过地址和端口连接节点
+    vnode = None if node.node_id == vnode_id(node.address, node.port) else node.node_id
+    return connect_address(node.address, node.port, vnode)  # 通过地址和端口连接节点
 
 
 def is_between(node: Node, node1: Node, node2: Node):
@@ -184,4 +1063,73 @@ def is_between(node: Node, node1: Node, node2: Node):
     elif start_node_id == end_node_id:
         return True  # 相等的情况
     else:
-        return node.node_id > start_node_id or node.node_id <= end_node_id  # 逆时针情况
\ No newline at end of file
+        return node.node_id > start_node_id or node.node_id <= end_node_id  # 逆时针情况
+
+
+def scan_pages(client, place: str, start_id=None, end_id=None, limit=TRANSFER_CHUNK_SIZE):
+    """
+    逐页拉取对端 place 存储区中 (start_id, end_id] 内的键值对，不给出区间时为整个存储区，生成每一页的 ScanPage；
+    调用方每次只持有一页，内存占用与存储区大小无关
+    """
+    cursor, codecs = '', enabled_codecs()
+    while True:
+        page = client.scan(place, cursor, limit, start_id, end_id, codecs)
+        if page.codec:
+            page.data = decode_items(page.codec, page.payload)
+        yield page
+        if page.done:
+            return
+        cursor = page.cursor
+
+
+def make_scan_page(data: dict, cursor: str, done: bool, codecs=None) -> ScanPage:
+    """按调用方能解压的算法 codecs 协商压缩一页扫描结果，压缩后键值对只在 payload 中"""
+    codec, payload = encode_items(data, choose_codec(codecs))
+    return ScanPage({} if codec else data, cursor, done, codec, payload)
+
+
+def scan_items(client, place: str, start_id=None, end_id=None, limit=TRANSFER_CHUNK_SIZE):
+    """逐个生成对端 place 存储区中的 (键, 值)，见 scan_pages"""
+    for page in scan_pages(client, place, start_id, end_id, limit):
+        yield from page.data.items()
+
+
+def apply_scan_page(store, page, previous: str, start_id: int, end_id: int, mirror=True, arc=None):
+    """
+    把对端扫描 (start_id, end_id] 得到的一页写入 store，previous 为这一页之前的游标；
+    mirror 时删除本地位于这一页范围内而对端没有的键。arc 不为 None 时只处理位于弧 arc 上的键。
+    返回 (写入的键值对, 删除的键)
+    """
+    data = page.data
+    if arc is not None:
+        keys = list(data)
+        data = {key: data[key] for key, inside in zip(keys, is_between_many(hash_many(keys), *arc)) if inside}
+    stale = []
+    if mirror:
+        local = [key for key in store.keys_between(previous, page.cursor, start_id, end_id) if key not in page.data]
+        if arc is not None:
+            local = [key for key, inside in zip(local, is_between_many([store.key_id(key) for key in local], *arc))
+                     if inside]
+        for key in local:
+            store.pop(key, None)
+        stale = local
+    store.update(data)
+    return data, stale
+
+
+def is_between_many(ids, start_id: int, end_id: int):
+    """
+    is_between 的批量版本：判断一组环上 ID 是否位于 (start_id, end_id] 内，
+    ids 为 NumPy 数组时返回布尔数组，否则返回布尔列表
+    """
+    if np is not None and isinstance(ids, np.ndarray):
+        if start_id < end_id:
+            return (ids > start_id) & (ids <= end_id)
+        elif start_id == end_id:
+            return np.ones(len(ids), dtype=bool)
+        return (ids > start_id) | (ids <= end_id)
+    if start_id < end_id:
+        return [start_id < key_id <= end_id for key_id in ids]
+    elif start_id == end_id:
+        return [True] * len(ids)
+    return [key_id > start_id or key_id <= end_id for key_id in ids]
\ No newline at end of file
@@ -0,0 +1,459 @@
+import asyncio
+import time
+from .aio_connection_pool import connect_aio
+from .chord_base import BaseChordNode, HANDOFF_RETRIES, MAX_SCAN_LIMIT, TRANSFER_CHUNK_SIZE, HandoffChunk, chord_thrift
+from .chord_base import apply_scan_page, make_scan_page, vnode_id
+from .compression import decode_items, enabled_codecs, negotiate_codec_aio
+from .merkle import bucket_arcs, buckets_in_arc, diff_buckets_async
+from .metrics import AioInstrumentedClient, get_rpc_metrics
+from .struct_class import KeyRange, KeyValueResult, KVStatus, LeaveReport, Node, RouteResult, TraceContext
+from .tracing import Span, new_trace
+
+
+class AioBaseChordNode(BaseChordNode):
+    """
+    基于 asyncio 的 Chord 节点基类：对外的 RPC 方法都是协程，由 thriftpy2 的协程服务端调用，
+    转发中的请求只占用一个协程而不是一个线程；周期任务作为事件循环中的任务运行。
+    节点的状态只在事件循环线程中访问，两个 await 之间的读改写不会被打断
+    """
+
+    def __init__(self):
+        self._periodic_task = None  # 周期任务，在 start 中创建
+        self._wakeup = None  # 维护任务的调度提前时唤醒周期任务，在周期任务中创建
+        super().__init__()
+
+    def _start_periodic_tasks(self):
+        """事件循环启动前无法创建任务，由 start 在循环中启动"""
+        pass
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """在指定事件循环中启动周期任务"""
+        self._periodic_task = loop.create_task(self.run_periodically())
+
+    def _stop_periodic_tasks(self):
+        """取消周期任务，节点离开环时调用"""
+        self._maintenance_stopped = True
+        if self._periodic_task is not None:
+            self._periodic_task.cancel()
+            self._periodic_task = None
+
+    async def run_periodically(self):
+        """定期运行的任务：等到最早到期的维护任务，或被 _wake_maintenance 提前唤醒"""
+        self._wakeup = asyncio.Event()
+        self._maintenance.start(self._clock())
+        while True:
+            next_due = self._maintenance.next_due()
+            if next_due is None:
+                return
+            delay = next_due - self._clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            await self._run_periodic_tasks()
+
+    async def _run_periodic_tasks(self):
+        """执行已到期的维护任务，异常只记录不抛出；返回下一个任务到期的时刻"""
+        self._maintenance_running = True
+        try:
+            for name in self._due_tasks():
+                before = self._maintenance_state(name)
+                started = time.perf_counter()
+                try:
+                    result = getattr(self, name)()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    self._task_failed(name, e)
+                    continue
+                finally:
+                    self.metrics.observe('maintenance_seconds', time.perf_counter() - started, task=name.lstrip('_'))
+                self._task_done(name, self._maintenance_state(name) != before)
+        finally:
+            self._maintenance_running = False
+        return self._maintenance.next_due()
+
+    def _wake_maintenance(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def multi_lookup(self, keys: list) -> list:
+        """批量查找，各下一跳的转发并发进行"""
+        local_keys, forward = self._group_by_owner(keys)
+        results = await self._read_replicas(local_keys, [self._lookup_local(key) for key in local_keys])
+        self._served_locally('lookup', len(results))
+        remote = await asyncio.gather(*(self._forward(next_node, 'multi_lookup', sub_keys)
+                                        for next_node, sub_keys in forward))
+        for sub_results in remote:
+            results.extend(self._forwarded('lookup', sub_results))
+        return results
+
+    async def multi_put(self, kvs: dict) -> list:
+        """批量存储，本地写入后并发地复制到后面的 N-1 个节点，并发地向各下一跳转发其余键"""
+        local_keys, forward = self._group_by_owner(kvs.keys())
+        local_kvs = {key: kvs[key] for key in local_keys}
+        results = await self.multi_do_put(local_kvs, "self")
+        self._served_locally('put', len(results))
+        if local_kvs and not await self._replicate('multi_do_put', (local_kvs,), f'{len(local_kvs)} keys'):
+            for result in results:
+                result.status = KVStatus.UNAVAILABLE
+        remote = await asyncio.gather(*(self._forward(next_node, 'multi_put', {key: kvs[key] for key in sub_keys})
+                                        for next_node, sub_keys in forward))
+        for sub_results in remote:
+            results.extend(self._forwarded('put', sub_results))
+        return results
+
+    async def multi_do_put(self, kvs: dict, place: str) -> list:
+        """在本节点的指定存储区批量存储键值对，整批写入后只等待一次落盘"""
+        store = self._get_store(place)
+        store.update(kvs)
+        await self._commit(store)
+        return [KeyValueResult(key, value, self.node_id) for key, value in kvs.items()]
+
+    async def _commit(self, store):
+        """等待写入落盘；组提交的等待放到线程池中，不阻塞事件循环"""
+        if store.durable:
+            await asyncio.get_running_loop().run_in_executor(None, store.commit)
+
+    async def _forward(self, next_node: Node, api: str, *args):
+        """把请求转发给下一跳节点"""
+        conn_next_node = await connect_node_aio(next_node)
+        return await getattr(conn_next_node, api)(*args)
+
+    async def do_lookup(self, key: str, place: str) -> KeyValueResult:
+        """在本节点的指定存储区查找键，归属节点按读法定数读取副本时调用"""
+        value = self._get_store(place).get(key, None)
+        return KeyValueResult(key, value, self.node_id, KVStatus.VALID if value is not None else KVStatus.NOT_FOUND)
+
+    async def multi_do_lookup(self, keys: list, place: str) -> list:
+        """在本节点的指定存储区批量查找"""
+        return [await self.do_lookup(key, place) for key in keys]
+
+    async def _replicate(self, api: str, args: tuple, desc: str) -> bool:
+        """
+        并发地把本地写入复制到后面的 N-1 个节点，api 为写入副本的 RPC，args 为除存储区以外的参数，desc 用于日志描述写入的内容。
+        本地的一份计入写法定数，凑齐 W 份即返回，其余副本在后台继续写入；确认不足 W 份时返回 False
+        """
+        async def replicate_to(replica, place):
+            try:
+                conn = await connect_node_aio(replica)
+                if conn is None:
+                    raise ConnectionError('node is unreachable')
+                return await getattr(conn, api)(*args, place)
+            except Exception as e:
+                self.logger.warning(f"Failed to store {desc} in {place} replica {replica.node_id}: {e}")
+                return None
+
+        targets = self._replica_targets()
+        needed = min(self.write_quorum, len(targets) + 1) - 1
+        acks = await gather_quorum([replicate_to(replica, place) for replica, place in targets], needed)
+        return self._quorum_reached('put', len(acks), needed)
+
+    async def _read_replicas(self, keys: list, local: list) -> list:
+        """
+        R 大于 1 时并发读取后面节点上 keys 的副本，只等最快应答的 R-1 个，与本地的结果 local 逐键合并；
+        R 为 1 时直接返回 local
+        """
+        if self.read_quorum <= 1 or not keys:
+            return local
+
+        async def read_from(replica, place):
+            try:
+                conn = await connect_node_aio(replica)
+                if conn is None:
+                    raise ConnectionError('node is unreachable')
+                if len(keys) == 1:
+                    return [await conn.do_lookup(keys[0], place)]
+                return await conn.multi_do_lookup(keys, place)
+            except Exception as e:
+                self.logger.warning(f"Failed to read {len(keys)} keys from {place} replica {replica.node_id}: {e}")
+                return None
+
+        targets = self._replica_targets()
+        needed = min(self.read_quorum, len(targets) + 1) - 1
+        replies = await gather_quorum([read_from(replica, place) for replica, place in targets], needed)
+        return self._merge_reads(local, replies, needed)
+
+    async def get_predecessor(self) -> Node:
+        """获取当前节点的前驱节点"""
+        return self.predecessor
+
+    async def get_successor(self) -> Node:
+        """获取当前节点的后继节点"""
+        return self.successor
+
+    async def get_successor_list(self) -> list:
+        """获取当前节点的后继列表"""
+        return self.successor_list or [self.successor]
+
+    async def _refresh_successor_list(self, successor_client):
+        """稳定化时从后继拉取其后继列表"""
+        self._merge_successor_list(await successor_client.get_successor_list())
+
+    async def _next_alive_successor(self):
+        """按后继列表顺序返回第一个可连接的后继（跳过当前后继与不可连接的服务端上的虚拟节点），都不可连接时返回 None"""
+        dead = {(self.successor.address, self.successor.port)}
+        for node in self.successor_list:
+            if node.node_id == self.successor.node_id or (node.address, node.port) in dead:
+                continue
+            if await connect_node_aio(node):
+                return node
+            dead.add((node.address, node.port))
+        return None
+
+    async def get_id(self) -> int:
+        """获取当前节点的 ID"""
+        return self.node_id
+
+    async def get_stats(self):
+        """获取本节点的指标"""
+        return self.collect_stats()
+
+    async def find_successor(self, key_id: int) -> Node:
+        """查找给定键 ID 的后继节点"""
+        return await self._find_successor(key_id, None)
+
+    async def trace_find_successor(self, key_id: int, trace: TraceContext) -> RouteResult:
+        """带追踪的 find_successor，返回找到的节点以及经过的路径"""
+        span = Span(self.node_id, trace or new_trace())
+        node = await self._find_successor(key_id, span)
+        return RouteResult(node, span.finish())
+
+    async def _forward_find_successor(self, client, key_id: int, span: Span) -> Node:
+        if span is None:
+            return await client.find_successor(key_id)
+        return (await self._call_traced(span, client, 'trace_find_successor', key_id)).node
+
+    async def _call_traced(self, span: Span, client, api: str, *args):
+        if span is None:
+            return await getattr(client, api)(*args)
+        result = await getattr(client, api)(*args, span.forward(self._finger_index(client)))
+        span.returned(result.trace)
+        return result
+
+    async def get_all_data(self, place: str):
+        """返回指定存储区全部数据的副本，数据量大时应使用 scan 分页"""
+        return self._get_store(place).snapshot()
+
+    async def scan(self, place: str, cursor: str, limit: int, start_id=None, end_id=None, codecs=None):
+        """分页返回指定存储区中 (start_id, end_id] 内的键值对，按 codecs 协商压缩，见 BaseChordNode.scan"""
+        limit = min(limit, MAX_SCAN_LIMIT) if limit and limit > 0 else TRANSFER_CHUNK_SIZE
+        return make_scan_page(*self._get_store(place).scan(cursor, limit, start_id, end_id), codecs)
+
+    async def get_codecs(self) -> list:
+        """本节点能解压的算法"""
+        return enabled_codecs()
+
+    async def get_changes_since(self, place: str, seq: int, epoch: str):
+        """获取指定存储区在序号 seq 之后的变更，无法增量回答时返回 resync 标记"""
+        return self._get_store(place).changes_since(seq, epoch)
+
+    async def get_merkle_arc(self, place: str) -> list:
+        """指定存储区 Merkle 树分桶的弧 [start_id, end_id]"""
+        return list(self._get_store(place).merkle.arc)
+
+    async def get_merkle_hashes(self, place: str, level: int, indexes: list, start_id=None, end_id=None):
+        """获取指定存储区 Merkle 树某一层节点的摘要，见 BaseChordNode.get_merkle_hashes"""
+        arc = None if start_id is None else (start_id, end_id)
+        return self._get_store(place).merkle_hashes(level, indexes, arc)
+
+    async def get_bucket_data(self, place: str, buckets: list):
+        """获取指定存储区若干叶子桶内的键值对"""
+        return self._get_store(place).bucket_data(buckets)
+
+    async def transfer_range(self, place: str, start_id: int, end_id: int, limit: int):
+        """分块返回指定存储区中环上 ID 位于 (start_id, end_id] 的键值对，调用方以返回的 last_id 作为下一块的起点"""
+        return KeyRange(*self._get_store(place).chunk_in_arc(start_id, end_id, limit))
+
+    async def _pull_range(self, client, place: str, start_id: int, end_id: int, store) -> int:
+        """从对端 place 存储区分块拉取 (start_id, end_id] 内的键写入本地 store，返回拉取的键数"""
+        count = 0
+        async for page in scan_pages_aio(client, place, start_id, end_id):
+            store.update(page.data)
+            count += len(page.data)
+        return count
+
+    async def _fetch_range(self, client, place: str, start_id: int, end_id: int, store) -> int:
+        """store 为空时分块拉取，否则只经 Merkle 树对账，见 BaseChordNode._fetch_range"""
+        if not len(store):
+            return await self._pull_range(client, place, start_id, end_id, store)
+        arcs = await self._diff_arcs(client, place, store, (start_id, end_id))
+        return await self._sync_buckets(client, place, store, arcs, arc=(start_id, end_id))
+
+    async def _diff_arcs(self, client, place: str, store, within=None) -> list:
+        """与对端 place 存储区的 Merkle 树对账，返回不一致的桶合并成的弧，见 BaseChordNode._diff_arcs"""
+        start_id, end_id = await client.get_merkle_arc(place)
+        tree = store.set_merkle_arc(start_id, end_id)
+        buckets = await diff_buckets_async(tree, lambda level, indexes: client.get_merkle_hashes(place, level, indexes,
+                                                                                                 start_id, end_id))
+        if within is not None:
+            buckets = buckets_in_arc(buckets, *within, tree.depth, tree.arc)
+        return bucket_arcs(buckets, tree.depth, tree.arc)
+
+    async def _sync_buckets(self, client, place: str, store, arcs: list, sync_key=None, mirror=True, arc=None):
+        """按 Merkle 对账得到的弧逐页扫描对端并写入本地 store，见 BaseChordNode._sync_buckets"""
+        count = 0
+        for start_id, end_id in arcs:
+            previous = ''
+            async for page in scan_pages_aio(client, place, start_id, end_id):
+                data, stale = apply_scan_page(store, page, previous, start_id, end_id, mirror, arc)
+                if sync_key is not None:
+                    self._record_sync(sync_key, data, stale)
+                count += len(data) + len(stale)
+                previous = page.cursor
+        return count
+
+    async def _take_over_range(self, successor: Node):
+        """加入时从后继拉取本节点接管的区间与应持有的两份副本，见 BaseChordNode._take_over_range"""
+        client = await connect_node_aio(successor)
+        predecessor = await client.get_predecessor()
+        start_id = predecessor.node_id if predecessor and predecessor.valid else successor.node_id
+        owned = await self._fetch_range(client, "self", start_id, self.node_id, self.kv_store)
+        await asyncio.gather(
+            self._fetch_range(client, "self", self.node_id, successor.node_id, self.successor_kv_store),
+            self._fetch_range(client, "predecessor", successor.node_id, start_id, self.predecessor_kv_store))
+        self.logger.info(f'node {self.node_id} took over {owned} keys in ({start_id}, {self.node_id}] '
+                         f'from {successor.node_id}')
+
+    async def accept_range(self, place: str, data: dict, deletes: list, codec=None, payload=None) -> int:
+        """接收邻居移交的一块数据写入指定存储区，返回确认写入与删除的键数；codec 不为空时数据压缩在 payload 中"""
+        if codec:
+            data = decode_items(codec, payload)
+        store = self._get_store(place)
+        for key in deletes:
+            store.pop(key, None)
+        store.update(data)
+        await self._commit(store)  # 落盘之后才确认，移交方据此丢弃自己的数据
+        return len(data) + len(deletes)
+
+    async def _send_chunk(self, client, chunk: HandoffChunk, report):
+        """发送一块移交数据并等待对端确认，失败时重试，见 BaseChordNode._send_chunk"""
+        for attempt in range(HANDOFF_RETRIES):
+            try:
+                if chunk.acknowledged(await client.accept_range(*chunk.args()), report):
+                    return
+            except Exception as e:
+                chunk.error = e
+            self.logger.warning(chunk.retry_message(attempt))
+        raise chunk.exhausted()
+
+    async def _hand_off_store(self, client, place: str, store, report, codec=None, since=None):
+        """把 store 的数据或 since 之后的变更分块移交给对端的 place 存储区，见 BaseChordNode._hand_off_store"""
+        for data, deletes in self._handoff_chunks(store, since):
+            await self._send_chunk(client, HandoffChunk(place, data, deletes, codec), report)
+
+    async def _graceful_leave(self) -> LeaveReport:
+        """主动离开，流程见 BaseChordNode._graceful_leave，两份副本并发移交"""
+        started = time.perf_counter()
+        report = LeaveReport()
+        successor, predecessor = self.successor, self.predecessor
+        if successor.node_id == self.node_id:
+            self.logger.warning(f'node {self.node_id} is the only node in the ring, nothing to hand off to')
+            return report
+        successor_client = await connect_node_aio(successor)
+        predecessor_client = await connect_node_aio(predecessor) if predecessor.valid else None
+        neighbors = [client for client in (successor_client, predecessor_client) if client is not None]
+        await asyncio.gather(*(client.pause_stability_tests() for client in neighbors))
+        await self.pause_stability_tests()
+        successor_codec = await negotiate_codec_aio(successor_client)  # 移交的数据按与各邻居协商的算法压缩
+        predecessor_codec = await negotiate_codec_aio(predecessor_client) if predecessor_client is not None else None
+
+        since = (self.kv_store.seq, self.kv_store.epoch)
+        try:
+            await self._hand_off_store(successor_client, "self", self.kv_store, report, successor_codec)
+        except Exception as e:
+            await asyncio.gather(*(client.resume_stability_tests() for client in neighbors))
+            await self.resume_stability_tests()
+            return self._leave_aborted(report, started, e)
+
+        async def hand_off_replica(client, place, store, codec):
+            try:
+                await self._hand_off_store(client, place, store, report, codec)
+            except Exception as e:
+                self.logger.warning(f'replica handoff to {place} failed, left to periodic sync: {e}')
+
+        await asyncio.gather(*(hand_off_replica(*handoff) for handoff in self._replica_handoffs(
+            successor_client, predecessor_client, successor_codec, predecessor_codec)))
+
+        await successor_client.update_predecessor(predecessor)
+        if predecessor_client is not None:
+            await predecessor_client.update_successor(successor)
+        report.complete = True
+        try:
+            await self._hand_off_store(successor_client, "self", self.kv_store, report, successor_codec, since)
+        except Exception as e:
+            report.complete = False
+            self.logger.error(f'node {self.node_id} failed to hand off writes received while leaving: {e}')
+        await asyncio.gather(*(client.resume_stability_tests() for client in neighbors))
+        return self._leave_finished(report, started)
+
+
+async def connect_address_aio(address, port, vnode=None):
+    """
+    尝试连接指定的地址和端口（及其上 ID 为 vnode 的虚拟节点），如果在线则返回协程客户端，否则返回 None
+    连接由当前事件循环的连接池复用
+    """
+    client = await connect_aio(chord_thrift.ChordNode, address, port, vnode)
+    if client is None:
+        get_rpc_metrics().inc('rpc_connect_failures_total')
+        return None
+    return AioInstrumentedClient(client, get_rpc_metrics())  # 按 RPC 名记录调用耗时
+
+
+async def connect_node_aio(node: Node):
+    """
+    尝试连接节点，如果节点在线则返回协程客户端，否则返回 None；服务端上的其他虚拟节点按节点 ID 寻址
+    """
+    vnode = None if node.node_id == vnode_id(node.address, node.port) else node.node_id
+    return await connect_address_aio(node.address, node.port, vnode)
+
+
+_background_tasks = set()  # 凑齐法定数之后仍在后台运行的副本调用，保留引用直到完成
+
+
+def _release_background(task):
+    """后台副本调用结束：释放引用并取走异常，失败的副本由稳定化时的同步补齐"""
+    _background_tasks.discard(task)
+    if not task.cancelled():
+        task.exception()
+
+
+async def gather_quorum(coros: list, needed: int) -> list:
+    """
+    并发执行一组访问副本的协程，结果不为 None 视为成功，返回 None 或抛出异常视为失败。
+    凑齐 needed 个成功或全部结束时返回已成功的结果；其余协程有意留在后台运行到结束，
+    使写入仍送达较慢的副本，而不是被取消
+    """
+    pending = {asyncio.ensure_future(coro) for coro in coros}
+    results = []
+    while pending and len(results) < needed:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and task.exception() is None and task.result() is not None:
+                results.append(task.result())
+    for task in pending:
+        _background_tasks.add(task)
+        task.add_done_callback(_release_background)
+    return results
+
+
+async def scan_pages_aio(client, place: str, start_id=None, end_id=None, limit=TRANSFER_CHUNK_SIZE):
+    """逐页拉取对端 place 存储区中 (start_id, end_id] 内的键值对，见 chord_base.scan_pages"""
+    cursor, codecs = '', enabled_codecs()
+    while True:
+        page = await client.scan(place, cursor, limit, start_id, end_id, codecs)
+        if page.codec:
+            page.data = decode_items(page.codec, page.payload)
+        yield page
+        if page.done:
+            return
+        cursor = page.cursor
+
+
+async def scan_items_aio(client, place: str, start_id=None, end_id=None, limit=TRANSFER_CHUNK_SIZE):
+    """逐个生成对端 place 存储区中的 (键, 值)，见 chord_base.scan_items"""
+    async for page in scan_pages_aio(client, place, start_id, end_id, limit):
+        for item in page.data.items():
+            yield item
@@ -0,0 +1,288 @@
+import bisect
+from array import array
+from collections.abc import MutableMapping
+from .chord_base import hash_func
+from .kv_store import MAX_CHANGE_LOG, StoreBase
+from .merkle import WHOLE_RING, MerkleTree
+from .struct_class import M
+
+_FREE = 0xFFFFFFFF  # 空闲条目的键长
+_EMPTY, _DELETED = -1, -2  # 散列表中的空槽与墓碑
+_ID_TYPE = 'H' if M <= 16 else 'I'  # 环上 ID 的数组元素类型，M = 16 时每项 2 字节
+# arena 中失效的字节超过该值且超过有效字节数时整理 arena
+COMPACT_MIN_GARBAGE = 1 << 20
+
+
+class CompactKVStore(StoreBase, MutableMapping):
+    """
+    面向大量小键值对的紧凑存储，接口与 KVStore 相同，可用于本节点的数据与两份副本。
+    键与值按 UTF-8 编码后首尾相接追加在一个 bytearray（arena）中，每个条目只在几个定长数组中各占一格：
+    在 arena 中的起点、键长、值长、环上 ID、键的指纹与同一 ID 上的下一个条目。
+    按键读写经开放寻址的散列表（指纹 -> 条目）定位，不必计算 SHA-1；
+    环上 ID -> 第一个条目的索引最多 2^M 项，同一 ID 上的条目串成链，供按弧取键与 Merkle 分桶使用。
+    每个键不再有独立的 str、dict 槽位与集合成员，读取时才解码为 str
+    """
+
+    def __init__(self, max_log=MAX_CHANGE_LOG):
+        StoreBase.__init__(self, max_log)
+        self._clear_entries()
+
+    def _clear_entries(self):
+        self._arena = bytearray()
+        self._offsets = array('I')  # 条目在 arena 中的起点，键之后紧接着值；arena 超过 4 GiB 时换成 8 字节
+        self._key_lengths = array('I')  # 键的字节数，空闲条目为 _FREE
+        self._value_lengths = array('I')
+        self._entry_ids = array(_ID_TYPE)  # 条目的环上 ID，覆盖与删除时更新 Merkle 树不必重新哈希
+        self._fingerprints = array('I')  # 键的 32 位指纹，比较 arena 中的字节之前先排除大部分不同的键
+        self._next = array('i')  # 同一 ID 上的下一个条目，-1 表示结束；空闲条目经它串成空闲链表
+        self._table = array('i', [_EMPTY]) * 8  # 开放寻址、线性探测，槽位数为 2 的幂
+        self._table_used = 0  # 被占用的槽位数，含墓碑
+        self._heads = {}  # 环上 ID -> 该 ID 上第一个条目
+        self._sorted_ids = array(_ID_TYPE)  # 存有键的环上 ID，升序，最多 2^M 个
+        self._free = -1  # 空闲链表头
+        self._count = 0
+        self._garbage = 0  # arena 中已失效的字节数
+
+    @staticmethod
+    def _fingerprint(key: str) -> int:
+        return hash(key) & 0xFFFFFFFF
+
+    def _find(self, key: str):
+        """返回 (条目, 散列表中的槽位)；不存在时条目为 -1，槽位为可以插入的位置"""
+        fingerprint, encoded = self._fingerprint(key), None
+        table, mask = self._table, len(self._table) - 1
+        slot, insert_at = fingerprint & mask, -1
+        while True:
+            entry = table[slot]
+            if entry == _EMPTY:
+                return -1, (insert_at if insert_at >= 0 else slot)
+            if entry == _DELETED:
+                if insert_at < 0:
+                    insert_at = slot
+            elif self._fingerprints[entry] == fingerprint:
+                if encoded is None:
+                    encoded = key.encode('utf-8')
+                start = self._offsets[entry]
+                length = self._key_lengths[entry]
+                if length == len(encoded) and self._arena[start:start + length] == encoded:
+                    return entry, slot
+            slot = (slot + 1) & mask
+
+    def _resize_table(self):
+        """占用（含墓碑）超过 2/3 时按存活条目数重建散列表，同时清除墓碑"""
+        size = 8
+        while size < self._count * 3:
+            size *= 2
+        table, mask = array('i', [_EMPTY]) * size, size - 1
+        for entry in range(len(self._offsets)):
+            if self._key_lengths[entry] == _FREE:
+                continue
+            slot = self._fingerprints[entry] & mask
+            while table[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            table[slot] = entry
+        self._table, self._table_used = table, self._count
+
+    def _entry_key(self, entry: int) -> str:
+        start = self._offsets[entry]
+        return self._arena[start:start + self._key_lengths[entry]].decode('utf-8')
+
+    def _entry_value(self, entry: int) -> str:
+        start = self._offsets[entry] + self._key_lengths[entry]
+        return self._arena[start:start + self._value_lengths[entry]].decode('utf-8')
+
+    def _entries_at(self, key_id: int):
+        entry = self._heads.get(key_id, -1)
+        while entry >= 0:
+            yield entry
+            entry = self._next[entry]
+
+    def key_id(self, key) -> int:
+        """返回键的环上 ID，已存储的键直接取条目中记录的 ID"""
+        with self._lock:
+            entry = self._find(key)[0]
+            return self._entry_ids[entry] if entry >= 0 else hash_func(key)
+
+    def _keys_at(self, key_id: int):
+        return [self._entry_key(entry) for entry in self._entries_at(key_id)]
+
+    def _value(self, key):
+        return self[key]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.keys_in_arc(0, 0))  # 按环上 ID 顺序遍历当前键的副本
+
+    def __contains__(self, key):
+        with self._lock:
+            return isinstance(key, str) and self._find(key)[0] >= 0
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._find(key)[0] if isinstance(key, str) else -1
+            if entry < 0:
+                raise KeyError(key)
+            return self._entry_value(entry)
+
+    def _append(self, key_bytes: bytes, value_bytes: bytes) -> int:
+        offset = len(self._arena)
+        if offset + len(key_bytes) + len(value_bytes) > 0xFFFFFFFF and self._offsets.typecode == 'I':
+            self._offsets = array('Q', self._offsets)
+        self._arena += key_bytes
+        self._arena += value_bytes
+        return offset
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            entry, slot = self._find(key)
+            value_bytes = value.encode('utf-8')
+            if entry >= 0:
+                old_value = self._entry_value(entry)
+                if old_value == value:
+                    return  # 值未变化时不产生变更，避免副本之间来回同步
+                key_id = self._entry_ids[entry]
+                self.merkle.remove(key_id, key, old_value)
+                key_length = self._key_lengths[entry]
+                if len(value_bytes) <= self._value_lengths[entry]:  # 原地覆盖，多出的字节成为碎片
+                    start = self._offsets[entry] + key_length
+                    self._arena[start:start + len(value_bytes)] = value_bytes
+                    self._garbage += self._value_lengths[entry] - len(value_bytes)
+                else:
+                    self._garbage += key_length + self._value_lengths[entry]
+                    self._offsets[entry] = self._append(key.encode('utf-8'), value_bytes)
+                self._value_lengths[entry] = len(value_bytes)
+            else:
+                key_id = hash_func(key)
+                self._insert(key_id, key.encode('utf-8'), value_bytes, self._fingerprint(key), slot)
+            self.merkle.add(key_id, key, value)
+            self._record(key, value, key_id)
+            self._maybe_compact()
+
+    def _insert(self, key_id: int, key_bytes: bytes, value_bytes: bytes, fingerprint: int, slot: int):
+        """新增条目并放入散列表的 slot（由 _find 给出）"""
+        offset = self._append(key_bytes, value_bytes)
+        head = self._heads.get(key_id)
+        if head is None:
+            head = -1
+            bisect.insort(self._sorted_ids, key_id)
+        entry = self._free
+        if entry >= 0:  # 复用空闲条目
+            self._free = self._next[entry]
+            self._offsets[entry] = offset
+            self._key_lengths[entry] = len(key_bytes)
+            self._value_lengths[entry] = len(value_bytes)
+            self._entry_ids[entry] = key_id
+            self._fingerprints[entry] = fingerprint
+            self._next[entry] = head
+        else:
+            entry = len(self._offsets)
+            self._offsets.append(offset)
+            self._key_lengths.append(len(key_bytes))
+            self._value_lengths.append(len(value_bytes))
+            self._entry_ids.append(key_id)
+            self._fingerprints.append(fingerprint)
+            self._next.append(head)
+        self._heads[key_id] = entry
+        self._count += 1
+        if self._table[slot] == _EMPTY:
+            self._table_used += 1
+        self._table[slot] = entry
+        if self._table_used * 3 > len(self._table) * 2:
+            self._resize_table()
+
+    def _remove(self, key: str):
+        """删除键并返回原来的值，键不存在时返回 None"""
+        entry, slot = self._find(key)
+        if entry < 0:
+            return None
+        value = self._entry_value(entry)
+        key_id = self._entry_ids[entry]
+        previous = -1
+        for other in self._entries_at(key_id):  # 同一 ID 上的链很短，找到前一个条目后摘除
+            if other == entry:
+                break
+            previous = other
+        following = self._next[entry]
+        if previous >= 0:
+            self._next[previous] = following
+        elif following >= 0:
+            self._heads[key_id] = following
+        else:
+            del self._heads[key_id]
+            del self._sorted_ids[bisect.bisect_left(self._sorted_ids, key_id)]
+        self._table[slot] = _DELETED
+        self._garbage += self._key_lengths[entry] + self._value_lengths[entry]
+        self._key_lengths[entry] = _FREE
+        self._next[entry] = self._free
+        self._free = entry
+        self._count -= 1
+        self.merkle.remove(key_id, key, value)
+        self._record(key, None)
+        self._maybe_compact()
+        return value
+
+    def __delitem__(self, key):
+        with self._lock:
+            if self._remove(key) is None:
+                raise KeyError(key)
+
+    def pop(self, key, *default):
+        with self._lock:
+            value = self._remove(key) if isinstance(key, str) else None
+            if value is not None:
+                return value
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+    def _maybe_compact(self):
+        """失效字节超过有效字节时把仍在使用的条目按序搬到新的 arena，摊还代价为常数"""
+        if self._garbage < COMPACT_MIN_GARBAGE or self._garbage < len(self._arena) - self._garbage:
+            return
+        arena = bytearray()
+        for entry in range(len(self._offsets)):
+            length = self._key_lengths[entry]
+            if length == _FREE:
+                continue
+            start, end = self._offsets[entry], self._offsets[entry] + length + self._value_lengths[entry]
+            self._offsets[entry] = len(arena)
+            arena += self._arena[start:end]
+        self._arena = arena
+        self._garbage = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear_entries()
+            self.merkle.clear()
+            self._record_clear()
+
+    def load(self, records, seq: int, leaves=None, arc=WHOLE_RING):
+        """从快照批量载入 (环上 ID, 键, 值)，见 KVStore.load"""
+        with self._lock:
+            self.merkle = MerkleTree(self.merkle.depth, arc)
+            for key_id, key, value in records:
+                self._insert(key_id, key.encode('utf-8'), value.encode('utf-8'), self._fingerprint(key),
+                             self._find(key)[1])
+                if leaves is None:
+                    self.merkle.add(key_id, key, value)
+            if leaves is not None:
+                self.merkle.load_leaves(leaves)
+            self.seq = self._log_floor = seq
+
+    def export(self) -> list:
+        """返回 (环上 ID, 键, 值) 列表、Merkle 树的叶子摘要与分桶的弧，供写快照"""
+        with self._lock:
+            records = [(key_id, self._entry_key(entry), self._entry_value(entry))
+                       for key_id in self._sorted_ids for entry in self._entries_at(key_id)]
+            return records, list(self.merkle.levels[self.merkle.depth]), self.merkle.arc
+
+    def snapshot(self) -> dict:
+        """返回当前内容的副本，供序列化时遍历，避免与并发写入冲突"""
+        with self._lock:
+            return {self._entry_key(entry): self._entry_value(entry)
+                    for key_id in self._sorted_ids for entry in self._entries_at(key_id)}
+
+    def items(self):
+        return self.snapshot().items()
@@ -0,0 +1,96 @@
+import json
+import zlib
+from thriftpy2.thrift import TApplicationException
+from .transport import get_transport
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # lz4 为可选依赖，没有时只协商 zlib
+    lz4_frame = None
+
+# 编码后不足该字节数的数据块原样发送，压缩的收益抵不过 CPU 开销
+COMPRESS_MIN_BYTES = 4096
+# zlib 的压缩级别，副本数据以文本为主，低级别已能取得大部分压缩率
+ZLIB_LEVEL = 1
+
+# 支持的压缩算法：名称 -> (压缩, 解压)，按优先顺序排列
+CODECS = {}
+if lz4_frame is not None:
+    CODECS['lz4'] = (lz4_frame.compress, lz4_frame.decompress)
+CODECS['zlib'] = (lambda payload: zlib.compress(payload, ZLIB_LEVEL), zlib.decompress)
+
+_enabled = list(CODECS)  # 本进程启用的算法，按优先顺序
+
+
+def set_codecs(names):
+    """设置本进程启用的压缩算法及其优先顺序，空列表表示不压缩也不接受压缩的数据"""
+    global _enabled
+    unknown = [name for name in names if name not in CODECS]
+    if unknown:
+        raise ValueError(f'unavailable codecs {unknown}, expected some of {list(CODECS)}')
+    _enabled = list(names)
+
+
+def enabled_codecs() -> list:
+    """本进程可以使用的压缩算法，按优先顺序；进程内传输不经过网络，不压缩"""
+    if not getattr(get_transport(), 'compress_payloads', True):
+        return []
+    return list(_enabled)
+
+
+def choose_codec(offered) -> str:
+    """按对端给出的优先顺序选出本进程也启用的第一个算法，没有共同的算法时返回 None"""
+    for name in offered or ():
+        if name in _enabled:
+            return name
+    return None
+
+
+def negotiate_codec(client) -> str:
+    """
+    主动推送数据之前询问对端能解压的算法，选出双方都启用的一个（按本进程的优先顺序）；
+    对端不支持 get_codecs 时按不压缩处理
+    """
+    local = enabled_codecs()
+    if not local:
+        return None
+    try:
+        remote = client.get_codecs()
+    except TApplicationException:
+        return None
+    return next((name for name in local if name in remote), None)
+
+
+async def negotiate_codec_aio(client) -> str:
+    """negotiate_codec 的协程版本"""
+    local = enabled_codecs()
+    if not local:
+        return None
+    try:
+        remote = await client.get_codecs()
+    except TApplicationException:
+        return None
+    return next((name for name in local if name in remote), None)
+
+
+def encode_items(data: dict, codec):
+    """
+    把一块键值对编码为 JSON 后用 codec 压缩，返回 (算法, 压缩后的字节)；
+    codec 为 None、数据太小或压缩后没有变小时返回 (None, None)，调用方照常以 map 发送
+    """
+    if codec is None or not data:
+        return None, None
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return None, None
+    payload = CODECS[codec][0](raw)
+    if len(payload) >= len(raw):
+        return None, None
+    return codec, payload
+
+
+def decode_items(codec: str, payload: bytes) -> dict:
+    """还原 encode_items 压缩的键值对"""
+    if codec not in CODECS:
+        raise ValueError(f'unsupported codec {codec!r}')
+    return json.loads(CODECS[codec][1](payload))
@@ -0,0 +1,247 @@
+import select
+import threading
+import time
+import traceback
+from thriftpy2.protocol.multiplex import TMultiplexedProtocol
+from thriftpy2.thrift import TClient, TApplicationException
+from thriftpy2.transport import TSocket, TTransportException
+from loguru import logger
+from .wire import WireFormat, get_wire_format
+
+# 单个地址允许同时打开的最大连接数
+MAX_CONNECTIONS_PER_ADDRESS = 64
+# 单个地址最多保留的空闲连接数
+MAX_IDLE_PER_ADDRESS = 8
+# 空闲连接的最长保留时间（秒），需小于服务端的 client_timeout
+IDLE_TIMEOUT = 10
+# 连接与读写超时（毫秒）
+SOCKET_TIMEOUT = 3000
+
+# 连接断开时抛出的异常类型，遇到这些异常会丢弃连接并重连
+BROKEN_CONNECTION_ERRORS = (TTransportException, BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+
+class PooledConnection:
+    """
+    连接池中的一条 Thrift 连接，wire 为这条连接的协议与传输层，默认按地址取 get_wire_format
+    """
+
+    def __init__(self, service, address, port, timeout=SOCKET_TIMEOUT, wire: WireFormat = None):
+        self.sock = TSocket(address, port, socket_timeout=timeout)  # 底层 socket
+        self.service = service
+        self.wire = wire or get_wire_format(address, port)
+        transport = self.wire.transport_factory().get_transport(self.sock)
+        self.protocol = self.wire.protocol_factory().get_protocol(transport)
+        transport.open()  # 建立 TCP 连接，失败时抛出 TTransportException
+        self.client = TClient(service, self.protocol)
+        self._vnode_clients = {}  # 虚拟节点 ID -> 在这条连接上按虚拟节点寻址的客户端
+        self.last_used = time.monotonic()  # 最近一次归还的时间
+        self.reused = False  # 是否从空闲连接中取出
+
+    def client_for(self, vnode=None):
+        """
+        返回调用指定虚拟节点的客户端：vnode 为 None 时访问服务端的第 0 个虚拟节点，与未启用虚拟节点的服务端一致；
+        否则在 RPC 名前加上虚拟节点 ID，同一服务端上的各虚拟节点共用这条连接
+        """
+        if vnode is None:
+            return self.client
+        client = self._vnode_clients.get(vnode)
+        if client is None:
+            client = self._vnode_clients[vnode] = TClient(self.service, TMultiplexedProtocol(self.protocol, str(vnode)))
+        return client
+
+    def is_healthy(self):
+        """检查空闲连接是否可用：空闲连接上不应有可读事件，可读说明对端已关闭或残留了未消费的数据"""
+        sock = self.sock.sock
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    进程级的 Thrift 连接池，按 (address, port) 复用连接
+    """
+
+    def __init__(self, service, max_connections=MAX_CONNECTIONS_PER_ADDRESS, max_idle=MAX_IDLE_PER_ADDRESS,
+                 idle_timeout=IDLE_TIMEOUT, timeout=SOCKET_TIMEOUT):
+        self.service = service
+        self.max_connections = max_connections
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Condition()
+        self._idle = {}  # (address, port) -> 空闲连接列表，末尾为最近归还的连接
+        self._in_use = {}  # (address, port) -> 正在使用的连接数
+        self._next_sweep = time.monotonic() + idle_timeout  # 下一次清理所有地址空闲连接的时刻
+
+    def acquire(self, address, port):
+        """取出一条可用连接，没有空闲连接时新建；连接失败抛出 TTransportException"""
+        key = (address, port)
+        deadline = time.monotonic() + self.timeout / 1000
+        with self._lock:
+            while True:
+                self._evict_idle()
+                idle = self._idle.get(key)
+                while idle:
+                    conn = idle.pop()
+                    if conn.is_healthy() and time.monotonic() - conn.last_used < self.idle_timeout:
+                        conn.reused = True
+                        self._in_use[key] = self._in_use.get(key, 0) + 1
+                        return conn
+                    conn.close()
+                if self._in_use.get(key, 0) < self.max_connections:
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    break
+                # 达到连接数上限，等待其他调用归还连接
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TTransportException(type=TTransportException.TIMED_OUT,
+                                              message=f"connection pool exhausted for {address}:{port}")
+                self._lock.wait(remaining)
+
+        # 在锁外建立新连接，避免阻塞其他地址
+        try:
+            return PooledConnection(self.service, address, port, self.timeout)
+        except Exception:
+            self._release_slot(key)
+            raise
+
+    def release(self, address, port, conn, broken=False):
+        """归还连接；broken 为 True 或空闲连接已满时直接关闭"""
+        key = (address, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if broken or len(idle) >= self.max_idle:
+                conn.close()
+            else:
+                conn.last_used = time.monotonic()
+                idle.append(conn)
+            self._evict_idle()
+            self._in_use[key] -= 1
+            self._lock.notify()
+
+    def _release_slot(self, key):
+        with self._lock:
+            self._in_use[key] -= 1
+            self._lock.notify()
+
+    def _evict_idle(self):
+        """
+        关闭所有地址上超过 idle_timeout 未使用的空闲连接，调用方需持有锁。
+        不再访问的对端的空闲连接也要关闭，否则一直占用文件描述符；每 idle_timeout 的一半最多清理一次
+        """
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.idle_timeout / 2
+        for key, idle in list(self._idle.items()):
+            alive = [conn for conn in idle if now - conn.last_used < self.idle_timeout]
+            for conn in idle:
+                if now - conn.last_used >= self.idle_timeout:
+                    conn.close()
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+
+    def has_idle(self, address, port) -> bool:
+        """最近归还的空闲连接是否仍可用，只检查而不检出"""
+        with self._lock:
+            idle = self._idle.get((address, port))
+            return bool(idle) and idle[-1].is_healthy() and time.monotonic() - idle[-1].last_used < self.idle_timeout
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+class PooledClient:
+    """
+    绑定到某个地址的客户端代理，每次 RPC 从连接池借出连接，调用结束后归还；
+    复用的连接已被对端关闭时自动重连一次。vnode 为服务端上虚拟节点的 ID，连接按地址复用，不区分虚拟节点
+    """
+
+    def __init__(self, pool: ConnectionPool, address, port, vnode=None):
+        self._pool = pool
+        self.address = address
+        self.port = port
+        self.vnode = vnode
+
+    def __getattr__(self, api):
+        if api not in self._pool.service.thrift_services:
+            raise AttributeError(f"{self.__class__.__name__} instance has no attribute '{api}'")
+
+        def call(*args, **kwargs):
+            return self._call(api, *args, **kwargs)
+
+        return call
+
+    def _call(self, api, *args, **kwargs):
+        for attempt in range(2):
+            conn = self._pool.acquire(self.address, self.port)
+            try:
+                result = getattr(conn.client_for(self.vnode), api)(*args, **kwargs)
+            except TApplicationException:
+                # 服务端抛出的应用异常，连接本身仍然可用
+                self._pool.release(self.address, self.port, conn)
+                raise
+            except BROKEN_CONNECTION_ERRORS as e:
+                self._pool.release(self.address, self.port, conn, broken=True)
+                # 超时说明请求可能已被处理，不重试
+                timed_out = isinstance(e, TTransportException) and e.type == TTransportException.TIMED_OUT
+                if attempt == 0 and conn.reused and not timed_out:
+                    logger.debug(f'reconnecting to {self.address}:{self.port} after {e!r}')
+                    continue
+                raise
+            except Exception:
+                self._pool.release(self.address, self.port, conn, broken=True)
+                raise
+            self._pool.release(self.address, self.port, conn)
+            return result
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(service) -> ConnectionPool:
+    """获取指定 Thrift 服务的进程级连接池"""
+    with _pools_lock:
+        pool = _pools.get(service)
+        if pool is None:
+            pool = _pools[service] = ConnectionPool(service)
+        return pool
+
+
+def connect(service, address, port, vnode=None):
+    """
+    获取指向指定地址（及其上的虚拟节点）的客户端代理，对端不在线时返回 None。
+    已有可用的空闲连接时直接返回，由第一次真正的调用检出并校验连接，失效时重连一次；
+    没有空闲连接时才新建一条连接确认对端在线，这条连接归还后留给随后的调用
+    """
+    pool = get_pool(service)
+    if pool.has_idle(address, port):
+        return PooledClient(pool, address, port, vnode)
+    try:
+        conn = pool.acquire(address, port)
+    except Exception as e:
+        logger.warning(e)  # 记录警告信息
+        logger.warning(traceback.format_exc())  # 记录异常堆栈信息
+        return None
+    pool.release(address, port, conn)
+    return PooledClient(pool, address, port, vnode)
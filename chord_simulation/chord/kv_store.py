@@ -0,0 +1,362 @@
+import bisect
+import threading
+import uuid
+from collections import deque
+from .struct_class import ChangeSet, M
+from .chord_base import hash_func
+from .merkle import WHOLE_RING, MerkleTree, bucket_arcs
+
+# 变更日志最多保留的条目数，超出后最早的变更被丢弃，落后过多的副本需全量同步
+MAX_CHANGE_LOG = 100000
+RING_SIZE = 2 ** M
+
+
+def make_cursor(key_id: int, key: str) -> str:
+    """分页扫描的游标：上一页最后一个键的环上 ID 与键"""
+    return f'{key_id}:{key}'
+
+
+def parse_cursor(cursor: str):
+    key_id, _, key = cursor.partition(':')
+    return int(key_id), key
+
+
+def _scan_arc(start_id, end_id):
+    """未给出区间或起止相同时扫描整个环，统一成 (2^M - 1, 2^M - 1]，使游标的顺序从 ID 0 开始"""
+    if start_id is None or end_id is None or start_id == end_id:
+        return RING_SIZE - 1, RING_SIZE - 1
+    return start_id, end_id
+
+
+def _cursor_rank(cursor: str, start_id: int):
+    """游标在扫描顺序中的位置：(自 start_id 顺时针的距离, 键)"""
+    key_id, key = parse_cursor(cursor)
+    return (key_id - start_id - 1) % RING_SIZE, key
+
+
+class StoreBase:
+    """
+    KVStore 与 CompactKVStore 共用的部分：变更日志与序号、Merkle 树、持久化后端，
+    以及建立在按环上 ID 有序索引之上的区间查询。子类维护升序的 _sorted_ids，并实现 _keys_at 与 _value
+    """
+
+    def __init__(self, max_log=MAX_CHANGE_LOG):
+        self.epoch = uuid.uuid4().hex  # 存储实例标识，进程重启后序号从头开始，用它区分新旧序号
+        self.seq = 0  # 最近一次变更的序号
+        self.max_log = max_log
+        self._log = deque()  # (序号, 键, 值)，值为 None 表示删除
+        self._log_floor = 0  # 日志能完整覆盖的最小起始序号
+        self._lock = threading.RLock()
+        self.merkle = MerkleTree()
+        self.backend = None  # 持久化后端，为 None 时只在内存中
+
+    def _keys_at(self, key_id: int):
+        """环上 ID 为 key_id 的全部键"""
+        raise NotImplementedError
+
+    def _value(self, key):
+        """已确认存在的键对应的值"""
+        raise NotImplementedError
+
+    def _record(self, key, value, key_id=0):
+        self.seq += 1
+        self._log.append((self.seq, key, value))
+        if len(self._log) > self.max_log:
+            self._log_floor = self._log.popleft()[0]
+        if self.backend is not None:
+            self.backend.append(self.seq, key_id, key, value)
+
+    def _record_clear(self):
+        # 清空无法用逐条变更表达，丢弃日志让副本下次重新对账
+        self.seq += 1
+        self._log.clear()
+        self._log_floor = self.seq
+        if self.backend is not None:
+            self.backend.append(self.seq, 0, None, None)  # 键为 None 表示清空
+
+    def commit(self):
+        """等待此前的全部变更落盘，没有持久化后端时立即返回"""
+        if self.backend is not None:
+            self.backend.commit(self.seq)
+
+    @property
+    def durable(self) -> bool:
+        return self.backend is not None
+
+    def update(self, other=(), **kwargs):
+        with self._lock:
+            items = other.items() if hasattr(other, 'items') else other
+            for key, value in items:
+                self[key] = value
+            for key, value in kwargs.items():
+                self[key] = value
+
+    def _ids_in_arc(self, start_id: int, end_id: int):
+        """有序索引中位于 (start_id, end_id] 内的环上 ID，跨越 0 点与 start_id == end_id 的处理同 is_between"""
+        ids = self._sorted_ids
+        if start_id < end_id:
+            return ids[bisect.bisect_right(ids, start_id):bisect.bisect_right(ids, end_id)]
+        elif start_id == end_id:
+            return ids[:]
+        return ids[bisect.bisect_right(ids, start_id):] + ids[:bisect.bisect_right(ids, end_id)]
+
+    def keys_in_arc(self, start_id: int, end_id: int) -> list:
+        """返回环上 ID 位于 (start_id, end_id] 内的键，按 ID 从 start_id 顺时针排列"""
+        with self._lock:
+            return [key for key_id in self._ids_in_arc(start_id, end_id) for key in self._keys_at(key_id)]
+
+    def items_in_arc(self, start_id: int, end_id: int) -> dict:
+        """返回环上 ID 位于 (start_id, end_id] 内的键值对"""
+        with self._lock:
+            return {key: self._value(key) for key in self.keys_in_arc(start_id, end_id)}
+
+    def chunk_in_arc(self, start_id: int, end_id: int, limit: int):
+        """
+        从 start_id 顺时针取 (start_id, end_id] 内的键值对，凑满 limit 个后停止（同一 ID 上的键不拆开），
+        返回 (键值对, 本块最后一个 ID, 是否已取完)；下一块以返回的 ID 作为新的 start_id。
+        start_id == end_id 表示整个环，同样从 start_id 之后开始，否则后续的块会漏掉 start_id 之后的键
+        """
+        with self._lock:
+            data = {}
+            if start_id == end_id:
+                split = bisect.bisect_right(self._sorted_ids, start_id)
+                ids = self._sorted_ids[split:] + self._sorted_ids[:split]
+            else:
+                ids = self._ids_in_arc(start_id, end_id)
+            for index, key_id in enumerate(ids):
+                for key in self._keys_at(key_id):
+                    data[key] = self._value(key)
+                if 0 < limit <= len(data):
+                    return data, key_id, index == len(ids) - 1
+            return data, end_id, True
+
+    def _ordered_keys(self, cursor: str, start_id: int, end_id: int):
+        """
+        从游标之后依次给出 (环上 ID, 键)：环上 ID 自 start_id 顺时针，同一 ID 上的键按字典序；调用方持锁。
+        start_id == end_id 表示整个环，按 ID 从 0 开始
+        """
+        if cursor:
+            cursor_id, after = parse_cursor(cursor)
+            ids = self._ids_in_arc(cursor_id, end_id) if cursor_id != end_id else ()
+            index = bisect.bisect_left(self._sorted_ids, cursor_id)
+            if index < len(self._sorted_ids) and self._sorted_ids[index] == cursor_id:
+                keys = sorted(self._keys_at(cursor_id))
+                for key in keys[bisect.bisect_right(keys, after):]:
+                    yield cursor_id, key
+        else:
+            ids = self._ids_in_arc(start_id, end_id)
+        for key_id in ids:
+            for key in sorted(self._keys_at(key_id)):
+                yield key_id, key
+
+    def scan(self, cursor: str, limit: int, start_id: int, end_id: int):
+        """
+        从游标处取 (start_id, end_id] 内至多 limit 个键值对，返回 (键值对, 下一页的游标, 是否已取完)；
+        游标为空串表示从弧的起点开始。同一 ID 上的键可以分在两页，每页的大小与存储区大小无关。
+        翻页之间的写入不会使游标失效：期间一直存在的键恰好返回一次，期间增删的键可能出现也可能不出现
+        """
+        start_id, end_id = _scan_arc(start_id, end_id)
+        with self._lock:
+            data, last = {}, None
+            for key_id, key in self._ordered_keys(cursor, start_id, end_id):
+                if 0 < limit <= len(data):
+                    return data, make_cursor(*last), False
+                data[key] = self._value(key)
+                last = key_id, key
+            return data, '', True
+
+    def keys_between(self, cursor: str, upto: str, start_id: int, end_id: int) -> list:
+        """
+        返回位于游标 cursor 之后、直到游标 upto（含）的键，upto 为空串时直到弧的终点；
+        与 scan 返回的一页对应，同步时据此找出对端这一页中已经没有的本地键
+        """
+        start_id, end_id = _scan_arc(start_id, end_id)
+        with self._lock:
+            keys = []
+            stop = _cursor_rank(upto, start_id) if upto else None
+            for key_id, key in self._ordered_keys(cursor, start_id, end_id):
+                if stop is not None and ((key_id - start_id - 1) % RING_SIZE, key) > stop:
+                    break
+                keys.append(key)
+            return keys
+
+    def keys_outside(self, start_id: int, end_id: int) -> list:
+        """返回环上 ID 不在 (start_id, end_id] 内的键，即弧 (end_id, start_id] 上的键"""
+        if start_id == end_id:
+            return []  # 与 is_between 一致，起止相同时整个环都在弧内
+        return self.keys_in_arc(end_id, start_id)
+
+    def apply_changes(self, changes: ChangeSet):
+        """应用从其他节点拉取的增量变更集"""
+        with self._lock:
+            for key in changes.deletes:
+                self.pop(key, None)
+            self.update(changes.upserts)
+
+    def changes_since(self, seq: int, epoch: str) -> ChangeSet:
+        """
+        返回序号 seq 之后的全部变更；epoch 不一致或日志已不能覆盖 seq 时返回 resync 标记，
+        由调用方通过 Merkle 树对账
+        """
+        with self._lock:
+            if epoch != self.epoch or seq < self._log_floor or seq > self.seq:
+                return ChangeSet(self.seq, self.epoch, True, {}, [])
+            latest = {}
+            for entry_seq, key, value in reversed(self._log):
+                if entry_seq <= seq:
+                    break
+                if key not in latest:
+                    latest[key] = value  # 同一个键只保留最新的变更
+            upserts = {key: value for key, value in latest.items() if value is not None}
+            deletes = [key for key, value in latest.items() if value is None]
+            return ChangeSet(self.seq, self.epoch, False, upserts, deletes)
+
+    def set_merkle_arc(self, start_id: int, end_id: int) -> MerkleTree:
+        """
+        改为按弧 (start_id, end_id] 分桶，弧有变化时按现有的键重建 Merkle 树，返回当前的树。
+        节点的前驱变化时对本节点数据调用；副本对账前改用对端树的弧
+        """
+        with self._lock:
+            if self.merkle.arc != (start_id, end_id):
+                tree = MerkleTree(self.merkle.depth, (start_id, end_id))
+                for key_id in self._sorted_ids:
+                    for key in self._keys_at(key_id):
+                        tree.add(key_id, key, self._value(key))
+                self.merkle = tree
+            return self.merkle
+
+    def merkle_hashes(self, level: int, indexes, arc=None) -> list:
+        """Merkle 树某一层节点的摘要；给出 arc 而树已改用其他弧分桶时返回空列表，见 merkle.diff_buckets"""
+        with self._lock:
+            if arc is not None and tuple(arc) != self.merkle.arc:
+                return []
+            return self.merkle.hashes(level, indexes)
+
+    def keys_in_buckets(self, buckets) -> list:
+        """叶子桶覆盖环上一段连续的 ID，直接在有序 ID 上取出"""
+        with self._lock:
+            return [key for start_id, end_id in bucket_arcs(buckets, self.merkle.depth, self.merkle.arc)
+                    for key_id in self._ids_in_arc(start_id, end_id)
+                    for key in self._keys_at(key_id)]
+
+    def bucket_data(self, buckets) -> dict:
+        """返回指定叶子桶内的全部键值对"""
+        with self._lock:
+            return {key: self._value(key) for key in self.keys_in_buckets(buckets)}
+
+
+class KVStore(StoreBase, dict):
+    """
+    带变更日志的键值存储，每次修改分配一个单调递增的序号，
+    副本节点据此只拉取上次同步之后的变更；
+    同时增量维护按环上 ID 分桶的 Merkle 树，日志不足以增量同步时只对账不一致的桶；
+    键另按环上 ID 有序索引，取一段弧上的键只需二分查找加遍历结果。
+    挂接持久化后端（见 storage.DiskStorage）后每次变更同时追加到磁盘日志，commit 等待已有变更落盘
+    """
+
+    def __init__(self, max_log=MAX_CHANGE_LOG):
+        dict.__init__(self)
+        StoreBase.__init__(self, max_log)
+        self._ids = {}  # 键 -> 环上 ID，键写入时计算一次，之后的区间判断与分桶不再重新哈希
+        self._id_keys = {}  # 环上 ID -> 该 ID 上的键集合
+        self._sorted_ids = []  # 存有键的环上 ID，升序，最多 2^M 个
+
+    def key_id(self, key) -> int:
+        """返回键的环上 ID，已存储的键直接取缓存"""
+        key_id = self._ids.get(key)
+        return key_id if key_id is not None else hash_func(key)
+
+    def _keys_at(self, key_id: int):
+        return self._id_keys[key_id]
+
+    def _value(self, key):
+        return dict.__getitem__(self, key)
+
+    def _index_add(self, key, value):
+        key_id = self._ids.get(key)
+        if key_id is None:
+            key_id = self._ids[key] = hash_func(key)
+            keys = self._id_keys.get(key_id)
+            if keys is None:
+                keys = self._id_keys[key_id] = set()
+                bisect.insort(self._sorted_ids, key_id)
+            keys.add(key)
+        self.merkle.add(key_id, key, value)
+
+    def _index_remove(self, key, value):
+        key_id = self._ids[key]
+        self.merkle.remove(key_id, key, value)
+
+    def _forget_id(self, key):
+        """键被删除后从 ID 缓存与有序索引中移除"""
+        key_id = self._ids.pop(key)
+        keys = self._id_keys[key_id]
+        keys.discard(key)
+        if not keys:
+            del self._id_keys[key_id]
+            del self._sorted_ids[bisect.bisect_left(self._sorted_ids, key_id)]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if key in self and dict.__getitem__(self, key) == value:
+                return  # 值未变化时不产生变更，避免副本之间来回同步
+            if key in self:
+                self._index_remove(key, dict.__getitem__(self, key))
+            super().__setitem__(key, value)
+            self._index_add(key, value)
+            self._record(key, value, self._ids[key])
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._index_remove(key, dict.__getitem__(self, key))
+            super().__delitem__(key)
+            self._forget_id(key)
+            self._record(key, None)
+
+    def pop(self, key, *default):
+        with self._lock:
+            if key not in self:
+                return super().pop(key, *default)
+            value = super().pop(key)
+            self._index_remove(key, value)
+            self._forget_id(key)
+            self._record(key, None)
+            return value
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self.merkle.clear()
+            self._ids.clear()
+            self._id_keys.clear()
+            self._sorted_ids.clear()
+            self._record_clear()
+
+    def load(self, records, seq: int, leaves=None, arc=WHOLE_RING):
+        """
+        从快照批量载入 (环上 ID, 键, 值)，不产生变更日志；leaves 为快照中 Merkle 树按 arc 分桶的叶子摘要，
+        给出时不必逐个键重新计算摘要。载入后序号从 seq 继续，之前的变更无法增量回答
+        """
+        with self._lock:
+            self.merkle = MerkleTree(self.merkle.depth, arc)
+            for key_id, key, value in records:
+                dict.__setitem__(self, key, value)
+                self._ids[key] = key_id
+                self._id_keys.setdefault(key_id, set()).add(key)
+                if leaves is None:
+                    self.merkle.add(key_id, key, value)
+            self._sorted_ids = sorted(self._id_keys)
+            if leaves is not None:
+                self.merkle.load_leaves(leaves)
+            self.seq = self._log_floor = seq
+
+    def export(self) -> list:
+        """返回 (环上 ID, 键, 值) 列表、Merkle 树的叶子摘要与分桶的弧，供写快照"""
+        with self._lock:
+            records = [(self._ids[key], key, value) for key, value in dict.items(self)]
+            return records, list(self.merkle.levels[self.merkle.depth]), self.merkle.arc
+
+    def snapshot(self) -> dict:
+        """返回当前内容的副本，供序列化时遍历，避免与并发写入冲突"""
+        with self._lock:
+            return dict(self)
@@ -0,0 +1,147 @@
+import hashlib
+from .struct_class import M
+
+# 叶子桶数量为 2 ** BUCKET_BITS，每个桶覆盖环上一段连续的 ID
+BUCKET_BITS = 8
+RING_SIZE = 2 ** M
+# 未指定弧时按整个环分桶，桶号即环上 ID 的高 depth 位
+WHOLE_RING = (RING_SIZE - 1, RING_SIZE - 1)
+
+
+def arc_length(arc: tuple) -> int:
+    """弧 (start_id, end_id] 上的 ID 数，start_id == end_id 时为整个环"""
+    return (arc[1] - arc[0]) % RING_SIZE or RING_SIZE
+
+
+def bucket_of(key_id: int, depth: int = BUCKET_BITS, arc: tuple = WHOLE_RING) -> int:
+    """
+    计算环上 ID 所在的叶子桶编号：弧 (start_id, end_id] 均分为 2 ** depth 个桶，
+    节点只需对账自己的弧，每个桶只覆盖弧上的一小段；弧外的 ID（尚未清理的旧数据）归入最后一个桶
+    """
+    offset, length = (key_id - arc[0] - 1) % RING_SIZE, arc_length(arc)
+    if offset >= length:
+        return 2 ** depth - 1
+    return offset * 2 ** depth // length
+
+
+def bucket_range(bucket: int, depth: int = BUCKET_BITS, arc: tuple = WHOLE_RING):
+    """叶子桶覆盖的环上区间 (start_id, end_id]，与 bucket_of 一致；弧较短时部分桶不含任何 ID，返回 None"""
+    length = arc_length(arc)
+    low = -(-bucket * length // 2 ** depth)
+    high = RING_SIZE if bucket == 2 ** depth - 1 else -(-(bucket + 1) * length // 2 ** depth)
+    if low == high:
+        return None
+    return (arc[0] + low) % RING_SIZE, (arc[0] + high) % RING_SIZE
+
+
+def _in_arc(key_id: int, start_id: int, end_id: int) -> bool:
+    return (key_id - start_id - 1) % RING_SIZE < arc_length((start_id, end_id))
+
+
+def buckets_in_arc(buckets: list, start_id: int, end_id: int, depth: int = BUCKET_BITS,
+                   arc: tuple = WHOLE_RING) -> list:
+    """筛选与弧 (start_id, end_id] 有交集的叶子桶：两段弧相交当且仅当其中一段的终点落在另一段上"""
+    selected = []
+    for bucket in buckets:
+        bounds = bucket_range(bucket, depth, arc)
+        if bounds and (_in_arc(bounds[1], start_id, end_id) or _in_arc(end_id, *bounds)):
+            selected.append(bucket)
+    return selected
+
+
+def bucket_arcs(buckets: list, depth: int = BUCKET_BITS, arc: tuple = WHOLE_RING) -> list:
+    """把叶子桶合并成环上连续的弧 (start_id, end_id]，全部桶合并为整个环"""
+    arcs = []
+    for bucket in sorted(set(buckets)):
+        bounds = bucket_range(bucket, depth, arc)
+        if bounds is None:
+            continue
+        if arcs and arcs[-1][1] == bounds[0]:
+            arcs[-1] = (arcs[-1][0], bounds[1])
+        else:
+            arcs.append(bounds)
+    if len(arcs) > 1 and arcs[-1][1] == arcs[0][0]:
+        arcs[0] = (arcs.pop()[0], arcs[0][1])  # 最后一个桶止于弧的起点，与第一个桶首尾相接
+    return arcs
+
+
+def entry_hash(key: str, value: str) -> int:
+    """单个键值对的摘要"""
+    return int(hashlib.sha1(f'{key}\0{value}'.encode('utf-8')).hexdigest(), 16)
+
+
+class MerkleTree:
+    """
+    按环上 ID 分桶的 Merkle 树。每个节点的摘要是其覆盖范围内所有键值对摘要的异或，
+    因此增删一个键值对只需沿叶子到根的路径更新 depth + 1 个节点。
+    arc 为分桶的弧 (start_id, end_id]，对账的两端必须使用同一段弧，摘要才能逐个桶对比
+    """
+
+    def __init__(self, depth: int = BUCKET_BITS, arc: tuple = WHOLE_RING):
+        self.depth = depth
+        self.arc = tuple(arc)
+        self.levels = [[0] * (2 ** level) for level in range(depth + 1)]  # levels[0] 为根，levels[depth] 为叶子
+
+    def _toggle(self, key_id: int, digest: int):
+        index = bucket_of(key_id, self.depth, self.arc)
+        for level in range(self.depth, -1, -1):
+            self.levels[level][index] ^= digest
+            index >>= 1
+
+    def add(self, key_id: int, key: str, value: str):
+        self._toggle(key_id, entry_hash(key, value))
+
+    def remove(self, key_id: int, key: str, value: str):
+        self._toggle(key_id, entry_hash(key, value))  # 异或的逆运算仍是异或
+
+    def clear(self):
+        self.levels = [[0] * (2 ** level) for level in range(self.depth + 1)]
+
+    def load_leaves(self, leaves: list):
+        """由叶子摘要重建整棵树，上层节点是两个子节点的异或"""
+        self.levels[self.depth] = list(leaves)
+        for level in range(self.depth - 1, -1, -1):
+            below = self.levels[level + 1]
+            self.levels[level] = [below[2 * i] ^ below[2 * i + 1] for i in range(2 ** level)]
+
+    def root(self) -> str:
+        return self.node_hash(0, 0)
+
+    def node_hash(self, level: int, index: int) -> str:
+        return f'{self.levels[level][index]:040x}'
+
+    def hashes(self, level: int, indexes) -> list:
+        """批量返回某一层指定节点的摘要"""
+        return [self.node_hash(level, index) for index in indexes]
+
+
+def diff_buckets(tree: MerkleTree, fetch_hashes) -> list:
+    """
+    自根向下逐层对比本地树与对端树，返回摘要不一致的叶子桶编号。
+    fetch_hashes(level, indexes) 返回对端在该层对应节点的摘要，每层只需一次调用；
+    对端的树在对账途中换了分桶的弧时返回空列表，两边的桶无法再逐个对比，此时返回全部叶子桶
+    """
+    indexes = [0]
+    for level in range(tree.depth + 1):
+        remote = fetch_hashes(level, indexes)
+        if len(remote) != len(indexes):
+            return list(range(2 ** tree.depth))
+        differing = [index for index, digest in zip(indexes, remote) if digest != tree.node_hash(level, index)]
+        if not differing or level == tree.depth:
+            return differing
+        indexes = [child for index in differing for child in (2 * index, 2 * index + 1)]
+    return []
+
+
+async def diff_buckets_async(tree: MerkleTree, fetch_hashes) -> list:
+    """diff_buckets 的协程版本，fetch_hashes(level, indexes) 返回可等待对象"""
+    indexes = [0]
+    for level in range(tree.depth + 1):
+        remote = await fetch_hashes(level, indexes)
+        if len(remote) != len(indexes):
+            return list(range(2 ** tree.depth))
+        differing = [index for index, digest in zip(indexes, remote) if digest != tree.node_hash(level, index)]
+        if not differing or level == tree.depth:
+            return differing
+        indexes = [child for index in differing for child in (2 * index, 2 * index + 1)]
+    return []
@@ -0,0 +1,210 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+from .struct_class import HistogramSnapshot, NodeStats
+
+# RPC 与维护任务耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 路由跳数直方图的桶上界
+HOP_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 24, 32)
+
+
+def metric_key(name: str, labels: dict) -> str:
+    """把名称与标签拼成 Prometheus 风格的键，如 rpc_latency_seconds{method="lookup"}"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{labels[k]}"' for k in sorted(labels)) + '}'
+
+
+_keys = {}  # (名称, *标签项) -> metric_key 的结果，标签的取值有限，缓存后记录时不必每次拼接字符串
+
+
+def _cached_key(name: str, labels: dict) -> str:
+    ident = (name, *labels.items())
+    key = _keys.get(ident)
+    if key is None:
+        key = _keys[ident] = metric_key(name, labels)
+    return key
+
+
+def _split_key(key: str):
+    """metric_key 的逆过程，返回 (名称, 标签部分)，标签部分不含花括号"""
+    name, _, labels = key.partition('{')
+    return name, labels.rstrip('}')
+
+
+class Histogram:
+    """按固定上界分桶的直方图，与 Prometheus 的 histogram 一致，最后一个桶计数超过所有上界的观测值"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, times=1):
+        self.counts[bisect.bisect_left(self.bounds, value)] += times
+        self.sum += value * times
+        self.count += times
+
+    def snapshot(self) -> HistogramSnapshot:
+        return HistogramSnapshot(list(self.bounds), list(self.counts), self.sum, self.count)
+
+
+class Metrics:
+    """
+    一组计数器、瞬时值与直方图。名称可以带标签，同名不同标签的指标分别统计；
+    记录只在锁内做几次字典与列表操作，路由路径上的每次调用都可以记录
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # 键 -> 累计值
+        self.gauges = {}  # 键 -> 最近一次设置的值
+        self.histograms = {}  # 键 -> Histogram
+
+    def inc(self, name, value=1, **labels):
+        key = _cached_key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_cached_key(name, labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, times=1, **labels):
+        """记录 times 次取值为 value 的观测"""
+        key = _cached_key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value, times)
+
+    def snapshot(self, node_id: int, *others) -> NodeStats:
+        """当前各指标的副本，others 中其他 Metrics 的指标一并合入"""
+        counters, gauges, histograms = {}, {}, {}
+        for metrics in (self,) + others:
+            with metrics._lock:
+                counters.update(metrics.counters)
+                gauges.update(metrics.gauges)
+                histograms.update({key: histogram.snapshot() for key, histogram in metrics.histograms.items()})
+        return NodeStats(node_id, counters, gauges, histograms)
+
+
+_rpc_metrics = Metrics()
+
+
+def get_rpc_metrics() -> Metrics:
+    """
+    进程级的 RPC 客户端指标：connect_node 返回的客户端按 RPC 名记录调用耗时与失败次数。
+    一个进程只运行一个节点时就是该节点发出的调用，进程内模拟多个节点时为所有节点的合计
+    """
+    return _rpc_metrics
+
+
+class InstrumentedClient:
+    """包装 connect_node 返回的客户端，按 RPC 名记录每次调用的耗时，调用抛出异常时另计失败次数"""
+
+    def __init__(self, client, metrics: Metrics):
+        self._client = client
+        self._metrics = metrics
+        self.address = client.address
+        self.port = client.port
+
+    def __getattr__(self, api):
+        method = getattr(self._client, api)
+        metrics = self._metrics
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                metrics.inc('rpc_errors_total', method=api)
+                raise
+            finally:
+                metrics.observe('rpc_latency_seconds', time.perf_counter() - started, method=api)
+
+        self.__dict__[api] = call
+        return call
+
+
+class AioInstrumentedClient(InstrumentedClient):
+    """InstrumentedClient 的协程版本"""
+
+    def __getattr__(self, api):
+        method = getattr(self._client, api)
+        metrics = self._metrics
+
+        async def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            except Exception:
+                metrics.inc('rpc_errors_total', method=api)
+                raise
+            finally:
+                metrics.observe('rpc_latency_seconds', time.perf_counter() - started, method=api)
+
+        self.__dict__[api] = call
+        return call
+
+
+def render_prometheus(stats: NodeStats, prefix='chord_') -> str:
+    """把 NodeStats 转成 Prometheus 文本格式，每个指标附加 node 标签"""
+    lines = []
+    typed = set()
+
+    def add(name, kind, labels, value, suffix=''):
+        full = prefix + name
+        if full not in typed:
+            typed.add(full)
+            lines.append(f'# TYPE {full} {kind}')
+        labels = ','.join(label for label in (f'node="{stats.node_id}"', labels) if label)
+        lines.append(f'{full}{suffix}{{{labels}}} {value}')
+
+    for key, value in sorted((stats.counters or {}).items()):
+        name, labels = _split_key(key)
+        add(name, 'counter', labels, value)
+    for key, value in sorted((stats.gauges or {}).items()):
+        name, labels = _split_key(key)
+        add(name, 'gauge', labels, f'{value:g}')
+    for key, histogram in sorted((stats.histograms or {}).items()):
+        name, labels = _split_key(key)
+        cumulative = 0
+        for bound, count in zip(list(histogram.bounds) + ['+Inf'], histogram.counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else f'{bound:g}'
+            add(name, 'histogram', ','.join(label for label in (labels, f'le="{le}"') if label), cumulative, '_bucket')
+        add(name, 'histogram', labels, f'{histogram.sum:g}', '_sum')
+        add(name, 'histogram', labels, histogram.count, '_count')
+    return '\n'.join(lines) + '\n'
+
+
+def serve_prometheus(collect, address, port) -> ThreadingHTTPServer:
+    """在后台线程中提供 /metrics，collect() 返回 NodeStats"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus(collect()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 抓取请求不写入日志
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    threading.Thread(target=server.serve_forever, name='chord-metrics', daemon=True).start()
+    logger.info(f'metrics available at http://{address}:{port}/metrics')
+    return server
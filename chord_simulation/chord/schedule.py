@@ -0,0 +1,74 @@
+import random
+
+
+class TaskSchedule:
+    """
+    单个维护任务的自适应间隔：从 min_interval 开始，一轮执行没有发现变化就乘以 backoff，最多到 max_interval；
+    发现变化或邻居变动时回到 min_interval。每次等待叠加 ±jitter 比例的随机抖动，避免各节点同时发起
+    """
+
+    def __init__(self, min_interval, max_interval=None, backoff=2.0, jitter=0.1):
+        self.min_interval = min_interval
+        self.max_interval = min_interval if max_interval is None else max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.interval = min_interval  # 当前间隔
+        self.due = 0.0  # 下一次执行的时刻
+
+    def delay(self, rng: random.Random) -> float:
+        return self.interval * (1 + rng.uniform(-self.jitter, self.jitter))
+
+    def record(self, changed: bool, now, rng: random.Random):
+        """记录一轮执行的结果并安排下一次执行"""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        self.due = now + self.delay(rng)
+
+    def reset(self, now, rng: random.Random):
+        """回到最短间隔，已经排在更晚时刻的下一次执行相应提前"""
+        self.interval = self.min_interval
+        self.due = min(self.due, now + self.delay(rng))
+
+
+class MaintenanceSchedule:
+    """
+    一个节点各项维护任务的调度表，只决定哪些任务到期，不负责计时：
+    线程实现由定时器、协程实现由事件循环、离散事件模拟由虚拟时钟驱动
+    """
+
+    def __init__(self, tasks: dict, backoff=2.0, jitter=0.1, rng: random.Random = None):
+        # 任务名 -> TaskSchedule，到期的任务按 tasks 中的顺序执行
+        self.tasks = {name: TaskSchedule(min_interval, max_interval, backoff, jitter)
+                      for name, (min_interval, max_interval) in tasks.items()}
+        self.rng = rng or random.Random()
+
+    def start(self, now, spread=False):
+        """
+        安排各任务的第一次执行：默认在一个间隔之后；
+        spread 为 True 时在 [now, now + 间隔) 内均匀分布，同时启动的大量节点不会同步执行
+        """
+        for task in self.tasks.values():
+            task.due = now + (self.rng.uniform(0, task.interval) if spread else task.delay(self.rng))
+
+    def due(self, now) -> list:
+        """到期的任务名"""
+        return [name for name, task in self.tasks.items() if task.due <= now]
+
+    def next_due(self):
+        """最早到期的时刻，没有任务时返回 None"""
+        return min((task.due for task in self.tasks.values()), default=None)
+
+    def record(self, name, changed: bool, now):
+        task = self.tasks.get(name)
+        if task is not None:
+            task.record(changed, now, self.rng)
+
+    def reset(self, now):
+        """邻居发生变化：所有任务回到最短间隔"""
+        for task in self.tasks.values():
+            task.reset(now, self.rng)
+
+    def remove(self, name):
+        self.tasks.pop(name, None)
@@ -0,0 +1,291 @@
+import glob
+import mmap
+import os
+import struct
+import threading
+import zlib
+from loguru import logger
+from .compact_store import CompactKVStore
+from .kv_store import KVStore
+from .merkle import WHOLE_RING
+
+# 日志超过该字节数、且超过上一次快照的大小时写一份压缩后的快照并删除旧日志段，写放大不超过常数倍
+SNAPSHOT_LOG_BYTES = 64 * 1024 * 1024
+
+SNAPSHOT_MAGIC = b'CHORDSN2'
+_SNAPSHOT_HEADER = struct.Struct('<8sQIIHH')  # 魔数, 快照对应的序号, Merkle 叶子数, 键数, Merkle 分桶的弧
+# 旧版快照没有记录分桶的弧，其中的叶子摘要按整个环分桶
+_SNAPSHOT_MAGIC_V1 = b'CHORDSN1'
+_SNAPSHOT_HEADER_V1 = struct.Struct('<8sQII')
+_SNAPSHOT_RECORD = struct.Struct('<HII')  # 环上 ID, 键长, 值长
+_LEAF_BYTES = 20  # Merkle 叶子摘要为 160 位的 SHA-1 异或
+_LOG_RECORD = struct.Struct('<IQBHII')  # CRC32, 序号, 操作, 环上 ID, 键长, 值长；CRC 覆盖其后的全部字节
+_PUT, _DELETE, _CLEAR = 0, 1, 2
+
+# 内存中的存储实现：dict 为每个键保留独立的 str 对象，compact 把键值紧凑地编码在 arena 中
+STORE_CLASSES = {
+    'dict': KVStore,
+    'compact': CompactKVStore,
+}
+
+
+def store_name(node_id: int, place: str) -> str:
+    """节点某个存储区在数据目录中的文件名前缀"""
+    return f'{node_id}-{place}'
+
+
+class MemoryStorage:
+    """默认的存储后端：数据只在内存中，进程重启后为空，需要经由 update_data 从邻居重新同步"""
+
+    def __init__(self, store_class=KVStore):
+        self.store_class = store_class
+
+    def open(self, name: str) -> KVStore:
+        return self.store_class()
+
+    def close(self):
+        pass
+
+
+class DiskStorage:
+    """
+    数据目录中每个存储区一份快照加若干追加写的日志段，启动时先映射快照再重放其后的日志，
+    重启不需要经过网络重新拉取数据
+    """
+
+    def __init__(self, directory: str, snapshot_log_bytes=SNAPSHOT_LOG_BYTES, store_class=KVStore):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_log_bytes = snapshot_log_bytes
+        self.store_class = store_class
+        self._logs = []
+
+    def open(self, name: str) -> KVStore:
+        log = DurableLog(os.path.join(self.directory, name), self.snapshot_log_bytes, self.store_class)
+        self._logs.append(log)
+        return log.open()
+
+    def close(self):
+        """把尚未落盘的变更写完后关闭全部日志"""
+        for log in self._logs:
+            log.close()
+
+
+class DurableLog:
+    """
+    一个 KVStore 的持久化：变更先追加到内存缓冲，后台线程批量写入当前日志段后 fsync（组提交），
+    一次 fsync 期间到达的写入在下一次一起提交；日志足够大时在另一个线程中写快照并删除旧日志段。
+    文件：<path>.snapshot 与 <path>.<起始序号>.log
+    """
+
+    def __init__(self, path: str, snapshot_log_bytes=SNAPSHOT_LOG_BYTES, store_class=KVStore):
+        self.path = path
+        self.snapshot_log_bytes = snapshot_log_bytes
+        self.store_class = store_class
+        self.store = None
+        self._cond = threading.Condition()
+        self._pending = []  # 已编码、尚未写入的日志记录
+        self._pending_seq = 0  # 缓冲中最后一条记录的序号
+        self._durable_seq = 0  # 已 fsync 的最大序号
+        self._closed = False
+        self._file = None
+        self._log_bytes = 0  # 上一次快照之后写入日志的字节数
+        self._snapshot_bytes = 0
+        self._snapshotting = False
+        self._committer = None
+
+    def _segment_path(self, start_seq: int) -> str:
+        return f'{self.path}.{start_seq:020d}.log'
+
+    def _segments(self) -> list:
+        return sorted(glob.glob(glob.escape(self.path) + '.*.log'))
+
+    def open(self) -> KVStore:
+        """载入快照与日志，之后的变更都写入新的日志段"""
+        store = self.store_class()
+        seq = self._load_snapshot(store)
+        replayed = 0
+        for segment in self._segments():
+            replayed += self._replay(store, segment)
+        self._log_bytes = sum(os.path.getsize(segment) for segment in self._segments())
+        if seq or replayed:
+            logger.info(f'{self.path}: restored {len(store)} keys at seq {store.seq} '
+                        f'({replayed} changes replayed from the log)')
+        self.store = store
+        self._durable_seq = self._pending_seq = store.seq
+        self._file = open(self._segment_path(store.seq + 1), 'ab')
+        store.backend = self
+        self._committer = threading.Thread(target=self._run, name=f'chord-log-{os.path.basename(self.path)}',
+                                           daemon=True)
+        self._committer.start()
+        return store
+
+    def _load_snapshot(self, store: KVStore) -> int:
+        """通过内存映射读取快照，键的环上 ID 与 Merkle 叶子摘要直接取自快照，返回快照对应的序号"""
+        path = self.path + '.snapshot'
+        if not os.path.exists(path):
+            return 0
+        self._snapshot_bytes = os.path.getsize(path)
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:len(SNAPSHOT_MAGIC)] == _SNAPSHOT_MAGIC_V1:
+                _, seq, leaf_count, count = _SNAPSHOT_HEADER_V1.unpack_from(buf, 0)
+                arc, offset = WHOLE_RING, _SNAPSHOT_HEADER_V1.size
+            else:
+                magic, seq, leaf_count, count, *arc = _SNAPSHOT_HEADER.unpack_from(buf, 0)
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError(f'{path} is not a snapshot')
+                offset = _SNAPSHOT_HEADER.size
+            leaves = [int.from_bytes(buf[offset + i * _LEAF_BYTES:offset + (i + 1) * _LEAF_BYTES], 'big')
+                      for i in range(leaf_count)]
+            offset += leaf_count * _LEAF_BYTES
+            if leaf_count != len(store.merkle.levels[store.merkle.depth]):
+                leaves = None  # 分桶方式变了，按键重新计算摘要
+
+            def records():
+                position = offset
+                unpack = _SNAPSHOT_RECORD.unpack_from
+                for _ in range(count):
+                    key_id, key_length, value_length = unpack(buf, position)
+                    position += _SNAPSHOT_RECORD.size
+                    key = str(buf[position:position + key_length], 'utf-8')
+                    position += key_length
+                    yield key_id, key, str(buf[position:position + value_length], 'utf-8')
+                    position += value_length
+
+            store.load(records(), seq, leaves, tuple(arc))
+        return seq
+
+    def _replay(self, store: KVStore, segment: str) -> int:
+        """按序重放一个日志段中快照之后的变更；末尾写了一半的记录说明崩溃前未提交，到此为止"""
+        replayed = 0
+        with open(segment, 'rb') as f:
+            data = f.read()
+        position = 0
+        while position + _LOG_RECORD.size <= len(data):
+            crc, seq, op, key_id, key_length, value_length = _LOG_RECORD.unpack_from(data, position)
+            end = position + _LOG_RECORD.size + key_length + value_length
+            if end > len(data) or zlib.crc32(data[position + 4:end]) != crc:
+                break
+            body = data[position + _LOG_RECORD.size:end]
+            position = end
+            if seq <= store.seq:
+                continue  # 已包含在快照中
+            if op == _CLEAR:
+                store.clear()
+            elif op == _DELETE:
+                store.pop(str(body, 'utf-8'), None)
+            else:
+                store[str(body[:key_length], 'utf-8')] = str(body[key_length:], 'utf-8')
+            store.seq = seq
+            replayed += 1
+        if position < len(data):
+            logger.warning(f'{segment}: torn record at offset {position}, truncating the segment')
+            os.truncate(segment, position)  # 之后可能继续向这个日志段追加
+        return replayed
+
+    def append(self, seq: int, key_id: int, key, value):
+        """在 KVStore 的锁内调用，只编码并放入缓冲，由后台线程写盘"""
+        if key is None:
+            op, key_bytes, value_bytes = _CLEAR, b'', b''
+        elif value is None:
+            op, key_bytes, value_bytes = _DELETE, key.encode('utf-8'), b''
+        else:
+            op, key_bytes, value_bytes = _PUT, key.encode('utf-8'), value.encode('utf-8')
+        body = _LOG_RECORD.pack(0, seq, op, key_id, len(key_bytes), len(value_bytes))[4:] + key_bytes + value_bytes
+        with self._cond:
+            self._pending.append(struct.pack('<I', zlib.crc32(body)) + body)
+            self._pending_seq = seq
+            self._cond.notify_all()
+
+    def commit(self, seq: int):
+        """等待序号 seq 及之前的变更落盘"""
+        with self._cond:
+            while self._durable_seq < seq and not self._closed:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, seq = self._pending, self._pending_seq
+                self._pending = []
+            self._write(batch)
+            with self._cond:
+                self._durable_seq = seq
+                self._cond.notify_all()
+            if (not self._snapshotting and self._log_bytes > self.snapshot_log_bytes
+                    and self._log_bytes > self._snapshot_bytes):
+                self._rotate()
+
+    def _write(self, batch: list):
+        data = b''.join(batch)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._log_bytes += len(data)
+
+    def _rotate(self):
+        """
+        在 KVStore 的锁内复制内容并切换到新的日志段，快照恰好包含新日志段之前的全部变更；
+        快照在另一个线程中写出，期间的提交不受影响
+        """
+        with self.store._lock:
+            records, leaves, arc = self.store.export()
+            seq = self.store.seq
+            with self._cond:
+                batch, self._pending = self._pending, []
+        self._write(batch)
+        self._file.close()
+        old_segments = self._segments()
+        self._file = open(self._segment_path(seq + 1), 'ab')
+        self._log_bytes = 0
+        with self._cond:
+            self._durable_seq = max(self._durable_seq, seq)
+            self._cond.notify_all()
+        self._snapshotting = True
+        threading.Thread(target=self._write_snapshot, args=(records, leaves, arc, seq, old_segments),
+                         name=f'chord-snapshot-{os.path.basename(self.path)}', daemon=True).start()
+
+    def _write_snapshot(self, records: list, leaves: list, arc: tuple, seq: int, old_segments: list):
+        path, tmp = self.path + '.snapshot', self.path + '.snapshot.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, seq, len(leaves), len(records), *arc))
+                f.write(b''.join(leaf.to_bytes(_LEAF_BYTES, 'big') for leaf in leaves))
+                pack = _SNAPSHOT_RECORD.pack
+                for key_id, key, value in records:
+                    key_bytes, value_bytes = key.encode('utf-8'), value.encode('utf-8')
+                    f.write(pack(key_id, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            _fsync_directory(os.path.dirname(path))
+            self._snapshot_bytes = os.path.getsize(path)
+            for segment in old_segments:
+                os.remove(segment)  # 快照落盘之后旧日志段才可以删除
+            logger.info(f'{self.path}: wrote snapshot of {len(records)} keys at seq {seq}')
+        except OSError as e:
+            logger.warning(f'{self.path}: snapshot failed, keeping the log: {e}')
+        finally:
+            self._snapshotting = False
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._committer is not None:
+            self._committer.join()
+        if self._file is not None:
+            self._file.close()
+
+
+def _fsync_directory(directory: str):
+    """rename 之后同步目录项，断电后不会丢失新文件名"""
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
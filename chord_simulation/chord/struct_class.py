@@ -18,17 +18,84 @@ chord_thrift = thriftpy2.load(thrift_path, module_name='chord_thrift')
 class KVStatus(chord_thrift.KVStatus):
     VALID = chord_thrift.KVStatus.VALID  # 有效状态
     NOT_FOUND = chord_thrift.KVStatus.NOT_FOUND  # 未找到状态
+    UNAVAILABLE = chord_thrift.KVStatus.UNAVAILABLE  # 应答的副本数不足写入或读取的法定数
 
 
 # 定义 KeyValueResult 类，继承自 Thrift 生成的 KeyValueResult 类
 class KeyValueResult(chord_thrift.KeyValueResult):
-    def __init__(self, key: str, value: str, node_id: int, status: KVStatus = KVStatus.VALID):
-        # 初始化 KeyValueResult，设置键、值、节点 ID 和状态
-        super().__init__(key, value, node_id, status)
+    def __init__(self, key: str, value: str, node_id: int, status: KVStatus = KVStatus.VALID, hops: int = 0,
+                 trace: list = None):
+        # 初始化 KeyValueResult，设置键、值、节点 ID、状态、请求从当前节点转发到归属节点经过的跳数以及追踪到的路径
+        super().__init__(key, value, node_id, status, hops, trace)
 
 
 # 定义 Node 类，继承自 Thrift 生成的 Node 类
 class Node(chord_thrift.Node):
     def __init__(self, node_id: int, address: str, port: int, valid: bool = True):
         # 初始化 Node，设置节点 ID、地址、端口和有效性
-        super().__init__(node_id, address, port, valid)
\ No newline at end of file
+        super().__init__(node_id, address, port, valid)
+
+
+# 定义 TraceContext 类，继承自 Thrift 生成的 TraceContext 类
+class TraceContext(chord_thrift.TraceContext):
+    def __init__(self, trace_id: str, sent_at: float = 0.0):
+        # 初始化 TraceContext，设置追踪 ID 以及上一跳发出请求的时刻（time.time()）
+        super().__init__(trace_id, sent_at)
+
+
+# 定义 TraceHop 类，继承自 Thrift 生成的 TraceHop 类
+class TraceHop(chord_thrift.TraceHop):
+    def __init__(self, node_id: int, finger_index: int = -1, queue_time: float = 0.0, service_time: float = 0.0):
+        # 初始化 TraceHop，设置经过的节点 ID、选择下一跳所用的 finger 下标（-1 表示没有使用 finger）、
+        # 请求从上一跳发出到本节点开始处理的时间以及本节点自身的处理时间（不含等待下一跳的时间），单位为秒
+        super().__init__(node_id, finger_index, queue_time, service_time)
+
+
+# 定义 RouteResult 类，继承自 Thrift 生成的 RouteResult 类
+class RouteResult(chord_thrift.RouteResult):
+    def __init__(self, node: Node, trace: list):
+        # 初始化 RouteResult，设置 find_successor 找到的节点以及追踪到的路径
+        super().__init__(node, trace)
+
+
+# 定义 ChangeSet 类，继承自 Thrift 生成的 ChangeSet 类
+class ChangeSet(chord_thrift.ChangeSet):
+    def __init__(self, seq: int, epoch: str, resync: bool, upserts: dict, deletes: list):
+        # 初始化 ChangeSet，设置截至的序号、存储实例标识、是否需要重新对账、新增或修改的键值对以及删除的键
+        super().__init__(seq, epoch, resync, upserts, deletes)
+
+
+# 定义 KeyRange 类，继承自 Thrift 生成的 KeyRange 类
+class KeyRange(chord_thrift.KeyRange):
+    def __init__(self, data: dict, last_id: int, done: bool):
+        # 初始化 KeyRange，设置本块的键值对、本块最后一个环上 ID 以及区间是否已取完
+        super().__init__(data, last_id, done)
+
+
+# 定义 ScanPage 类，继承自 Thrift 生成的 ScanPage 类
+class ScanPage(chord_thrift.ScanPage):
+    def __init__(self, data: dict, cursor: str, done: bool, codec: str = None, payload: bytes = None):
+        # 初始化 ScanPage，设置本页的键值对、下一页的游标（本页最后一个键的位置）、是否已取完，
+        # 以及压缩时使用的算法与压缩后的键值对（此时 data 为空）
+        super().__init__(data, cursor, done, codec, payload)
+
+
+# 定义 LeaveReport 类，继承自 Thrift 生成的 LeaveReport 类
+class LeaveReport(chord_thrift.LeaveReport):
+    def __init__(self, keys: int = 0, bytes: int = 0, chunks: int = 0, duration: float = 0.0, complete: bool = False):
+        # 初始化 LeaveReport，设置移交的键数、字节数、数据块数、耗时（秒）以及是否完整移交
+        super().__init__(keys, bytes, chunks, duration, complete)
+
+
+# 定义 HistogramSnapshot 类，继承自 Thrift 生成的 HistogramSnapshot 类
+class HistogramSnapshot(chord_thrift.HistogramSnapshot):
+    def __init__(self, bounds: list, counts: list, sum: float = 0.0, count: int = 0):
+        # 初始化 HistogramSnapshot，设置各桶的上界、各桶的计数（最后一项为超过所有上界的计数）、观测值之和与观测次数
+        super().__init__(bounds, counts, sum, count)
+
+
+# 定义 NodeStats 类，继承自 Thrift 生成的 NodeStats 类
+class NodeStats(chord_thrift.NodeStats):
+    def __init__(self, node_id: int, counters: dict, gauges: dict, histograms: dict):
+        # 初始化 NodeStats，设置节点 ID、计数器、瞬时值与直方图，名称带 Prometheus 风格的标签
+        super().__init__(node_id, counters, gauges, histograms)
@@ -0,0 +1,134 @@
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from thriftpy2.server import TServer
+from thriftpy2.thrift import TProcessor
+from thriftpy2.transport import TServerSocket, TTransportException
+from loguru import logger
+
+# 默认工作线程数；路由请求会在工作线程中同步调用其他节点，线程数需大于预期的并发路由深度
+DEFAULT_WORKERS = 32
+# 默认的 accept 队列长度
+DEFAULT_BACKLOG = 128
+
+
+class _Connection:
+    """服务端的一条客户端连接"""
+
+    def __init__(self, server, client):
+        self.client = client
+        self.itrans = server.itrans_factory.get_transport(client)
+        self.otrans = server.otrans_factory.get_transport(client)
+        self.iprot = server.iprot_factory.get_protocol(self.itrans)
+        self.oprot = server.oprot_factory.get_protocol(self.otrans)
+        self.last_active = time.monotonic()
+
+    def fileno(self):
+        return self.client.sock.fileno()
+
+    def close(self):
+        self.itrans.close()
+        self.otrans.close()
+
+
+class TThreadPoolServer(TServer):
+    """
+    线程池服务器：主线程用 selector 等待连接上的请求，有请求到达时交给工作线程处理一次调用，
+    处理完再把连接放回 selector。空闲的长连接（例如连接池中的连接）不占用工作线程，
+    同时在处理的请求数受工作线程数限制。
+    假设客户端是同步调用（收到响应前不会发送下一个请求），不支持流水线请求。
+    """
+
+    def __init__(self, *args, workers=DEFAULT_WORKERS, **kwargs):
+        TServer.__init__(self, *args, **kwargs)
+        self.workers = workers
+        self.closed = False
+        self._executor = None
+        self._selector = None
+        self._ready = []  # 处理完请求、等待放回 selector 的连接
+        self._ready_lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()  # 工作线程通过它唤醒主线程
+
+    def serve(self):
+        self.trans.listen()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='chord-worker')
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.trans.sock, selectors.EVENT_READ, None)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, self._wakeup_r)
+        try:
+            while not self.closed:
+                for key, _ in self._selector.select(timeout=1):
+                    if key.data is None:
+                        self._accept()
+                    elif key.data is self._wakeup_r:
+                        self._wakeup_r.recv(4096)
+                    else:
+                        # 处理期间不再监听该连接，避免同一连接被多个工作线程同时读取
+                        self._selector.unregister(key.fileobj)
+                        self._executor.submit(self._process, key.data)
+                self._rearm()
+                self._close_idle()
+        finally:
+            self._selector.close()
+            self._executor.shutdown(wait=False)
+
+    def _accept(self):
+        try:
+            client = self.trans.accept()
+        except OSError as e:
+            logger.warning(e)
+            return
+        conn = _Connection(self, client)
+        self._selector.register(conn, selectors.EVENT_READ, conn)
+
+    def _process(self, conn):
+        try:
+            self.processor.process(conn.iprot, conn.oprot)
+        except (TTransportException, OSError):
+            conn.close()  # 客户端关闭连接或读写超时
+            return
+        except Exception as x:
+            logger.exception(x)
+            conn.close()
+            return
+        conn.last_active = time.monotonic()
+        with self._ready_lock:
+            self._ready.append(conn)
+        self._wakeup_w.send(b'\0')
+
+    def _rearm(self):
+        with self._ready_lock:
+            ready, self._ready = self._ready, []
+        for conn in ready:
+            self._selector.register(conn, selectors.EVENT_READ, conn)
+
+    def _close_idle(self):
+        """关闭空闲时间超过 client_timeout 的连接"""
+        timeout = self.trans.client_timeout
+        if not timeout:
+            return
+        now = time.monotonic()
+        for key in list(self._selector.get_map().values()):
+            conn = key.data
+            if isinstance(conn, _Connection) and now - conn.last_active > timeout:
+                self._selector.unregister(conn)
+                conn.close()
+
+    def close(self):
+        self.closed = True
+        self._wakeup_w.send(b'\0')
+
+
+def make_thread_pool_server(service, handler, host="localhost", port=9090, workers=DEFAULT_WORKERS,
+                            backlog=DEFAULT_BACKLOG, client_timeout=3000, processor=None, proto_factory=None,
+                            trans_factory=None):
+    """
+    创建线程池服务器，参数与 thriftpy2.rpc.make_server 保持一致，proto_factory 与 trans_factory 为 None 时使用
+    binary 协议与 buffered 传输；processor 不为 None 时代替 TProcessor(service, handler)
+    """
+    processor = processor or TProcessor(service, handler)
+    server_socket = TServerSocket(host=host, port=port, client_timeout=client_timeout, backlog=backlog)
+    return TThreadPoolServer(processor, server_socket, workers=workers, iprot_factory=proto_factory,
+                             itrans_factory=trans_factory)
@@ -0,0 +1,177 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+# 时间轮的刻度（秒），定时任务最多推迟一个刻度执行
+TICK = 0.01
+# 每层时间轮的槽数与层数：第 k 层每个槽覆盖 SLOTS^k 个刻度，四层可覆盖约 46 小时，更远的定时放在最高层最后一个槽中
+SLOTS = 64
+LEVELS = 4
+# 执行到期回调的工作线程数；维护任务会同步发起 RPC，连接失效节点时阻塞一个连接超时
+DEFAULT_TIMER_WORKERS = 8
+
+
+class TimerHandle:
+    """schedule 返回的句柄，cancel 之后回调不会再被执行"""
+
+    __slots__ = ('expires', 'callback', 'cancelled', '_wheel', '_slot')
+
+    def __init__(self, wheel, expires, callback):
+        self.expires = expires  # 到期的刻度
+        self.callback = callback
+        self.cancelled = False
+        self._wheel = wheel
+        self._slot = None  # 当前所在的槽，已到期或取消时为 None
+
+    def cancel(self):
+        with self._wheel._lock:
+            self.cancelled = True
+            if self._slot is not None:
+                self._slot.discard(self)
+                self._slot = None
+                self._wheel._pending -= 1
+                self._wheel._lock.notify()  # 驱动线程重新计算下一次唤醒的时刻
+
+
+class TimerWheel:
+    """
+    进程级的分层时间轮：一个驱动线程按刻度推进，到期的回调交给少量工作线程执行。
+    一个进程中的所有节点共用它安排维护任务，节点数再多也只占用固定数量的线程。
+    插入与取消都是 O(1)，低层时间轮转完一圈时把高层对应槽中的定时逐层下放（cascade）
+    """
+
+    def __init__(self, tick=TICK, workers=DEFAULT_TIMER_WORKERS):
+        self.tick = tick
+        self.workers = workers
+        self._lock = threading.Condition()
+        self._wheels = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self._started = time.monotonic()
+        self._current = 0  # 下一个待处理的刻度
+        self._pending = 0  # 尚未到期的定时数
+        self._executor = None
+        self._thread = None
+
+    def schedule(self, delay, callback) -> TimerHandle:
+        """delay 秒之后在工作线程中执行 callback()，返回可以取消的句柄"""
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            now = (time.monotonic() - self._started) / self.tick
+            if self._pending == 0:
+                # 空闲时驱动线程不按刻度空转，从当前时刻继续
+                self._current = max(self._current, int(now))
+            expires = max(math.ceil(now + max(delay, 0.0) / self.tick), self._current)
+            handle = TimerHandle(self, expires, callback)
+            self._add(handle)
+            self._pending += 1
+            self._lock.notify()
+        return handle
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='chord-timer')
+        self._thread = threading.Thread(target=self._run, name='chord-timer-wheel', daemon=True)
+        self._thread.start()
+
+    def _add(self, handle: TimerHandle):
+        """按距离当前刻度的远近放入对应层的槽，调用方持有锁"""
+        delta = min(handle.expires - self._current, SLOTS ** LEVELS - 1)
+        level = 0
+        while delta >= SLOTS ** (level + 1):
+            level += 1
+        slot = self._wheels[level][((self._current + delta) // SLOTS ** level) % SLOTS]
+        slot.add(handle)
+        handle._slot = slot
+
+    def _cascade(self):
+        """
+        低层时间轮转完一圈，把高层当前槽中的定时重新放入低层；
+        高层的索引也回到 0 时继续下放更高一层，调用方持有锁
+        """
+        for level in range(1, LEVELS):
+            index = (self._current // SLOTS ** level) % SLOTS
+            slot = self._wheels[level][index]
+            self._wheels[level][index] = set()
+            for handle in slot:
+                self._add(handle)
+            if index != 0:
+                break
+
+    def _advance(self) -> list:
+        """处理当前刻度，返回到期的定时，调用方持有锁"""
+        if self._current % SLOTS == 0:
+            self._cascade()
+        index = self._current % SLOTS
+        expired = self._wheels[0][index]
+        self._wheels[0][index] = set()
+        self._current += 1
+        self._pending -= len(expired)
+        for handle in expired:
+            handle._slot = None
+        return [handle for handle in expired if not handle.cancelled]
+
+    def _next_due(self) -> int:
+        """
+        下一个需要处理的刻度，调用方持有锁：第 0 层覆盖从当前刻度起的 SLOTS 个刻度，取其中最早的非空槽；
+        以及下一个要下放的第 1 层槽非空（或更高层也要下放）的整圈刻度，取两者中较早的
+        """
+        due = None
+        for tick in range(self._current, self._current + SLOTS):
+            if self._wheels[0][tick % SLOTS]:
+                due = tick
+                break
+        boundary = -(-self._current // SLOTS) * SLOTS  # 不早于当前刻度的第一个整圈刻度
+        while due is None or boundary < due:
+            index = (boundary // SLOTS) % SLOTS
+            if index == 0 or self._wheels[1][index]:
+                return boundary
+            boundary += SLOTS
+        return due
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    if self._pending == 0:
+                        self._lock.wait()
+                        continue
+                    # 睡到下一个有定时到期或需要下放的刻度，schedule 与 cancel 会提前唤醒重新计算
+                    now = (time.monotonic() - self._started) / self.tick
+                    due = self._next_due()
+                    if due <= now:
+                        break
+                    self._lock.wait((due - now) * self.tick)
+                now = int((time.monotonic() - self._started) / self.tick)
+                expired = []
+                while self._current <= now:
+                    expired.extend(self._advance())
+            for handle in expired:
+                self._executor.submit(self._fire, handle)
+
+    @staticmethod
+    def _fire(handle: TimerHandle):
+        if handle.cancelled:
+            return
+        try:
+            handle.callback()
+        except Exception as e:
+            logger.warning(f'timer callback failed: {e!r}')
+
+    def __len__(self):
+        """尚未到期的定时数"""
+        with self._lock:
+            return self._pending
+
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+
+def get_timer_wheel() -> TimerWheel:
+    """返回进程级的时间轮，第一次安排定时时启动驱动线程与工作线程"""
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = TimerWheel()
+        return _wheel
@@ -0,0 +1,44 @@
+import time
+import uuid
+from .struct_class import TraceContext, TraceHop
+
+
+def new_trace() -> TraceContext:
+    """客户端发起一次被追踪的请求时创建追踪上下文"""
+    return TraceContext(uuid.uuid4().hex, time.time())
+
+
+class Span:
+    """
+    一次被追踪的路由请求在本节点上的记录。排队时间是上一跳发出请求到本节点开始处理的间隔，
+    包括网络传输、服务端排队与连接池等待，按各节点的 time.time() 计算，跨机器时受时钟偏差影响；
+    处理时间是本节点开始处理到返回之间扣除等待下一跳的部分
+    """
+
+    __slots__ = ('node_id', 'trace_id', 'started', 'queue_time', 'finger_index', 'waited', 'downstream', '_sent')
+
+    def __init__(self, node_id: int, trace: TraceContext):
+        self.node_id = node_id
+        self.trace_id = trace.trace_id
+        self.started = time.time()
+        self.queue_time = max(self.started - trace.sent_at, 0.0) if trace.sent_at else 0.0
+        self.finger_index = -1  # 选择下一跳所用的 finger 下标，没有转发或没有使用 finger 时为 -1
+        self.waited = 0.0  # 等待下一跳返回的时间
+        self.downstream = []  # 下一跳返回的路径
+        self._sent = None
+
+    def forward(self, finger_index: int) -> TraceContext:
+        """把请求转发给下一跳之前调用，返回交给下一跳的追踪上下文"""
+        self.finger_index = finger_index
+        self._sent = time.time()
+        return TraceContext(self.trace_id, self._sent)
+
+    def returned(self, downstream):
+        """下一跳返回后调用，downstream 为下一跳返回的路径"""
+        self.waited += time.time() - self._sent
+        self.downstream = list(downstream or [])
+
+    def finish(self) -> list:
+        """本节点处理完毕，返回从本节点开始的完整路径"""
+        service_time = max(time.time() - self.started - self.waited, 0.0)
+        return [TraceHop(self.node_id, self.finger_index, self.queue_time, service_time)] + self.downstream
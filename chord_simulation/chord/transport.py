@@ -0,0 +1,177 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from thriftpy2.thrift import TApplicationException
+from loguru import logger
+from .connection_pool import connect
+
+# 并发写入、读取副本的工作线程数；凑齐法定数之后其余调用仍在这些线程中完成
+FAN_OUT_WORKERS = 32
+
+
+class ThriftTransport:
+    """
+    默认传输方式：每个节点是独立的 Thrift 服务端，通过进程级连接池访问。
+    一个服务端承载多个虚拟节点时，本进程中的虚拟节点注册为本地节点，相互之间直接调用对象方法而不经过 socket
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}  # (address, port, vnode) -> 本进程承载的节点对象
+        self._local_clients = {}  # (address, port, vnode) -> 指向本地节点的客户端代理
+        self._executor = None  # 并发访问副本的线程池，首次使用时创建
+
+    def register(self, address, port, node, vnode=None):
+        """登记本进程承载的节点，其他节点在本进程中访问它时直接调用对象方法"""
+        with self._lock:
+            self._local[(address, port, vnode)] = node
+            self._local_clients.pop((address, port, vnode), None)
+
+    def connect(self, service, address, port, vnode=None):
+        if self._local:
+            key = (address, port, vnode)
+            with self._lock:
+                node = self._local.get(key)
+                client = self._local_clients.get(key)
+                if node is not None and (client is None or client._service is not service):
+                    client = self._local_clients[key] = LoopbackClient(service, node, address, port)
+            if node is not None:
+                return client
+        return connect(service, address, port, vnode)
+
+    def call_quorum(self, calls: list, needed: int) -> list:
+        """
+        并发执行 calls 中的无参调用，返回值不为 None 视为成功，返回 None 或抛出异常视为失败。
+        凑齐 needed 个成功或全部结束时返回已成功的结果（按完成顺序），其余调用在后台继续完成。
+        需要等待时第一个调用直接在当前线程中执行，其余的交给线程池，少一次线程切换
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix='chord-fan-out')
+        inline = calls[0] if calls and needed > 0 else None
+        pending = {self._executor.submit(call) for call in (calls[1:] if inline else calls)}
+        results = []
+        if inline is not None:
+            try:
+                result = inline()
+            except Exception:
+                result = None
+            if result is not None:
+                results.append(result)
+        while pending and len(results) < needed:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results.extend(future.result() for future in done
+                           if future.exception() is None and future.result() is not None)
+        return results
+
+
+class LoopbackClient:
+    """
+    进程内的客户端代理，按 RPC 名直接调用目标节点对象的同名方法。
+    参数与返回值不经过序列化，节点之间共享同一对象，节点不修改收到的参数与返回值即可保持与 Thrift 一致的语义。
+    on_call(api) 在每次调用前执行，供模拟网络统计调用次数与时延
+    """
+
+    def __init__(self, service, node, address, port, on_call=None):
+        self._service = service
+        self._node = node
+        self._on_call = on_call
+        self.address = address
+        self.port = port
+
+    def __getattr__(self, api):
+        if api not in self._service.thrift_services:
+            raise AttributeError(f"{self.__class__.__name__} instance has no attribute '{api}'")
+        method = getattr(self._node, api)
+        on_call = self._on_call
+
+        def call(*args, **kwargs):
+            if on_call is not None:
+                on_call(api)
+            try:
+                return method(*args, **kwargs)
+            except TApplicationException:
+                raise
+            except Exception as e:
+                # 与 Thrift 一致，调用方只能看到远端调用失败，看不到服务端的异常类型
+                raise TApplicationException(TApplicationException.INTERNAL_ERROR,
+                                            f'{api} failed on {self.address}:{self.port}: {e!r}') from e
+
+        self.__dict__[api] = call  # 缓存到实例上，之后的调用不再经过 __getattr__
+        return call
+
+
+class InMemoryTransport:
+    """
+    进程内传输：节点对象按 (address, port, vnode) 注册，connect 直接返回调用节点对象的代理，
+    不创建 socket 和服务端线程，可以在一个进程中模拟上千个节点。
+    vnode 为同一地址上虚拟节点的 ID，第 0 个虚拟节点与未启用虚拟节点的节点一样以 None 注册。
+    注销的节点视为离线
+    """
+
+    compress_payloads = False  # 调用不经过网络，批量数据不压缩，见 compression.enabled_codecs
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nodes = {}  # (address, port, vnode) -> 节点对象
+        self._clients = {}  # (address, port, vnode) -> 指向该节点的客户端代理，节点注册期间复用
+
+    def register(self, address, port, node, vnode=None):
+        with self._lock:
+            self._nodes[(address, port, vnode)] = node
+            self._clients.pop((address, port, vnode), None)
+
+    def unregister(self, address, port, vnode=None):
+        with self._lock:
+            self._clients.pop((address, port, vnode), None)
+            return self._nodes.pop((address, port, vnode), None)
+
+    def node_at(self, address, port, vnode=None):
+        """返回注册在指定地址的节点对象，不存在时返回 None"""
+        with self._lock:
+            return self._nodes.get((address, port, vnode))
+
+    def nodes(self) -> list:
+        with self._lock:
+            return list(self._nodes.values())
+
+    def _make_client(self, service, node, address, port):
+        return LoopbackClient(service, node, address, port)
+
+    def connect(self, service, address, port, vnode=None):
+        key = (address, port, vnode)
+        with self._lock:
+            node = self._nodes.get(key)
+            client = self._clients.get(key)
+            if node is not None and (client is None or client._service is not service):
+                client = self._clients[key] = self._make_client(service, node, address, port)
+        if node is None:
+            logger.warning(f'node {address}:{port} is not registered' if vnode is None else
+                           f'virtual node {vnode} at {address}:{port} is not registered')
+            return None
+        return client
+
+    def call_quorum(self, calls: list, needed: int) -> list:
+        """依次执行全部调用并返回成功的结果，进程内的调用没有网络时延，按顺序执行使结果可复现"""
+        results = []
+        for call in calls:
+            try:
+                result = call()
+            except Exception:
+                continue
+            if result is not None:
+                results.append(result)
+        return results
+
+
+_transport = ThriftTransport()
+
+
+def get_transport():
+    """返回当前进程中节点之间使用的传输方式"""
+    return _transport
+
+
+def set_transport(transport):
+    """替换当前进程中节点之间使用的传输方式，需在创建节点之前调用"""
+    global _transport
+    _transport = transport
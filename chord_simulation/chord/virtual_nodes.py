@@ -0,0 +1,70 @@
+from thriftpy2.thrift import TApplicationException, TMultiplexedProcessor, TProcessor, TType
+from .chord_base import vnode_id
+from .transport import get_transport
+
+# 每个服务端默认承载的虚拟节点数，为 1 时与未启用虚拟节点时完全一致
+DEFAULT_VNODES = 1
+
+
+class VirtualNodeProcessor(TProcessor):
+    """
+    一个 Thrift 服务端承载多个虚拟节点：RPC 名带 '<虚拟节点 ID>:' 前缀时交给对应的虚拟节点处理，
+    不带前缀时交给第 0 个虚拟节点，未启用虚拟节点的客户端照常访问。前缀由 connect_node 按节点 ID 添加
+    """
+
+    def __init__(self, service, nodes: list):
+        super().__init__(service, nodes[0])
+        self._handlers = {str(node.node_id): node for node in nodes}
+
+    def process_in(self, iprot):
+        api, _, seqid = iprot.read_message_begin()
+        handler = self._handler
+        vnode, separator, name = api.rpartition(TMultiplexedProcessor.SEPARATOR)
+        if separator:
+            handler, api = self._handlers.get(vnode), name
+        if handler is None or api not in self._service.thrift_services:
+            iprot.skip(TType.STRUCT)
+            iprot.read_message_end()
+            return api, seqid, TApplicationException(TApplicationException.UNKNOWN_METHOD), None
+
+        args = getattr(self._service, api + "_args")()
+        args.read(iprot)
+        iprot.read_message_end()
+        result = getattr(self._service, api + "_result")()
+        api_args = [item[1] for item in args.thrift_spec.values()]  # 按 IDL 中声明的顺序传参
+        method = getattr(handler, api)
+
+        def call():
+            return method(*(args.__dict__[k] for k in api_args))
+
+        return api, seqid, result, call
+
+
+def colocate(nodes: list):
+    """
+    把同一服务端上的虚拟节点互相登记为 siblings，并注册到当前传输方式，相互之间的调用不经过 socket。
+    第 0 个虚拟节点加入环后，其余虚拟节点经由它加入，见 BaseChordNode._join_siblings
+    """
+    transport = get_transport()
+    for node in nodes:
+        node.siblings = [other for other in nodes if other is not node]
+        vnode = None if node.vnode_index == 0 else node.node_id
+        transport.register(node.self_node.address, node.self_node.port, node, vnode)
+    nodes[0]._unjoined_siblings = list(nodes[1:])
+    return nodes
+
+
+def make_virtual_nodes(node_class, address, port, count=DEFAULT_VNODES, storage=None) -> list:
+    """
+    在 address:port 上创建 count 个虚拟节点，ID 互不相同，共用同一个存储后端；
+    count 为 1 时只有第 0 个虚拟节点，不做登记
+    """
+    nodes, ids = [], set()
+    index = 0
+    while len(nodes) < count:
+        node_id = vnode_id(address, port, index)
+        if node_id not in ids:  # 环上只有 2^M 个 ID，同一服务端的两个虚拟节点可能冲突
+            ids.add(node_id)
+            nodes.append(node_class(address, port, vnode_index=index, storage=storage))
+        index += 1
+    return colocate(nodes) if count > 1 else nodes
@@ -0,0 +1,69 @@
+from thriftpy2.contrib.aio.protocol.binary import TAsyncBinaryProtocolFactory
+from thriftpy2.contrib.aio.protocol.compact import TAsyncCompactProtocolFactory
+from thriftpy2.contrib.aio.transport.buffered import TAsyncBufferedTransportFactory
+from thriftpy2.contrib.aio.transport.framed import TAsyncFramedTransportFactory
+from thriftpy2.protocol import TBinaryProtocolFactory, TCompactProtocolFactory
+from thriftpy2.transport import TBufferedTransportFactory, TFramedTransportFactory
+
+# Thrift 协议：名称 -> (同步版本, 协程版本) 的工厂类。binary 有 Cython 实现；compact 的整数按变长编码，
+# 消息更小，但 thriftpy2 中只有纯 Python 实现，编解码更耗 CPU
+PROTOCOLS = {
+    'binary': (TBinaryProtocolFactory, TAsyncBinaryProtocolFactory),
+    'compact': (TCompactProtocolFactory, TAsyncCompactProtocolFactory),
+}
+# Thrift 传输层：buffered 直接在字节流上收发；framed 每条消息前加 4 字节长度，便于对端按帧读取
+TRANSPORTS = {
+    'buffered': (TBufferedTransportFactory, TAsyncBufferedTransportFactory),
+    'framed': (TFramedTransportFactory, TAsyncFramedTransportFactory),
+}
+
+
+class WireFormat:
+    """
+    一条 Thrift 连接使用的协议与传输层。两端必须一致：服务端按启动参数选择，
+    客户端默认使用本进程的设置，也可以为个别地址单独指定，见 set_wire_format
+    """
+
+    def __init__(self, protocol='binary', transport='buffered'):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f'unknown protocol {protocol!r}, expected one of {list(PROTOCOLS)}')
+        if transport not in TRANSPORTS:
+            raise ValueError(f'unknown transport {transport!r}, expected one of {list(TRANSPORTS)}')
+        self.protocol = protocol
+        self.transport = transport
+
+    def protocol_factory(self, aio=False):
+        return PROTOCOLS[self.protocol][aio]()
+
+    def transport_factory(self, aio=False):
+        return TRANSPORTS[self.transport][aio]()
+
+    def __eq__(self, other):
+        return isinstance(other, WireFormat) and (self.protocol, self.transport) == (other.protocol, other.transport)
+
+    def __hash__(self):
+        return hash((self.protocol, self.transport))
+
+    def __repr__(self):
+        return f'{self.protocol}/{self.transport}'
+
+
+_default = WireFormat()
+_overrides = {}  # (address, port) -> 该地址单独使用的格式
+
+
+def get_wire_format(address=None, port=None) -> WireFormat:
+    """返回连接指定地址时使用的格式，没有单独指定时为本进程的默认格式"""
+    return _overrides.get((address, port), _default)
+
+
+def set_wire_format(wire: WireFormat, address=None, port=None):
+    """
+    设置本进程连接其他节点时使用的格式；给出地址时只对该地址生效，用于与格式不同的服务端通信。
+    只影响之后新建的连接，需在访问其他节点之前调用
+    """
+    global _default
+    if address is None:
+        _default = wire
+    else:
+        _overrides[(address, port)] = wire
@@ -0,0 +1,72 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+from loguru import logger
+from ..chord.chord_base import READ_QUORUM, REPLICATION_FACTOR, WRITE_QUORUM, check_replication
+from ..implement.chord_basic_query import ChordNode as ChordNodeBasicQuery
+from ..implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+from .network import LatencyModel, run_with_deep_stack
+from .simulator import ChordSimulator
+
+parser = argparse.ArgumentParser(description='discrete-event simulation of a chord ring with churn.')
+parser.add_argument('-t', '--task_type', type=str, default='finger_table',
+                    choices=['basic_query', 'finger_table'],
+                    help='simulation type:[basic_query|finger_table]')
+parser.add_argument('-n', '--num_nodes', type=int, default=1000)
+parser.add_argument('-k', '--key_nums', type=int, default=1000)
+parser.add_argument('-d', '--duration', type=float, default=60, help='virtual seconds to run before waiting for convergence')
+parser.add_argument('--joins', type=int, default=0, help='nodes joining during the churn window')
+parser.add_argument('--leaves', type=int, default=0, help='nodes leaving gracefully during the churn window')
+parser.add_argument('--crashes', type=int, default=0, help='nodes crashing during the churn window')
+parser.add_argument('--churn_start', type=float, default=5)
+parser.add_argument('--churn_end', type=float, default=None, help='defaults to --duration')
+parser.add_argument('--lookup_rate', type=float, default=10, help='random lookups per virtual second')
+parser.add_argument('--latency', type=str, default='lognormal:0.005,0.5',
+                    help='rpc round trip time distribution, e.g. constant:0.001, uniform:0.001,0.01, '
+                         'exponential:0.005, lognormal:0.005,0.5 (median, sigma)')
+parser.add_argument('--interval', type=float, default=None,
+                    help='fixed virtual seconds between runs of every maintenance task, '
+                         'defaults to the adaptive per-task schedule')
+parser.add_argument('--replicas', type=int, default=REPLICATION_FACTOR,
+                    help='replication factor N: copies of each key, on its owner and the next N-1 successors')
+parser.add_argument('--write_quorum', type=int, default=WRITE_QUORUM,
+                    help='copies W, counting the owner, that must acknowledge a put before it returns')
+parser.add_argument('--read_quorum', type=int, default=READ_QUORUM,
+                    help='copies R, counting the owner, read by a lookup before it returns')
+parser.add_argument('--max_settle', type=float, default=300, help='virtual seconds to wait for convergence after churn')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('-o', '--output', type=str, default=None, help='write the json report to this file')
+parser.add_argument('-v', '--verbose', action='store_true', help='keep node logs and prints')
+
+
+def main():
+    args = parser.parse_args()
+    try:
+        check_replication(args.replicas, args.write_quorum, args.read_quorum)
+    except ValueError as e:
+        parser.error(str(e))
+    node_class = ChordNodeBasicQuery if args.task_type == 'basic_query' else ChordNodeFingerTable
+    replication = {'replicas': args.replicas, 'write_quorum': args.write_quorum, 'read_quorum': args.read_quorum}
+    simulator = ChordSimulator(node_class, LatencyModel.parse(args.latency), interval=args.interval, seed=args.seed,
+                               replication=replication)
+    if not args.verbose:
+        # 上万个节点的日志与打印会淹没结果，也会拖慢模拟
+        logger.remove()
+        logger.add(sys.stderr, level='ERROR')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        report = run_with_deep_stack(simulator.run, args.num_nodes, num_keys=args.key_nums, duration=args.duration,
+                                     joins=args.joins, leaves=args.leaves, crashes=args.crashes,
+                                     churn_start=args.churn_start, churn_end=args.churn_end,
+                                     lookup_rate=args.lookup_rate, max_settle=args.max_settle)
+    report['task_type'] = args.task_type
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
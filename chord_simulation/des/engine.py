@@ -0,0 +1,65 @@
+import heapq
+import itertools
+
+
+class Event:
+    """事件队列中的一个事件，cancel 后不再执行"""
+
+    __slots__ = ('time', 'seq', 'callback', 'args', 'cancelled')
+
+    def __init__(self, time, seq, callback, args):
+        self.time = time
+        self.seq = seq  # 同一时刻的事件按加入顺序执行，保证结果可复现
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return (self.time, self.seq) < (other.time, other.seq)
+
+
+class EventLoop:
+    """
+    离散事件引擎：按虚拟时间顺序依次执行事件，事件之间不消耗真实时间，
+    每个事件在其时刻内原子地执行完毕
+    """
+
+    def __init__(self):
+        self.now = 0.0  # 当前虚拟时间（秒）
+        self._queue = []
+        self._seq = itertools.count()
+
+    def schedule(self, delay: float, callback, *args) -> Event:
+        """在 delay 秒（虚拟时间）之后执行 callback(*args)"""
+        return self.schedule_at(self.now + max(delay, 0.0), callback, *args)
+
+    def schedule_at(self, time: float, callback, *args) -> Event:
+        event = Event(max(time, self.now), next(self._seq), callback, args)
+        heapq.heappush(self._queue, event)
+        return event
+
+    def run(self, until: float = None, stop=None):
+        """
+        执行事件直到队列为空、虚拟时间超过 until，或 stop() 返回 True；
+        返回停止时的虚拟时间
+        """
+        while self._queue:
+            event = self._queue[0]
+            if until is not None and event.time > until:
+                break
+            heapq.heappop(self._queue)
+            if event.cancelled:
+                continue
+            self.now = event.time
+            event.callback(*event.args)
+            if stop is not None and stop():
+                return self.now
+        if until is not None:
+            self.now = max(self.now, until)
+        return self.now
+
+    def __len__(self):
+        return len(self._queue)
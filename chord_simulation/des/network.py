@@ -0,0 +1,139 @@
+import math
+import random
+import sys
+import threading
+from collections import Counter
+from ..chord.connection_pool import SOCKET_TIMEOUT
+from ..chord.transport import InMemoryTransport, LoopbackClient
+
+
+class LatencyModel:
+    """
+    RPC 往返时延的分布，sample 返回一次调用的时延（秒）
+    kind: constant(value) | uniform(low, high) | exponential(mean) | lognormal(median, sigma)
+    """
+
+    KINDS = ('constant', 'uniform', 'exponential', 'lognormal')
+
+    def __init__(self, kind='constant', *params):
+        if kind not in self.KINDS:
+            raise ValueError(f'unknown latency distribution {kind}, expected one of {self.KINDS}')
+        self.kind = kind
+        self.params = [float(p) for p in params] or [0.001]
+
+    @classmethod
+    def parse(cls, spec: str):
+        """从形如 'lognormal:0.01,0.5' 的字符串构造"""
+        kind, _, params = spec.partition(':')
+        return cls(kind, *(p for p in params.split(',') if p))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'constant':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == 'exponential':
+            return rng.expovariate(1 / self.params[0])
+        return rng.lognormvariate(math.log(self.params[0]), self.params[1])
+
+    def __repr__(self):
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+
+class SimulatedTransport(InMemoryTransport):
+    """
+    模拟网络的进程内传输：调用本身立即执行，同时按时延分布为当前操作累计虚拟耗时。
+    由于嵌套的 RPC 在真实网络中也是串行等待的，一次操作的耗时即为其间所有调用时延之和，
+    并发访问副本的调用除外，见 call_quorum。
+    连接未注册（离开或崩溃）的节点时计入一次连接超时
+    """
+
+    record_rpc_metrics = False  # 调用次数与耗时按虚拟时间在这里统计，connect_address 不再按墙上时间记录
+
+    def __init__(self, latency: LatencyModel, rng: random.Random, connect_timeout=SOCKET_TIMEOUT / 1000):
+        super().__init__()
+        self.latency = latency
+        self.rng = rng
+        self.connect_timeout = connect_timeout
+        self.total_rpcs = Counter()  # 整个模拟期间各 RPC 的调用次数
+        self._op_rpcs = Counter()  # 当前操作内各 RPC 的调用次数
+        self._op_elapsed = 0.0  # 当前操作累计的虚拟耗时
+
+    def begin(self):
+        """开始统计一次操作"""
+        self._op_rpcs = Counter()
+        self._op_elapsed = 0.0
+
+    def end(self):
+        """结束统计，返回 (各 RPC 调用次数, 虚拟耗时)"""
+        return self._op_rpcs, self._op_elapsed
+
+    def record_rpc(self, api):
+        self._op_rpcs[api] += 1
+        self.total_rpcs[api] += 1
+        self._op_elapsed += self.latency.sample(self.rng)
+
+    def _make_client(self, service, node, address, port):
+        return LoopbackClient(service, node, address, port, on_call=self.record_rpc)
+
+    def call_quorum(self, calls: list, needed: int) -> list:
+        """
+        依次执行全部调用，但按并发计时：各调用从同一时刻出发，操作只等到第 needed 个成功的调用返回
+        （成功的不足 needed 个时等到全部返回），而不是累加所有调用的时延
+        """
+        started = self._op_elapsed
+        succeeded, elapsed = [], []  # succeeded: (调用耗时, 结果)
+        for call in calls:
+            self._op_elapsed = 0.0
+            try:
+                result = call()
+            except Exception:
+                result = None
+            elapsed.append(self._op_elapsed)
+            if result is not None:
+                succeeded.append((self._op_elapsed, result))
+        succeeded.sort(key=lambda item: item[0])
+        if len(succeeded) >= needed:
+            # 凑齐 needed 个成功时返回，与并发执行时一样只带回最快的 needed 个结果
+            succeeded = succeeded[:needed]
+            waited = succeeded[-1][0] if succeeded else 0.0
+        else:
+            waited = max(elapsed, default=0.0)
+        self._op_elapsed = started + waited
+        return [result for _, result in succeeded]
+
+    def connect(self, service, address, port, vnode=None):
+        if self.node_at(address, port, vnode) is None:
+            self._op_elapsed += self.connect_timeout
+            return None
+        return super().connect(service, address, port, vnode)
+
+
+# 在进程内执行路由时，每一跳都是一层嵌套调用，上万节点的环需要很深的调用栈
+DEEP_STACK_SIZE = 512 * 1024 * 1024
+DEEP_RECURSION_LIMIT = 1000000
+
+
+def run_with_deep_stack(func, *args, **kwargs):
+    """在栈空间足够大的线程中执行 func 并返回其结果，异常原样抛出"""
+    result = {}
+
+    def target():
+        try:
+            result['value'] = func(*args, **kwargs)
+        except BaseException as e:
+            result['error'] = e
+
+    old_limit = sys.getrecursionlimit()
+    old_size = threading.stack_size(DEEP_STACK_SIZE)
+    sys.setrecursionlimit(max(old_limit, DEEP_RECURSION_LIMIT))
+    try:
+        thread = threading.Thread(target=target, name='chord-des')
+        thread.start()
+        thread.join()
+    finally:
+        threading.stack_size(old_size)
+        sys.setrecursionlimit(old_limit)
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
@@ -0,0 +1,372 @@
+import bisect
+import contextlib
+import random
+import time
+from ..chord.chord_base import SUCCESSOR_LIST_SIZE, chord_thrift, hash_func
+from ..chord.struct_class import KVStatus
+from ..chord.transport import get_transport, set_transport
+from .engine import EventLoop
+from .network import LatencyModel, SimulatedTransport
+
+
+def without_timer(node_class):
+    """返回不启动定时器的节点子类，周期任务改由模拟器按虚拟时钟调度"""
+    return type(node_class.__name__, (node_class,), {'_start_periodic_tasks': lambda self: None})
+
+
+def percentile(sorted_values, q):
+    """已排序序列的 q 分位数（0 <= q <= 100），空序列返回 None"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(values):
+    """返回均值、p50、p99 与最大值"""
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p99': None, 'max': None}
+    return {'count': len(values), 'mean': sum(values) / len(values),
+            'p50': percentile(values, 50), 'p99': percentile(values, 99), 'max': values[-1]}
+
+
+class ChordSimulator:
+    """
+    用离散事件驱动现有的 ChordNode 实现：节点对象运行在进程内，RPC 经 SimulatedTransport 直接调用，
+    每个节点的维护任务（_stabilize、_fix_fingers、update_data 等）按节点自己的调度表以虚拟时钟驱动，
+    加入、离开与崩溃按计划在指定的虚拟时刻发生。
+    一轮维护任务或一次查找在其事件时刻内原子执行，耗时为其间 RPC 时延之和，下一轮不早于本轮耗时结束
+    """
+
+    def __init__(self, node_class, latency: LatencyModel = None, interval=None, seed=0, address='localhost',
+                 base_port=50000, replication: dict = None):
+        self.node_class = without_timer(node_class)
+        self.interval = interval  # 每项维护任务的固定虚拟间隔（秒），None 时使用节点的自适应调度
+        self.replication = replication or {}  # 节点的 configure_replication 参数，未给出的使用默认值
+        self.rng = random.Random(seed)
+        self.loop = EventLoop()
+        self.transport = SimulatedTransport(latency or LatencyModel('constant', 0.001), self.rng)
+        self.address = address
+        self._next_port = base_port
+        self.alive = {}  # node_id -> 节点对象
+        self._ticks = {}  # node_id -> 该节点下一轮周期任务的事件
+        self.data = {}  # 写入环中的键值对，用于检查数据丢失
+        self._keys = []  # data 的键列表，供随机查找抽样
+        self.lookups = []  # (虚拟时刻, 跳数, 虚拟耗时, 是否正确)
+        self.puts = []  # (虚拟耗时, 是否成功)
+        self.churn = {'joined': 0, 'left': 0, 'crashed': 0}
+        self.leave_reports = []  # 主动离开的节点返回的数据移交报告
+        self.last_churn = 0.0  # 最后一次加入/离开/崩溃的虚拟时刻
+
+    # ---- 节点 ----
+
+    def _new_node(self):
+        """创建一个 ID 未被占用的节点并注册到模拟网络"""
+        while True:
+            self._next_port += 1
+            node_id = hash_func(f'{self.address}:{self._next_port}')
+            if node_id not in self.alive:
+                break
+        node = self.node_class(self.address, self._next_port)
+        node._clock = lambda: self.loop.now
+        node._wake_maintenance = lambda: self._wake(node)
+        tasks = None if self.interval is None else {name: (self.interval, self.interval)
+                                                      for name in node.maintenance_tasks}
+        node.configure_maintenance(tasks, rng=self.rng)
+        node.configure_replication(**self.replication)
+        self.transport.register(self.address, self._next_port, node)
+        self.alive[node.node_id] = node
+        return node
+
+    def _remove_node(self, node):
+        self.transport.unregister(node.self_node.address, node.self_node.port)
+        self.alive.pop(node.node_id, None)
+        tick = self._ticks.pop(node.node_id, None)
+        if tick is not None:
+            tick.cancel()
+
+    def client(self, node):
+        """返回经模拟网络访问 node 的客户端"""
+        return self.transport.connect(chord_thrift.ChordNode, node.self_node.address, node.self_node.port)
+
+    def _start_ticks(self, node):
+        """以随机相位开始节点的维护任务，避免所有节点在同一时刻执行"""
+        node._maintenance.start(self.loop.now, spread=True)
+        self._ticks[node.node_id] = self.loop.schedule_at(node._maintenance.next_due(), self._tick, node)
+
+    def _tick(self, node):
+        if node.node_id not in self.alive or self.alive[node.node_id] is not node:
+            return
+        self.transport.begin()
+        next_due = node._run_periodic_tasks()
+        _, elapsed = self.transport.end()
+        if next_due is None:
+            self._ticks.pop(node.node_id, None)
+            return
+        self._ticks[node.node_id] = self.loop.schedule_at(max(next_due, self.loop.now + elapsed), self._tick, node)
+
+    def _wake(self, node):
+        """节点的维护任务被 RPC 提前（邻居变动）时，把它的下一轮相应提前"""
+        tick = self._ticks.get(node.node_id)
+        next_due = node._maintenance.next_due()
+        if tick is None or next_due is None or tick.time <= next_due:
+            return
+        tick.cancel()
+        self._ticks[node.node_id] = self.loop.schedule_at(next_due, self._tick, node)
+
+    def _sorted_ids(self):
+        return sorted(self.alive)
+
+    def owner_of(self, key_id, ids=None):
+        """按当前存活节点计算 key_id 的正确归属节点 ID"""
+        ids = ids if ids is not None else self._sorted_ids()
+        index = bisect.bisect_left(ids, key_id)
+        return ids[index % len(ids)]
+
+    # ---- 建环与负载 ----
+
+    def bootstrap(self, num_nodes):
+        """
+        直接按排序后的 ID 设置前驱、后继、后继列表与 finger table，得到已收敛的初始环，
+        上万节点时逐个 join 需要 O(N^2) 次路由，初始环不经过协议构建
+        """
+        nodes = [self._new_node() for _ in range(num_nodes)]
+        ids = self._sorted_ids()
+        position = {node_id: index for index, node_id in enumerate(ids)}
+        for node in nodes:
+            index = position[node.node_id]
+            node.successor = self.alive[ids[(index + 1) % len(ids)]].self_node
+            node.predecessor = self.alive[ids[index - 1]].self_node
+            node.successor_list = [self.alive[ids[(index + i) % len(ids)]].self_node
+                                   for i in range(1, min(SUCCESSOR_LIST_SIZE, len(ids) - 1) + 1)]
+            finger_table = getattr(node, 'finger_table', None)
+            if finger_table is not None:
+                for finger in finger_table:
+                    finger[1] = self.alive[self.owner_of(finger[0], ids)].self_node
+        for node in nodes:
+            self._start_ticks(node)
+        return nodes
+
+    def _measure(self, call):
+        """执行一次操作，返回 (结果, 各 RPC 调用次数, 虚拟耗时)，操作失败时结果为 None"""
+        self.transport.begin()
+        try:
+            result = call()
+        except Exception:
+            result = None
+        rpcs, elapsed = self.transport.end()
+        return result, rpcs, elapsed
+
+    def put(self, key, value, entry=None):
+        """
+        从 entry（默认随机节点）写入一个键值对，返回 (是否成功, 各 RPC 调用次数, 虚拟耗时)；
+        副本的写入确认不足写法定数时不算成功
+        """
+        entry = entry or self.rng.choice(list(self.alive.values()))
+        result, rpcs, elapsed = self._measure(lambda: self.client(entry).put(key, value))
+        if key not in self.data:
+            self._keys.append(key)
+        self.data[key] = value
+        succeeded = result is not None and result.status == KVStatus.VALID
+        self.puts.append((elapsed, succeeded))
+        return succeeded, rpcs, elapsed
+
+    def lookup(self, key, entry=None):
+        """从 entry（默认随机节点）查找一个键，返回 (结果是否正确, 各 RPC 调用次数, 虚拟耗时)"""
+        entry = entry or self.rng.choice(list(self.alive.values()))
+        result, rpcs, elapsed = self._measure(lambda: self.client(entry).lookup(key))
+        correct = result is not None and result.status == KVStatus.VALID and result.value == self.data.get(key)
+        return correct, rpcs, elapsed
+
+    def put_keys(self, num_keys, prefix='key'):
+        """通过随机节点写入 num_keys 个键值对"""
+        nodes = list(self.alive.values())
+        for i in range(num_keys):
+            self.put(f'{prefix}-{i}', f'value-{i}', self.rng.choice(nodes))
+
+    def schedule_lookups(self, rate, start, end):
+        """在 [start, end) 内按泊松过程发起随机查找，rate 为每虚拟秒的查找次数"""
+        at = start + self.rng.expovariate(rate)
+        while at < end:
+            self.loop.schedule_at(at, self._lookup)
+            at += self.rng.expovariate(rate)
+
+    def _lookup(self):
+        if not self.alive or not self.data:
+            return
+        correct, rpcs, elapsed = self.lookup(self.rng.choice(self._keys))
+        self.lookups.append((self.loop.now, max(rpcs['lookup'] - 1, 0), elapsed, correct))
+
+    # ---- 节点变动 ----
+
+    def schedule_join(self, at):
+        self.loop.schedule_at(at, self._join)
+
+    def schedule_leave(self, at):
+        self.loop.schedule_at(at, self._leave)
+
+    def schedule_crash(self, at):
+        self.loop.schedule_at(at, self._crash)
+
+    def schedule_churn(self, joins, leaves, crashes, start, end):
+        """在 [start, end) 内均匀随机地安排加入、主动离开与崩溃"""
+        for count, schedule in ((joins, self.schedule_join), (leaves, self.schedule_leave),
+                                (crashes, self.schedule_crash)):
+            for _ in range(count):
+                schedule(self.rng.uniform(start, end))
+
+    def _join(self):
+        bootstrap = self.rng.choice(list(self.alive.values())).self_node
+        node = self._new_node()
+        self.transport.begin()
+        try:
+            self.client(node).join(bootstrap)
+        except Exception:
+            self._remove_node(node)  # 加入失败的节点视为没有加入
+            return
+        self._start_ticks(node)
+        self.churn['joined'] += 1
+        self.last_churn = self.loop.now
+
+    def _leave(self):
+        if len(self.alive) <= 2:
+            return
+        node = self.rng.choice(list(self.alive.values()))
+        self.transport.begin()
+        try:
+            report = self.client(node).leave_network()
+        except Exception:
+            report = None  # 离开过程出错时节点仍然退出，相当于崩溃
+        if report is not None:
+            self.leave_reports.append(report)
+            if not report.complete:
+                return  # 数据没能移交的节点放弃离开，留在环中
+        self._remove_node(node)
+        self.churn['left'] += 1
+        self.last_churn = self.loop.now
+
+    def _crash(self):
+        if len(self.alive) <= 2:
+            return
+        self._remove_node(self.rng.choice(list(self.alive.values())))
+        self.churn['crashed'] += 1
+        self.last_churn = self.loop.now
+
+    # ---- 检查 ----
+
+    def ring_state(self):
+        """返回后继与前驱都正确的节点比例，以及 finger 指向正确归属节点的比例"""
+        ids = self._sorted_ids()
+        pointers_ok = fingers_ok = fingers = 0
+        for index, node_id in enumerate(ids):
+            node = self.alive[node_id]
+            if node.successor.node_id == ids[(index + 1) % len(ids)] and \
+                    node.predecessor.valid and node.predecessor.node_id == ids[index - 1]:
+                pointers_ok += 1
+            for start, finger in getattr(node, 'finger_table', ()):
+                fingers += 1
+                fingers_ok += finger is not None and finger.node_id == self.owner_of(start, ids)
+        return pointers_ok / len(ids), (fingers_ok / fingers if fingers else None)
+
+    def converged(self):
+        return self.ring_state()[0] == 1.0
+
+    def check_data(self):
+        """
+        lost 为任何存活节点的本地存储都没有的键（已不可恢复），
+        unreachable 为通过环查找不到正确值的键，misplaced 为不在正确归属节点本地存储中的键
+        """
+        ids = self._sorted_ids()
+        stored = set()
+        for node in self.alive.values():
+            stored.update(node.kv_store.keys())
+        lost = unreachable = misplaced = 0
+        nodes = list(self.alive.values())
+        for key, value in self.data.items():
+            if key not in stored:
+                lost += 1
+            if self.alive[self.owner_of(hash_func(key), ids)].kv_store.get(key) != value:
+                misplaced += 1
+            try:
+                result = self.client(self.rng.choice(nodes)).lookup(key)
+                if result.status != KVStatus.VALID or result.value != value:
+                    unreachable += 1
+            except Exception:
+                unreachable += 1
+        return {'keys': len(self.data), 'lost': lost, 'unreachable': unreachable, 'misplaced': misplaced}
+
+    # ---- 运行 ----
+
+    @contextlib.contextmanager
+    def installed(self):
+        """在上下文内把模拟网络设为进程的传输方式，节点内部通过 connect_node 访问其他节点"""
+        previous_transport = get_transport()
+        set_transport(self.transport)
+        try:
+            yield self
+        finally:
+            set_transport(previous_transport)
+
+    def settle(self, check_interval=1.0, max_settle=300.0):
+        """继续运行直到环收敛（最多 max_settle 秒），返回收敛时的虚拟时刻，未收敛返回 None"""
+        deadline = self.loop.now + max_settle
+        while not self.converged():
+            if self.loop.now >= deadline:
+                return None
+            self.loop.run(until=self.loop.now + check_interval)
+        return self.loop.now
+
+    def run(self, num_nodes, num_keys=1000, duration=60.0, joins=0, leaves=0, crashes=0, churn_start=5.0,
+            churn_end=None, lookup_rate=10.0, check_interval=1.0, max_settle=300.0):
+        """
+        建立 num_nodes 个节点的环并写入 num_keys 个键，在 [churn_start, churn_end) 内安排节点变动，
+        运行 duration 秒后继续运行直到环收敛（最多再运行 max_settle 秒），返回统计报告
+        """
+        wall_start = time.perf_counter()
+        churn_end = duration if churn_end is None else churn_end
+        with self.installed():
+            self.bootstrap(num_nodes)
+            self.put_keys(num_keys)
+            self.schedule_churn(joins, leaves, crashes, churn_start, churn_end)
+            if lookup_rate > 0:
+                self.schedule_lookups(lookup_rate, 0.0, duration)
+            self.loop.run(until=duration)
+
+            # 节点变动结束后周期检查环是否收敛
+            settle_start = max(self.last_churn, churn_start if joins + leaves + crashes else 0.0)
+            converged_at = self.settle(check_interval, max_settle)
+            pointers_ok, fingers_ok = self.ring_state()
+            data = self.check_data()
+        wall_time = time.perf_counter() - wall_start
+
+        return {
+            'nodes': {'initial': num_nodes, 'final': len(self.alive), **self.churn},
+            'virtual_time': self.loop.now,
+            'wall_time': wall_time,
+            'speedup': self.loop.now / wall_time if wall_time else None,
+            'latency_model': repr(self.transport.latency),
+            'convergence': {
+                'converged': converged_at is not None,
+                'time_after_churn': converged_at - settle_start if converged_at is not None else None,
+                'pointers_correct': pointers_ok,
+                'fingers_correct': fingers_ok,
+            },
+            'puts': {
+                'failed': sum(1 for put in self.puts if not put[1]),
+                'latency': summarize([put[0] for put in self.puts]),
+            },
+            'lookups': {
+                'failed': sum(1 for lookup in self.lookups if not lookup[3]),
+                'hops': summarize([lookup[1] for lookup in self.lookups]),
+                'latency': summarize([lookup[2] for lookup in self.lookups]),
+            },
+            'data': data,
+            'handoff': {
+                'leaves': len(self.leave_reports),
+                'incomplete': sum(1 for report in self.leave_reports if not report.complete),
+                'keys': sum(report.keys for report in self.leave_reports),
+                'bytes': sum(report.bytes for report in self.leave_reports),
+            },
+            'rpcs': dict(self.transport.total_rpcs),
+        }
@@ -1,10 +1,92 @@
 namespace py chord
 
+enum KVStatus {
+    VALID, NOT_FOUND, UNAVAILABLE
+}
+
+struct KeyValueResult {
+    1: string key,
+    2: string value,
+    3: i32 node_id,
+    4: KVStatus status,
+    5: i32 hops,
+    6: list<TraceHop> trace,
+}
+
+struct Node {
+    1: i32 node_id,
+    2: string address,
+    3: i32 port,
+    4: bool valid,
+}
+
+struct ChangeSet {
+    1: i64 seq,
+    2: string epoch,
+    3: bool resync,
+    4: map<string, string> upserts,
+    5: list<string> deletes,
+}
+
+struct KeyRange {
+    1: map<string, string> data,
+    2: i32 last_id,
+    3: bool done,
+}
+
+struct LeaveReport {
+    1: i32 keys,
+    2: i64 bytes,
+    3: i32 chunks,
+    4: double duration,
+    5: bool complete,
+}
+
+struct HistogramSnapshot {
+    1: list<double> bounds,
+    2: list<i64> counts,
+    3: double sum,
+    4: i64 count,
+}
+
+struct NodeStats {
+    1: i32 node_id,
+    2: map<string, i64> counters,
+    3: map<string, double> gauges,
+    4: map<string, HistogramSnapshot> histograms,
+}
+
+struct TraceContext {
+    1: string trace_id,
+    2: double sent_at,
+}
+
+struct TraceHop {
+    1: i32 node_id,
+    2: i32 finger_index,
+    3: double queue_time,
+    4: double service_time,
+}
+
+struct RouteResult {
+    1: Node node,
+    2: list<TraceHop> trace,
+}
+
+struct ScanPage {
+    1: map<string, string> data,
+    2: string cursor,
+    3: bool done,
+    4: string codec,
+    5: binary payload,
+}
+
+// 服务声明放在所有结构体之后：thriftpy2 无法解析服务签名中 list<Node> 这类容器元素的前向引用
 service ChordNode {
-    KeyValueResult lookup(1: string key),
+    KeyValueResult lookup(1: string key, 2: TraceContext trace),
     Node find_successor(1: i32 key_id),
     Node find_finger(1: i32 key_id),
-    KeyValueResult put(1: string key, 2: string value),
+    KeyValueResult put(1: string key, 2: string value, 3: TraceContext trace),
     KeyValueResult do_put(1: string key, 2: string value, 3: string place),
     void join(1: Node node),
     void notify(1: Node node),
@@ -15,29 +97,31 @@ service ChordNode {
     void check_and_clean_data(),
     void update_successor_kv_store(),
     void update_predecessor_kv_store(),
-    void leave_network(),
+    LeaveReport leave_network(),
     void update_predecessor(1: Node predecessor),
     void update_successor(1: Node successor),
     void pause_stability_tests(),
     void resume_stability_tests(),
-    Node check_predecessor()
+    Node check_predecessor(),
+    ChangeSet get_changes_since(1: string place, 2: i64 seq, 3: string epoch),
+    list<i32> get_merkle_arc(1: string place),
+    list<string> get_merkle_hashes(1: string place, 2: i32 level, 3: list<i32> indexes, 4: i32 start_id,
+                                   5: i32 end_id),
+    map<string, string> get_bucket_data(1: string place, 2: list<i32> buckets),
+    void merge_replica(1: string place),
+    list<KeyValueResult> multi_lookup(1: list<string> keys),
+    list<KeyValueResult> multi_put(1: map<string, string> kvs),
+    list<KeyValueResult> multi_do_put(1: map<string, string> kvs, 2: string place),
+    KeyRange transfer_range(1: string place, 2: i32 start_id, 3: i32 end_id, 4: i32 limit),
+    i32 accept_range(1: string place, 2: map<string, string> data, 3: list<string> deletes, 4: string codec,
+                     5: binary payload),
+    list<Node> get_successor_list(),
+    list<Node> get_fingers(),
+    NodeStats get_stats(),
+    RouteResult trace_find_successor(1: i32 key_id, 2: TraceContext trace),
+    ScanPage scan(1: string place, 2: string cursor, 3: i32 limit, 4: i32 start_id, 5: i32 end_id,
+                  6: list<string> codecs),
+    list<string> get_codecs(),
+    KeyValueResult do_lookup(1: string key, 2: string place),
+    list<KeyValueResult> multi_do_lookup(1: list<string> keys, 2: string place)
 }
-
-enum KVStatus {
-    VALID, NOT_FOUND
-}
-
-struct KeyValueResult {
-    1: string key,
-    2: string value,
-    3: i32 node_id,
-    4: KVStatus status,
-}
-
-struct Node {
-    1: i32 node_id,
-    2: string address,
-    3: i32 port,
-    4: bool valid,
-}
-
@@ -1,120 +1,114 @@
 from ..chord.chord_base import BaseChordNode
-from ..chord.chord_base import connect_node, hash_func, is_between
-from ..chord.struct_class import KeyValueResult, Node, KVStatus
+from ..chord.chord_base import connect_node, hash_func, is_between, scan_items, vnode_id
+from ..chord.storage import MemoryStorage, store_name
+from ..chord.struct_class import KeyValueResult, Node, KVStatus, TraceContext
 import threading
 
 class ChordNode(BaseChordNode):
-    def __init__(self, address, port):
+    def __init__(self, address, port, vnode_index=0, storage=None):
         super().__init__()
 
-        self.node_id = hash_func(f'{address}:{port}')
-        self.kv_store = dict()
-        self.predecessor_kv_store = dict()  # 存储前驱节点的键值对
-        self.successor_kv_store = dict()  # 存储后继节点的键值对
+        self.vnode_index = vnode_index  # 所在服务端上的第几个虚拟节点
+        self.node_id = vnode_id(address, port, vnode_index)
+        self.storage = storage or MemoryStorage()  # 存储后端，默认只在内存中
+        self.kv_store = self._open_store('self')
+        self.predecessor_kv_store = self._open_store('predecessor')  # 存储前驱节点的键值对
+        self.successor_kv_store = self._open_store('successor')  # 存储后继节点的键值对
 
         self.self_node = Node(self.node_id, address, port)
         self.successor = self.self_node
         self.predecessor = Node(self.node_id, address, port, valid=False)
         self.stability_test_paused = False  # 跟踪稳定性测试的状态
-        self.logger.info(f'node {self.node_id} listening at {address}:{port}')
+        self.logger.info(f'node {self.node_id} listening at {address}:{port}' +
+                         (f' as virtual node {vnode_index}' if vnode_index else ''))
 
     def _log_self(self):
         msg = 'now content: '
         msg += '\nlocal:'
-        for k, v in self.kv_store.items():
-            msg += f'hash_func({k})={hash_func(k)}: {v}; '
+        for k, v in self.kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.kv_store.key_id(k)}: {v}; '
         msg += '\npredecessor:'
-        for k, v in self.predecessor_kv_store.items():
-            msg += f'hash_func({k})={hash_func(k)}: {v}; '
+        for k, v in self.predecessor_kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.predecessor_kv_store.key_id(k)}: {v}; '
         msg += '\nsuccessor:'
-        for k, v in self.successor_kv_store.items():
-            msg += f'hash_func({k})={hash_func(k)}: {v}; '
+        for k, v in self.successor_kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.successor_kv_store.key_id(k)}: {v}; '
         self.logger.debug(msg)
 
         pre_node_id = self.predecessor.node_id if self.predecessor.valid else "null"
         self.logger.debug(f"{pre_node_id} - {self.node_id} - {self.successor.node_id}")
 
-    def lookup(self, key: str) -> KeyValueResult:
+    def lookup(self, key: str, trace: TraceContext = None) -> KeyValueResult:
+        span = self._begin_span(trace)
         h = hash_func(key)
         tmp_key_node = Node(h, "", 0)
         if is_between(tmp_key_node, self.predecessor, self.self_node):
-            return self._lookup_local(key)
+            self._served_locally('lookup')
+            return self._end_span(span, self._read_replicas([key], [self._lookup_local(key)])[0])
         else:
-            next_node = self._closet_preceding_node(h)
+            next_node = self._next_hop_to_owner(h)
             conn_next_node = connect_node(next_node)
-            return conn_next_node.lookup(key)
+            return self._end_span(span, self._forwarded('lookup', self._call_traced(span, conn_next_node, 'lookup', key)))
 
     def _lookup_local(self, key: str) -> KeyValueResult:
         result = self.kv_store.get(key, None)
         status = KVStatus.VALID if result is not None else KVStatus.NOT_FOUND
         return KeyValueResult(key, result, self.node_id, status)
 
-    def find_successor(self, key_id: int) -> Node:
+    def _find_successor(self, key_id: int, span) -> Node:
         key_id_node = Node(key_id, "", 0)
         if is_between(key_id_node, self.self_node, self.successor):
             return self.successor
         else:
             next_node = self._closet_preceding_node(key_id)
             conn_next_node = connect_node(next_node)
-            return conn_next_node.find_successor(key_id)
+            return self._forward_find_successor(conn_next_node, key_id, span)
 
     def _closet_preceding_node(self, key_id: int) -> Node:
         return self.successor
 
-    def put(self, key: str, value: str) -> KeyValueResult:
+    def put(self, key: str, value: str, trace: TraceContext = None) -> KeyValueResult:
+        span = self._begin_span(trace)
         h = hash_func(key)  # 计算哈希值
         tmp_key_node = Node(h, "", 0)
 
         # 判断 key 是否在当前节点（self_node）和前驱节点之间
         if is_between(tmp_key_node, self.predecessor, self.self_node):
-            # 在当前节点执行插入
+            # 在当前节点执行插入，并发地将副本插入后面的 N-1 个节点，凑齐写法定数即返回
             result = self.do_put(key, value, "self")
-
-            # 尝试将副本插入前驱节点
-            if self.predecessor and self.predecessor.valid:
-                try:
-                    predecessor_client = connect_node(self.predecessor)
-                    predecessor_client.do_put(key, value, "successor")  # 直接调用 do_put，假设该方法也可处理
-                    print(f"Stored ({key}, {value}) in predecessor {self.predecessor.node_id}.")
-                except Exception as e:
-                    print(f"Failed to store in predecessor {self.predecessor.node_id}: {e}")
-
-            # 尝试将副本插入后继节点
-            if self.successor and self.successor.valid:
-                try:
-                    successor_client = connect_node(self.successor)
-                    successor_client.do_put(key, value, "predecessor")  # 直接调用 do_put
-                    print(f"Stored ({key}, {value}) in successor {self.successor.node_id}.")
-                except Exception as e:
-                    print(f"Failed to store in successor {self.successor.node_id}: {e}")
-
-            return result
+            if not self._replicate('do_put', (key, value), f'({key}, {value})'):
+                result.status = KVStatus.UNAVAILABLE
+            self._served_locally('put')
+            return self._end_span(span, result)
 
         # 如果不在该范围内，寻找合适的下一个节点
-        next_node = self._closet_preceding_node(h)
+        next_node = self._next_hop_to_owner(h)
         conn_next_node = connect_node(next_node)
 
         # 将请求传递给下一个节点
-        return conn_next_node.put(key, value)
+        return self._end_span(span, self._forwarded('put', self._call_traced(span, conn_next_node, 'put', key, value)))
 
     def do_put(self, key: str, value: str, place: str) -> KeyValueResult:
         # 存储当前节点的数据
-        if place == "self":
-            self.kv_store[key] = value
-        elif place == "predecessor":
-            self.predecessor_kv_store[key] = value
-        else :
-            self.successor_kv_store[key] = value
+        store = self._get_store(place)
+        store[key] = value
+        store.commit()  # 等待写入落盘，没有持久化后端时立即返回
 
         return KeyValueResult(key, value, self.node_id)
 
     def join(self, node: Node):
         conn_node = connect_node(node)
-        self.successor = conn_node.find_successor(self.node_id)
+        successor = conn_node.find_successor(self.node_id)
+        with self._lock:
+            self.successor = successor
+        self._refresh_successor_list(connect_node(successor))  # 副本沿后继列表写入后面的 N-1 个节点
+        self._take_over_range(successor)  # 从后继迁移本节点负责的区间
+        self._join_siblings()
 
     def notify(self, node: Node):
-        if not self.predecessor.valid or is_between(node, self.predecessor, self.self_node):
-            self.predecessor = node
+        with self._lock:
+            if not self.predecessor.valid or is_between(node, self.predecessor, self.self_node):
+                self._accept_predecessor(node)
 
     def _stabilize(self):
         if not self.stability_test_paused:
@@ -123,15 +117,21 @@ class ChordNode(BaseChordNode):
                 x = conn_successor.get_predecessor()
 
                 # 确保 x 是有效节点
-                if x and is_between(x, self.self_node, self.successor):
-                    print(f"Updating successor from {self.successor.node_id} to {x.node_id}.")
-                    self.successor = x
-
-                # 通知后继节点当前节点
+                with self._lock:
+                    updated = x and x.valid and is_between(x, self.self_node, self.successor)
+                    if updated:
+                        self.logger.debug(f"Updating successor from {self.successor.node_id} to {x.node_id}.")
+                        self._set_successor(x)
+
+                # 通知（更新后的）后继节点当前节点
+                if updated:
+                    conn_successor = connect_node(x)
                 conn_successor.notify(self.self_node)
+                self._refresh_successor_list(conn_successor)  # 同一轮稳定化中刷新后继列表
+                self._join_siblings()
 
             except Exception as e:
-                print(f"An error occurred during stabilization: {e}")
+                self.logger.warning(f"An error occurred during stabilization: {e}")
 
     def pause_stability_tests(self):
         self.stability_test_paused = True
@@ -152,15 +152,13 @@ class ChordNode(BaseChordNode):
             predecessor_client = connect_node(self.predecessor)
             successor_client = connect_node(self.successor)
         except Exception as e:
-            print(f"Error connecting to nodes: {e}")
+            self.logger.warning(f"Error connecting to nodes: {e}")
             return  # 连接失败，停止操作
 
         # 将后继节点的 kv_pairs 复制到本节点
         try:
             successor_client = connect_node(self.successor)
-            kv_pairs_1 = successor_client.get_all_data("self")
-            for key, value in kv_pairs_1.items():
-                print(key,value,'\n')
+            for key, value in scan_items(successor_client, "self"):
                 self.kv_store[key] = value
 
             # 更新本节点与后继节点的数据
@@ -168,7 +166,7 @@ class ChordNode(BaseChordNode):
             successor_client = connect_node(self.successor)
             successor_client.check_and_clean_data()
         except Exception as e:
-            print(f"Error during data migration from successor: {e}")
+            self.logger.warning(f"Error during data migration from successor: {e}")
             return  # 在数据迁移出错时停止操作
 
         try:
@@ -185,47 +183,48 @@ class ChordNode(BaseChordNode):
             s_successor_client.update_predecessor_kv_store()
 
         except Exception as e:
-            print(f"Error updating predecessor and successor KV stores: {e}")
+            self.logger.warning(f"Error updating predecessor and successor KV stores: {e}")
             return  # 更新失败停止操作
 
         # 更新本节点的 predecessor_kv_store 和 successor_kv_store
         try:
-            kv_pairs_3 = successor_client.get_all_data("self")
-            for key, value in kv_pairs_3.items():
+            for key, value in scan_items(successor_client, "self"):
                 self.successor_kv_store[key] = value
 
-            kv_pairs_4 = predecessor_client.get_all_data("self")
-            for key, value in kv_pairs_4.items():
+            for key, value in scan_items(predecessor_client, "self"):
                 self.predecessor_kv_store[key] = value
 
         except Exception as e:
-            print(f"Error retrieving KV pairs from predecessor or successor: {e}")
+            self.logger.warning(f"Error retrieving KV pairs from predecessor or successor: {e}")
             return  # 发生错误时停止操作
 
         # 数据迁移完成
-        print("Data migration completed successfully.")
+        self.logger.debug("Data migration completed successfully.")
 
     def check_and_clean_data(self):
         """对当前节点的所有数据进行检查，删除不符合条件的数据"""
-        keys_to_delete = []
+        # 按环上 ID 有序的索引直接取出不属于 (predecessor, self] 的键，与 is_key_for_node 的判断一致
+        keys_to_delete = self.kv_store.keys_outside(self.predecessor.node_id, self.node_id)
+        # Merkle 树按 (predecessor, self] 分桶，前驱变化时重建
+        self.kv_store.set_merkle_arc(self.predecessor.node_id, self.node_id)
 
-        for key in list(self.kv_store.keys()):  # 使用 list() 防止在遍历时修改字典
-            if not self.is_key_for_node(key):  # 根据需要检查数据
-                keys_to_delete.append(key)
-
-        # 删除不符合条件的数据
+        # 删除不符合条件的数据，键可能已被并发的请求删除
         for key in keys_to_delete:
-            del self.kv_store[key]
+            self.kv_store.pop(key, None)
 
-        self.logger.info(f"Data cleaned for node {self.node_id}. Remaining keys: {list(self.kv_store.keys())}")
+        self.logger.debug(f"Data cleaned for node {self.node_id}: removed {len(keys_to_delete)} keys, "
+                          f"{len(self.kv_store)} remaining")
 
-    def get_all_data(self, place: str):
+    def _get_store(self, place: str):
         if place == "self":
             return self.kv_store
-        elif place == "predecessor":
-            return self.predecessor_kv_store
-        else:
+        elif place == "successor":
             return self.successor_kv_store
+        else:
+            return self._replica_store(place)
+
+    def _open_store(self, place: str):
+        return self.storage.open(store_name(self.node_id, place))
 
     def is_key_for_node(self, key: str):
         """判断一个键是否应当属于某个节点，由节点ID决定键是否属于该节点"""
@@ -237,45 +236,31 @@ class ChordNode(BaseChordNode):
 
     def update_successor_kv_store(self):
         successor_client = connect_node(self.successor)
-        kv_pairs = successor_client.get_all_data("self")
         self.successor_kv_store.clear()
-        # 更新successor_kv_store
-        for key, value in kv_pairs.items():
+        # 分页拉取后继的数据更新successor_kv_store
+        for key, value in scan_items(successor_client, "self"):
             self.successor_kv_store[key] = value
-        print(f"Updated successor kv_store with data: {kv_pairs}")
+        self.logger.debug(f"Updated successor kv_store with {len(self.successor_kv_store)} keys")
 
     def update_predecessor_kv_store(self):
         predecessor_client = connect_node(self.predecessor)
-        kv_pairs = predecessor_client.get_all_data("self")
         self.predecessor_kv_store.clear()
-        # 更新predecessor_kv_store
-        for key, value in kv_pairs.items():
+        # 分页拉取前驱的数据更新predecessor_kv_store
+        for key, value in scan_items(predecessor_client, "self"):
             self.predecessor_kv_store[key] = value
-        print(f"Updated predecessor kv_store with data: {kv_pairs}")
+        self.logger.debug(f"Updated predecessor kv_store with {len(self.predecessor_kv_store)} keys")
 
     def leave_network(self):
-        successor_client = connect_node(self.successor)
-        successor_client.pause_stability_tests()
-        predecessor_client = connect_node(self.predecessor)
-        predecessor_client.pause_stability_tests()
-        self.pause_stability_tests()
-        successor_client = connect_node(self.successor)
-        successor_client.update_predecessor(self.predecessor)
-        predecessor_client = connect_node(self.predecessor)
-        predecessor_client.update_successor(self.successor)
-        successor_client = connect_node(self.successor)
-        successor_client.resume_stability_tests()
-        predecessor_client = connect_node(self.predecessor)
-        predecessor_client.resume_stability_tests()
-        for key, value in self.kv_store.items():
-            successor_client = connect_node(self.successor)
-            successor_client.put(key, value)
-        self.predecessor = self.self_node
-        self.successor = self.self_node
-        self.kv_store.clear()
+        # 分块移交数据并确认之后再离开，返回移交报告；同一服务端上的其他虚拟节点一起离开
+        return self._leave_with_siblings()
 
     def update_predecessor(self, predecessor):
-        self.predecessor = predecessor  # 更新前驱
+        with self._lock:
+            self.predecessor = predecessor  # 更新前驱
+            self._handed_off = None  # 前驱离开，原先交出的区间已归还本节点
+            self._membership_changed()
 
     def update_successor(self, successor):
-        self.successor = successor  # 更新后继
\ No newline at end of file
+        with self._lock:
+            self._set_successor(successor)  # 更新后继，后继列表在下一轮稳定化时刷新
+            self._membership_changed()
\ No newline at end of file
@@ -1,19 +1,28 @@
+import threading
 from ..chord.chord_base import BaseChordNode
-from ..chord.chord_base import connect_node, hash_func, is_between
-from ..chord.struct_class import KeyValueResult, Node, KVStatus,M
+from ..chord.chord_base import STABILIZE_STEPS, connect_node, hash_func, is_between, replica_place, vnode_id
+from ..chord.compression import negotiate_codec
+from ..chord.kv_store import KVStore
+from ..chord.storage import MemoryStorage, store_name
+from ..chord.struct_class import KeyValueResult, LeaveReport, Node, KVStatus, TraceContext, M
 
 
 class ChordNode(BaseChordNode):
-    def __init__(self, address, port):
+    def __init__(self, address, port, vnode_index=0, storage=None):
         super().__init__()
 
         # 初始化节点的属性
-        self.node_id = hash_func(f'{address}:{port}')  # 为节点生成唯一的ID
-        self.kv_store = dict()  # 键值存储
-        self.predecessor_kv_store = dict()  # 存储前驱节点的键值对
-        self.successor_kv_store = dict()  # 存储后继节点的键值对
+        self.vnode_index = vnode_index  # 所在服务端上的第几个虚拟节点
+        self.node_id = vnode_id(address, port, vnode_index)  # 为节点生成唯一的ID
+        self.storage = storage or MemoryStorage()  # 存储后端，默认只在内存中
+        self.kv_store = self._open_store('self')  # 键值存储
+        self.predecessor_kv_store = self._open_store('predecessor')  # 存储前驱节点的键值对
+        self.successor_kv_store = self._open_store('successor')  # 存储后继节点的键值对
+        self.run_kv_stores = {}  # 与前驱同在一个服务端、紧邻其前的虚拟节点的副本：节点ID -> KVStore
         self.finger_table = [[(self.node_id + 2 ** i) % (2 ** M), None] for i in range(M)] # 赋值在fix_finger中完成
         self.next_finger = 0  # 用于修复finger_table
+        self.sync_state = {}  # 增量同步进度：本地存储区 -> (对端节点ID, 对端存储实例标识, 已同步的序号)
+        self._sync_locks = {}  # 每个同步进度一把锁，避免并发请求重复同步同一存储区
 
         # 创建节点对象
         self.self_node = Node(self.node_id, address, port)  # 当前节点
@@ -24,33 +33,35 @@ class ChordNode(BaseChordNode):
         # for i in range(M):
         #     self.finger_table[i][1] = self.find_successor(self.finger_table[i][0])
 
-        self.logger.info(f'node {self.node_id} listening at {address}:{port}')  # 记录节点信息
+        self.logger.info(f'node {self.node_id} listening at {address}:{port}' +
+                         (f' as virtual node {vnode_index}' if vnode_index else ''))  # 记录节点信息
 
     def _log_self(self):
         msg = 'now content: '
         msg += '\nlocal:'
-        for k, v in self.kv_store.items():
-            msg += f'hash_func({k})={hash_func(k)}: {v}; '
+        for k, v in self.kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.kv_store.key_id(k)}: {v}; '
         msg += '\npredecessor:'
-        for k, v in self.predecessor_kv_store.items():
-            msg += f'hash_func({k})={hash_func(k)}: {v}; '
+        for k, v in self.predecessor_kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.predecessor_kv_store.key_id(k)}: {v}; '
         msg += '\nsuccessor:'
-        for k, v in self.successor_kv_store.items():
-            msg += f'hash_func({k})={hash_func(k)}: {v}; '
+        for k, v in self.successor_kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.successor_kv_store.key_id(k)}: {v}; '
         self.logger.debug(msg)
 
         pre_node_id = self.predecessor.node_id if self.predecessor.valid else "null"
         self.logger.debug(f"{pre_node_id} - {self.node_id} - {self.successor.node_id}")
 
-    def lookup(self, key: str) -> KeyValueResult:
+    def lookup(self, key: str, trace: TraceContext = None) -> KeyValueResult:
+        span = self._begin_span(trace)
         h = hash_func(key)
         tmp_key_node = Node(h, "", 0)
         if is_between(tmp_key_node, self.predecessor, self.self_node):
-            return self._lookup_local(key)
+            self._served_locally('lookup')
+            return self._end_span(span, self._read_replicas([key], [self._lookup_local(key)])[0])
         else:
-            next_node = self._closet_preceding_node(h)
-            conn_next_node = connect_node(next_node)
-            return conn_next_node.lookup(key)
+            conn_next_node = self._connect_next_hop(h, to_owner=True)
+            return self._end_span(span, self._forwarded('lookup', self._call_traced(span, conn_next_node, 'lookup', key)))
 
     def _lookup_local(self, key: str) -> KeyValueResult:
         # 在当前节点中查找键对应的值
@@ -58,83 +69,140 @@ class ChordNode(BaseChordNode):
         status = KVStatus.VALID if result is not None else KVStatus.NOT_FOUND
         return KeyValueResult(key, result, self.node_id, status)
 
-    def find_successor(self, key_id: int) -> Node:
+    def _find_successor(self, key_id: int, span) -> Node:
         # 查找指定键的后继节点
         key_id_node = Node(key_id, "", 0)
         if is_between(key_id_node, self.self_node, self.successor):
             return self.successor
         else:
-            next_node = self._closet_preceding_node(key_id)
-            conn_next_node = connect_node(next_node)
+            conn_next_node = self._connect_next_hop(key_id)
             if conn_next_node:
-                return conn_next_node.find_successor(key_id)
-            else:
+                return self._forward_find_successor(conn_next_node, key_id, span)
+            # 后继已失效而稳定化尚未发现：以后继列表中第一个存活的节点代替后继继续回答
+            alive = self._next_alive_successor()
+            if alive is None:
                 return self.self_node
+            if is_between(key_id_node, self.self_node, alive):
+                return alive
+            return self._forward_find_successor(connect_node(alive), key_id, span)
 
     def _closet_preceding_node(self, key_id: int) -> Node:
         tmp_key_node = Node(key_id, "", 0)
         if is_between(tmp_key_node, self.self_node, self.successor):
             return self.successor
         for i in range(M - 1, -1, -1):
-            if self.finger_table[i][1] is not None and is_between(self.finger_table[i][1], self.self_node, tmp_key_node):
-                return self.finger_table[i][1]
-
-    def put(self, key: str, value: str) -> KeyValueResult:
+            finger = self.finger_table[i][1]
+            # 只取严格位于 (self, key_id) 内的 finger：ID 恰为 key_id 的节点收到对自身 ID 的查询会绕环一整圈
+            if finger is not None and finger.node_id != key_id and is_between(finger, self.self_node, tmp_key_node):
+                break
+        else:
+            finger = self.successor  # finger table 尚未填好时沿后继前进
+        if self.siblings:
+            # 同一服务端上的其他虚拟节点及其 finger 同样可用：转给其他虚拟节点是进程内调用，
+            # 它们的 finger 分散在环上各处，往往比本节点的 finger 离 key_id 更近
+            candidates = [finger]
+            for sibling in self.siblings:
+                if sibling.successor.node_id == sibling.node_id:
+                    continue  # 尚未加入环或已经离开
+                candidates.append(sibling.self_node)
+                candidates.extend(node for _, node in sibling.finger_table if node is not None)
+            finger = self._closest_known_preceding(candidates, key_id)
+        return finger
+
+    def _connect_next_hop(self, key_id: int, to_owner=False):
+        """
+        连接通往 key_id 的下一跳，finger 指向的节点已失效时退回后继；都不可达时返回 None。
+        to_owner 为 True 时按 lookup/put 的归属节点转发，见 _next_hop_to_owner
+        """
+        next_node = self._next_hop_to_owner(key_id) if to_owner else self._closet_preceding_node(key_id)
+        conn_next_node = connect_node(next_node)
+        if conn_next_node is None and next_node.node_id != self.successor.node_id:
+            conn_next_node = connect_node(self.successor)
+        if conn_next_node is None:
+            self._membership_changed(suspected=True)  # 后继不可达，尽快稳定化切换到后继列表中的下一个节点
+        return conn_next_node
+
+    def put(self, key: str, value: str, trace: TraceContext = None) -> KeyValueResult:
+        span = self._begin_span(trace)
         h = hash_func(key)  # 计算哈希值
         tmp_key_node = Node(h, "", 0)
 
         # 判断 key 是否在当前节点（self_node）和前驱节点之间
         if is_between(tmp_key_node, self.predecessor, self.self_node):
-            # 在当前节点执行插入
+            # 在当前节点执行插入，并发地将副本插入后面的 N-1 个节点，凑齐写法定数即返回
             result = self.do_put(key, value, "self")
-
-            # 尝试将副本插入前驱节点
-            if self.predecessor and self.predecessor.valid:
-                try:
-                    predecessor_client = connect_node(self.predecessor)
-                    predecessor_client.do_put(key, value, "successor")  # 直接调用 do_put
-                    print(f"Stored ({key}, {value}) in predecessor {self.predecessor.node_id}.")
-                except Exception as e:
-                    print(f"Failed to store in predecessor {self.predecessor.node_id}: {e}")
-
-            # 尝试将副本插入后继节点
-            if self.successor and self.successor.valid:
-                try:
-                    successor_client = connect_node(self.successor)
-                    successor_client.do_put(key, value, "predecessor")  # 直接调用 do_put
-                    print(f"Stored ({key}, {value}) in successor {self.successor.node_id}.")
-                except Exception as e:
-                    print(f"Failed to store in successor {self.successor.node_id}: {e}")
-
-            return result
+            if not self._replicate('do_put', (key, value), f'({key}, {value})'):
+                result.status = KVStatus.UNAVAILABLE
+            self._served_locally('put')
+            return self._end_span(span, result)
 
         # 如果不在该范围内，寻找合适的下一个节点
-        next_node = self._closet_preceding_node(h)
-        conn_next_node = connect_node(next_node)
+        conn_next_node = self._connect_next_hop(h, to_owner=True)
 
         # 将请求传递给下一个节点
-        return conn_next_node.put(key, value)
+        return self._end_span(span, self._forwarded('put', self._call_traced(span, conn_next_node, 'put', key, value)))
 
     def do_put(self, key: str, value: str, place: str) -> KeyValueResult:
         # 存储当前节点的数据
-        if place == "self":
-            self.kv_store[key] = value
-        elif place == "predecessor":
-            self.predecessor_kv_store[key] = value
-        else:
-            self.successor_kv_store[key] = value
+        store = self._get_store(place)
+        store[key] = value
+        store.commit()  # 等待写入落盘，没有持久化后端时立即返回
 
         return KeyValueResult(key, value, self.node_id)
 
     def join(self, node: Node):
         # 加入指定节点的Chord网络
         conn_node = connect_node(node)
-        self.successor = conn_node.find_successor(self.node_id)
+        successor = conn_node.find_successor(self.node_id)
+        with self._lock:
+            self.successor = successor
+        self._refresh_successor_list(connect_node(successor))  # 第一轮稳定化之前后继失效也能切换
+        self._init_finger_table(successor)  # 加入时一次建好 finger table，不必等 _fix_fingers 逐项修复
+        self._take_over_range(successor)  # 从后继迁移本节点负责的区间
+        self._join_siblings()
+
+    def get_fingers(self) -> list:
+        # 返回 finger table 中已填好的节点，供新加入的节点参考
+        return [finger for _, finger in self.finger_table if finger is not None]
+
+    def _closest_known_preceding(self, nodes, key_id: int) -> Node:
+        # 在已知节点中找严格位于 (self, key_id) 内、离 key_id 最近的节点，没有时返回后继
+        best, best_distance = self.successor, 0
+        limit = (key_id - self.node_id) % (2 ** M)
+        for node in nodes:
+            distance = (node.node_id - self.node_id) % (2 ** M)
+            if best_distance < distance < limit:
+                best, best_distance = node, distance
+        return best
+
+    def _init_finger_table(self, successor: Node):
+        """
+        加入时建立 finger table：起点落在 (self, 上一个 finger] 内的项与上一项指向同一节点，直接复用不发 RPC；
+        其余项从后继的 finger table 中挑出起点之前最近的节点，由它调用 find_successor 解析。
+        后继与本节点相邻，它的 finger 离各个起点都很近，每项通常一两跳即可解析，
+        而本节点的 finger table 为空，自己发起查找只能沿后继逐个前进
+        """
+        known = [successor]
+        try:
+            known.extend(connect_node(successor).get_fingers())
+        except Exception as e:
+            self.logger.warning(f'failed to fetch fingers of successor {successor.node_id}: {e}')
+        previous = successor
+        for i in range(M):
+            start = self.finger_table[i][0]
+            if not is_between(Node(start, "", 0), self.self_node, previous):
+                helper = self._closest_known_preceding(known, start)
+                conn_helper = connect_node(helper) or connect_node(successor)
+                previous = conn_helper.find_successor(start)
+                known.append(previous)
+            self.finger_table[i][1] = previous
+        self.next_finger = 0
 
     def notify(self, node: Node):
         # 通知当前节点的前驱节点
-        if not self.predecessor.valid or is_between(node, self.predecessor, self.self_node):
-            self.predecessor = node
+        with self._lock:
+            if not self.predecessor.valid or is_between(node, self.predecessor, self.self_node):
+                self._accept_predecessor(node)
 
     def _stabilize(self):
         if not self.stability_test_paused:
@@ -142,23 +210,34 @@ class ChordNode(BaseChordNode):
                 node = connect_node(self.successor)
                 if node:
                     try:
-                        x = node.get_predecessor()
-
-                        # 确保 x 是有效节点
-                        if x and is_between(x, self.self_node, self.successor):
-                            print(f"Updating successor from {self.successor.node_id} to {x.node_id}.")
-                            self.successor = x
-                        # 通知后继节点当前节点
-                        node.notify(self.self_node)
+                        for _ in range(STABILIZE_STEPS):
+                            x = node.get_predecessor()
+
+                            # 确保 x 是有效节点
+                            with self._lock:
+                                updated = x and x.valid and is_between(x, self.self_node, self.successor)
+                                if updated:
+                                    self.logger.debug(f"Updating successor from {self.successor.node_id} to {x.node_id}.")
+                                    self._set_successor(x)
+                            if not updated:
+                                break
+                            node = connect_node(x)  # 新后继的前驱可能仍在本节点与它之间，继续收紧
+                            if node is None:
+                                break
+                        # 通知（更新后的）后继节点当前节点
+                        if node:
+                            node.notify(self.self_node)
+                            self._refresh_successor_list(node)  # 同一轮稳定化中刷新后继列表
+                        self._join_siblings()  # 本节点是第一个服务端的第 0 个虚拟节点时，有其他节点加入后带领其余虚拟节点加入
 
                     except Exception as e:
-                        print(f"An error occurred during stabilization: {e}")
+                        self.logger.warning(f"An error occurred during stabilization: {e}")
                 else:
-                    print(f"Successor {self.successor.node_id} is not reachable.")
+                    self.logger.warning(f"Successor {self.successor.node_id} is not reachable.")
                     self.fix_chord()
                     return
             else:
-                print(f"{self.node_id} has no successor defined.")
+                self.logger.debug(f"{self.node_id} has no successor defined.")
                 return
 
 
@@ -184,11 +263,21 @@ class ChordNode(BaseChordNode):
 
     def _fix_fingers(self):
         start_id = (self.node_id + 2 ** self.next_finger) % (2 ** M)
-        self.finger_table[self.next_finger][1] = self.find_finger(start_id)
+        # 借助已有的 finger 路由，O(log N) 跳；find_finger 沿后继逐个前进，大环中每次需要 O(N) 跳
+        self.finger_table[self.next_finger][1] = self.find_successor(start_id)
         self.next_finger = (self.next_finger + 1) % M  # 更新下一个需要更新的finger位置的索引
 
     def _check_predecessor(self):
-        pass
+        # 前驱不可达时标记为无效，此后任何节点的 notify 都会被接受；
+        # 否则失效的前驱会一直被前一个节点的稳定化取回并当作后继
+        predecessor = self.predecessor
+        if predecessor.valid and predecessor.node_id != self.node_id and connect_node(predecessor) is None:
+            with self._lock:
+                if self.predecessor is not predecessor:
+                    return
+                self.predecessor = Node(predecessor.node_id, predecessor.address, predecessor.port, valid=False)
+            # 失效前驱的区间由本节点接管，不依赖前一个节点的 fix_chord：它的后继列表可能还没有本节点
+            self.merge_replica("predecessor")
 
     # def migrate_data(self):
     #     successor_client = connect_node(self.successor)
@@ -234,39 +323,62 @@ class ChordNode(BaseChordNode):
     def update_data(self):
         """周期性更新数据"""
         # 获取前驱节点和后继节点的数据
-        if connect_node(self.predecessor) and connect_node(self.successor):
-            predecessor_client = connect_node(self.predecessor)
-            kv_pairs1 = predecessor_client.get_all_data("successor")
-            successor_client = connect_node(self.successor)
-            kv_pairs2 = successor_client.get_all_data("predecessor")
-            # 原数据与副本取并集
-            self.kv_store.update(kv_pairs1)
-            self.kv_store.update(kv_pairs2)
+        predecessor_client = connect_node(self.predecessor)
+        successor_client = connect_node(self.successor)
+        if predecessor_client and successor_client:
+            # 只拉取副本上次同步之后的变更，原数据与副本取并集（不删除本地数据）
+            self._sync_from(predecessor_client, self.predecessor, "successor", self.kv_store, "merge_predecessor", mirror=False)
+            self._sync_from(successor_client, self.successor, "predecessor", self.kv_store, "merge_successor", mirror=False)
             # self.kv_store.update(self.predecessor_kv_store)  # 应对两个连续节点一起失效的情况
             self.check_and_clean_data()  # 检查本地的键值对是否属于自己
             # 更新后继与前驱中的副本
             successor_client.update_predecessor_kv_store()
             predecessor_client.update_successor_kv_store()
 
+    def _sync_from(self, client, peer: Node, place: str, store: KVStore, sync_key: str, mirror: bool):
+        """
+        将对端 place 存储区的数据同步到本地 store，sync_key 标识本地的同步进度。
+        优先拉取增量变更；对端换了节点或变更日志出现缺口时，通过 Merkle 树只拉取不一致的桶。
+        mirror 为 True 时 store 与对端保持一致（同步删除），否则只合并新增与修改
+        """
+        with self._sync_locks.setdefault(sync_key, threading.Lock()):
+            peer_id, epoch, seq = self.sync_state.get(sync_key, (None, "", -1))
+            if peer_id != peer.node_id:
+                epoch, seq = "", -1
+            changes = client.get_changes_since(place, seq, epoch)
+            if changes.resync:
+                arcs = self._diff_arcs(client, place, store)
+                # 不一致的桶按连续的弧分页扫描，同步过程中只持有一页
+                self._sync_buckets(client, place, store, arcs, sync_key, mirror)
+            else:
+                self._record_sync(sync_key, changes.upserts, changes.deletes)
+                if mirror:
+                    store.apply_changes(changes)
+                else:
+                    store.update(changes.upserts)
+            self.sync_state[sync_key] = (peer.node_id, changes.epoch, changes.seq)
+
     def check_and_clean_data(self):
         """对当前节点的所有数据进行检查，删除不符合条件的数据"""
-        keys_to_delete = []
+        # 按环上 ID 有序的索引直接取出不属于 (predecessor, self] 的键，与 is_key_for_node 的判断一致
+        keys_to_delete = self.kv_store.keys_outside(self.predecessor.node_id, self.node_id)
+        # Merkle 树按 (predecessor, self] 分桶，前驱变化时重建
+        self.kv_store.set_merkle_arc(self.predecessor.node_id, self.node_id)
 
-        for key in list(self.kv_store.keys()):  # 使用 list() 防止在遍历时修改字典
-            if not self.is_key_for_node(key):  # 根据需要检查数据
-                keys_to_delete.append(key)
-
-        # 删除不符合条件的数据
+        # 删除不符合条件的数据，键可能已被并发的请求删除
         for key in keys_to_delete:
-            del self.kv_store[key]
+            self.kv_store.pop(key, None)
 
-    def get_all_data(self, place: str):
+    def _get_store(self, place: str):
         if place == "self":
             return self.kv_store
-        elif place == "predecessor":
-            return self.predecessor_kv_store
-        else:
+        elif place == "successor":
             return self.successor_kv_store
+        else:
+            return self._replica_store(place)
+
+    def _open_store(self, place: str):
+        return self.storage.open(store_name(self.node_id, place))
 
     def is_key_for_node(self, key: str):
         """判断一个键是否应当属于某个节点，由节点ID决定键是否属于该节点"""
@@ -278,69 +390,124 @@ class ChordNode(BaseChordNode):
 
     def update_successor_kv_store(self):
         successor_client = connect_node(self.successor)
-        kv_pairs = successor_client.get_all_data("self")
-        self.successor_kv_store.clear()
-        # 更新successor_kv_store
-        for key, value in kv_pairs.items():
-            self.successor_kv_store[key] = value
+        # 增量更新successor_kv_store
+        self._sync_from(successor_client, self.successor, "self", self.successor_kv_store, "successor", mirror=True)
 
     def update_predecessor_kv_store(self):
         predecessor_client = connect_node(self.predecessor)
-        kv_pairs = predecessor_client.get_all_data("self")
-        self.predecessor_kv_store.clear()
-        # 更新predecessor_kv_store
-        for key, value in kv_pairs.items():
-            self.predecessor_kv_store[key] = value
+        # 增量更新predecessor_kv_store
+        self._sync_from(predecessor_client, self.predecessor, "self", self.predecessor_kv_store, "predecessor", mirror=True)
+        self._update_run_replicas()
+        self._update_chain_replicas()
+
+    def _update_chain_replicas(self):
+        """
+        复制因子 N 大于 2 时本节点还保存前面第 2..N-1 个节点的副本，put 时按后继顺序写入；
+        这里沿前驱链找到这些节点增量同步，环上节点变动后副本随之换成新位置上节点的数据
+        """
+        node, seen = self.predecessor, {self.node_id}
+        for distance in range(2, self.replicas):
+            if not node.valid or node.node_id in seen:
+                return
+            seen.add(node.node_id)
+            client = connect_node(node)
+            node = client.get_predecessor() if client else None
+            if node is None or not node.valid or node.node_id in seen:
+                return
+            place = replica_place(distance)
+            self._sync_from(connect_node(node), node, "self", self._get_store(place), place, mirror=True)
+
+    def _update_run_replicas(self):
+        """
+        前驱之前连续几个虚拟节点与前驱同在一个服务端时，该服务端崩溃后这段区间整体由本节点接管，
+        而它们的前驱、后继副本都在同一服务端上，因此本节点同步保存这些虚拟节点的数据
+        """
+        predecessor = self.predecessor
+        if not predecessor.valid:
+            return  # 前驱已失效，保留现有副本等待接管
+        run, node, seen = {}, predecessor, {predecessor.node_id, self.node_id}
+        same_host = (predecessor.address, predecessor.port) == (self.self_node.address, self.self_node.port)
+        while not same_host:  # 前驱与本节点同在一个服务端时，这些副本会和本节点一起失效
+            client = connect_node(node)
+            node = client.get_predecessor() if client else None
+            if (node is None or not node.valid or node.node_id in seen
+                    or (node.address, node.port) != (predecessor.address, predecessor.port)):
+                break
+            seen.add(node.node_id)
+            store = self.run_kv_stores.get(node.node_id) or type(self.predecessor_kv_store)()
+            self._sync_from(connect_node(node), node, "self", store, f"run:{node.node_id}", mirror=True)
+            run[node.node_id] = store
+        for node_id in self.run_kv_stores.keys() - run.keys():
+            self.sync_state.pop(f"run:{node_id}", None)
+        self.run_kv_stores = run
 
     def leave_network(self):
-        successor_client = connect_node(self.successor)
-        successor_client.pause_stability_tests()
-        predecessor_client = connect_node(self.predecessor)
-        predecessor_client.pause_stability_tests()
-        self.pause_stability_tests()
-        successor_client.update_predecessor(self.predecessor)
-        predecessor_client.update_successor(self.successor)
-        successor_client.resume_stability_tests()
-        predecessor_client.resume_stability_tests()
-        # for key, value in self.kv_store.items():
-        #     successor_client.put(key, value)
-        # successor_client.update_predecessor_kv_store()
-        # predecessor_client.update_successor_kv_store()
-        self.predecessor = self.self_node
-        self.successor = self.self_node
-        self.kv_store.clear()
+        # 分块移交数据并确认之后再离开，返回移交报告；同一服务端上的其他虚拟节点一起离开
+        return self._leave_with_siblings()
 
     def update_predecessor(self, predecessor):
-        self.predecessor = predecessor  # 更新前驱
+        with self._lock:
+            self.predecessor = predecessor  # 更新前驱
+            self._handed_off = None  # 前驱离开，原先交出的区间已归还本节点
+            self._membership_changed()
 
     def update_successor(self, successor):
-        self.successor = successor  # 更新后继
+        with self._lock:
+            self._set_successor(successor)  # 更新后继，后继列表在下一轮稳定化时刷新
+            self._membership_changed()
 
     def fix_chord(self):
         self.pause_stability_tests()
-        new_successor = self.find_alive_successor()
-        successor_client = connect_node(new_successor)
-        successor_client.pause_stability_tests()
-        # 在环重建之前，先将successor_client原来前驱的数据保存在本地以防丢失
-        kv_pairs = successor_client.get_all_data("predecessor")
-        for key, value in kv_pairs.items():
-            successor_client.do_put(key, value,"self")
-        self.successor = new_successor
-        successor_client.update_predecessor(self.self_node)
-        # kv_pairs1 = self.successor_kv_store
-        # kv_pairs2 = successor_client.get_all_data("predecessor")
-        # for key, value in kv_pairs1.items():
-        #     successor_client.put(key, value)
-        # for key, value in kv_pairs2.items():
-        #     successor_client.put(key, value)
-        # successor_client.update_predecessor_kv_store()
-        # self.update_successor_kv_store()
-        self.resume_stability_tests()
-        successor_client.resume_stability_tests()
+        try:
+            new_successor = self.find_alive_successor()
+            skipped = self._skipped_failed_successors(new_successor)
+            failed = self._failed_before(new_successor)
+            successor_client = connect_node(new_successor)
+            successor_client.pause_stability_tests()
+            try:
+                # 在环重建之前，先将successor_client原来前驱的数据保存在本地以防丢失
+                successor_client.merge_replica("predecessor")
+                # 连续多个节点一起失效时，新后继更远的副本中保存着更前面失效节点的数据，一并并入
+                for distance in range(2, min(failed, self.replicas - 1) + 1):
+                    successor_client.merge_replica(replica_place(distance))
+                with self._lock:
+                    self._set_successor(new_successor)
+                successor_client.update_predecessor(self.self_node)
+                if skipped:
+                    # 连续多个节点一起失效：第一个失效节点的数据只在本节点的后继副本中，交给接管这段区间的新后继
+                    self._hand_off_store(successor_client, "self", self.successor_kv_store, LeaveReport(),
+                                         negotiate_codec(successor_client))
+                # kv_pairs1 = self.successor_kv_store
+                # kv_pairs2 = successor_client.get_all_data("predecessor")
+                # for key, value in kv_pairs1.items():
+                #     successor_client.put(key, value)
+                # for key, value in kv_pairs2.items():
+                #     successor_client.put(key, value)
+                # successor_client.update_predecessor_kv_store()
+                # self.update_successor_kv_store()
+            finally:
+                successor_client.resume_stability_tests()
+        finally:
+            # 切换失败时也要恢复稳定化，否则节点停在失效的后继上不再重试
+            self.resume_stability_tests()
+
+    def merge_replica(self, place: str):
+        """将本地保存的副本并入自身数据，用于接管失效节点的数据"""
+        self._merge_store(self._get_store(place))
+        if place == "predecessor":
+            for store in list(self.run_kv_stores.values()):  # 前驱所在服务端上一起失效的其他虚拟节点
+                self._merge_store(store)
 
     def find_alive_successor(self):
+        # 后继列表中第一个存活的节点就是新的后继，一轮探测即可完成切换
+        new_successor = self._next_alive_successor()
+        if new_successor is not None:
+            return new_successor
+        # 后继列表中的节点都已失效时，才经由 finger table 沿前驱链查找
         for finger in self.finger_table:
             finger_node = finger[1]  # 假设 finger 表的第一元素是指向节点对象
+            if finger_node is None:
+                continue
             node = connect_node(finger_node)
             if node:
                 new_successor = node.check_predecessor()
@@ -356,5 +523,5 @@ class ChordNode(BaseChordNode):
             else:
                 return self.self_node
         else:
-            print(f"{self.node_id} has no predecessor defined.")
+            self.logger.debug(f"{self.node_id} has no predecessor defined.")
             return self.self_node
@@ -0,0 +1,398 @@
+import asyncio
+from ..chord.chord_base import STABILIZE_STEPS, hash_func, is_between, replica_place
+from ..chord.chord_base_aio import AioBaseChordNode, connect_node_aio
+from ..chord.compression import negotiate_codec_aio
+from ..chord.kv_store import KVStore
+from ..chord.storage import MemoryStorage, store_name
+from ..chord.struct_class import KeyValueResult, LeaveReport, Node, KVStatus, TraceContext, M
+
+
+class ChordNode(AioBaseChordNode):
+    """
+    finger table 版本的协程实现，路由与数据维护逻辑与 chord_finger_table.ChordNode 相同，
+    所有 RPC 都是协程，运行在 thriftpy2 的协程服务端中
+    """
+
+    def __init__(self, address, port, storage=None):
+        super().__init__()
+
+        # 初始化节点的属性
+        self.node_id = hash_func(f'{address}:{port}')  # 为节点生成唯一的ID
+        self.storage = storage or MemoryStorage()  # 存储后端，默认只在内存中
+        self.kv_store = self._open_store('self')  # 键值存储
+        self.predecessor_kv_store = self._open_store('predecessor')  # 存储前驱节点的键值对
+        self.successor_kv_store = self._open_store('successor')  # 存储后继节点的键值对
+        self.finger_table = [[(self.node_id + 2 ** i) % (2 ** M), None] for i in range(M)]  # 赋值在fix_finger中完成
+        self.next_finger = 0  # 用于修复finger_table
+        self.sync_state = {}  # 增量同步进度：本地存储区 -> (对端节点ID, 对端存储实例标识, 已同步的序号)
+        self._sync_locks = {}  # 每个同步进度一把协程锁，避免并发请求重复同步同一存储区
+
+        # 创建节点对象
+        self.self_node = Node(self.node_id, address, port)  # 当前节点
+        self.successor = self.self_node  # 后继节点
+        self.predecessor = Node(self.node_id, address, port, valid=False)  # 前驱节点
+        self.stability_test_paused = False  # 是否开启稳定性测试
+
+        self.logger.info(f'node {self.node_id} listening at {address}:{port} (asyncio)')  # 记录节点信息
+
+    def _log_self(self):
+        msg = 'now content: '
+        msg += '\nlocal:'
+        for k, v in self.kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.kv_store.key_id(k)}: {v}; '
+        msg += '\npredecessor:'
+        for k, v in self.predecessor_kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.predecessor_kv_store.key_id(k)}: {v}; '
+        msg += '\nsuccessor:'
+        for k, v in self.successor_kv_store.snapshot().items():
+            msg += f'hash_func({k})={self.successor_kv_store.key_id(k)}: {v}; '
+        self.logger.debug(msg)
+
+        pre_node_id = self.predecessor.node_id if self.predecessor.valid else "null"
+        self.logger.debug(f"{pre_node_id} - {self.node_id} - {self.successor.node_id}")
+
+    async def lookup(self, key: str, trace: TraceContext = None) -> KeyValueResult:
+        span = self._begin_span(trace)
+        h = hash_func(key)
+        tmp_key_node = Node(h, "", 0)
+        if is_between(tmp_key_node, self.predecessor, self.self_node):
+            self._served_locally('lookup')
+            return self._end_span(span, (await self._read_replicas([key], [self._lookup_local(key)]))[0])
+        else:
+            conn_next_node = await self._connect_next_hop(h, to_owner=True)
+            return self._end_span(span, self._forwarded('lookup', await self._call_traced(span, conn_next_node, 'lookup', key)))
+
+    def _lookup_local(self, key: str) -> KeyValueResult:
+        # 在当前节点中查找键对应的值
+        result = self.kv_store.get(key, None)
+        status = KVStatus.VALID if result is not None else KVStatus.NOT_FOUND
+        return KeyValueResult(key, result, self.node_id, status)
+
+    async def _find_successor(self, key_id: int, span) -> Node:
+        # 查找指定键的后继节点
+        key_id_node = Node(key_id, "", 0)
+        if is_between(key_id_node, self.self_node, self.successor):
+            return self.successor
+        else:
+            conn_next_node = await self._connect_next_hop(key_id)
+            if conn_next_node:
+                return await self._forward_find_successor(conn_next_node, key_id, span)
+            # 后继已失效而稳定化尚未发现：以后继列表中第一个存活的节点代替后继继续回答
+            alive = await self._next_alive_successor()
+            if alive is None:
+                return self.self_node
+            if is_between(key_id_node, self.self_node, alive):
+                return alive
+            return await self._forward_find_successor(await connect_node_aio(alive), key_id, span)
+
+    def _closet_preceding_node(self, key_id: int) -> Node:
+        tmp_key_node = Node(key_id, "", 0)
+        if is_between(tmp_key_node, self.self_node, self.successor):
+            return self.successor
+        for i in range(M - 1, -1, -1):
+            finger = self.finger_table[i][1]
+            # 只取严格位于 (self, key_id) 内的 finger：ID 恰为 key_id 的节点收到对自身 ID 的查询会绕环一整圈
+            if finger is not None and finger.node_id != key_id and is_between(finger, self.self_node, tmp_key_node):
+                return finger
+        return self.successor  # finger table 尚未填好时沿后继前进
+
+    async def _connect_next_hop(self, key_id: int, to_owner=False):
+        """
+        连接通往 key_id 的下一跳，finger 指向的节点已失效时退回后继；都不可达时返回 None。
+        to_owner 为 True 时按 lookup/put 的归属节点转发，见 _next_hop_to_owner
+        """
+        next_node = self._next_hop_to_owner(key_id) if to_owner else self._closet_preceding_node(key_id)
+        conn_next_node = await connect_node_aio(next_node)
+        if conn_next_node is None and next_node.node_id != self.successor.node_id:
+            conn_next_node = await connect_node_aio(self.successor)
+        if conn_next_node is None:
+            self._membership_changed(suspected=True)  # 后继不可达，尽快稳定化切换到后继列表中的下一个节点
+        return conn_next_node
+
+    async def put(self, key: str, value: str, trace: TraceContext = None) -> KeyValueResult:
+        span = self._begin_span(trace)
+        h = hash_func(key)  # 计算哈希值
+        tmp_key_node = Node(h, "", 0)
+
+        # 判断 key 是否在当前节点（self_node）和前驱节点之间
+        if is_between(tmp_key_node, self.predecessor, self.self_node):
+            # 在当前节点执行插入，并发地将副本插入后面的 N-1 个节点，凑齐写法定数即返回
+            result = await self.do_put(key, value, "self")
+            if not await self._replicate('do_put', (key, value), f'({key}, {value})'):
+                result.status = KVStatus.UNAVAILABLE
+            self._served_locally('put')
+            return self._end_span(span, result)
+
+        # 如果不在该范围内，将请求传递给下一个节点
+        conn_next_node = await self._connect_next_hop(h, to_owner=True)
+        return self._end_span(span, self._forwarded('put', await self._call_traced(span, conn_next_node, 'put', key, value)))
+
+    async def do_put(self, key: str, value: str, place: str) -> KeyValueResult:
+        # 存储当前节点的数据
+        store = self._get_store(place)
+        store[key] = value
+        await self._commit(store)
+        return KeyValueResult(key, value, self.node_id)
+
+    async def join(self, node: Node):
+        # 加入指定节点的Chord网络
+        conn_node = await connect_node_aio(node)
+        self.successor = await conn_node.find_successor(self.node_id)
+        await self._refresh_successor_list(await connect_node_aio(self.successor))  # 第一轮稳定化之前后继失效也能切换
+        await self._init_finger_table(self.successor)  # 加入时一次建好 finger table，不必等 _fix_fingers 逐项修复
+        await self._take_over_range(self.successor)  # 从后继迁移本节点负责的区间
+
+    async def get_fingers(self) -> list:
+        # 返回 finger table 中已填好的节点，供新加入的节点参考
+        return [finger for _, finger in self.finger_table if finger is not None]
+
+    def _closest_known_preceding(self, nodes, key_id: int) -> Node:
+        # 在已知节点中找严格位于 (self, key_id) 内、离 key_id 最近的节点，没有时返回后继
+        best, best_distance = self.successor, 0
+        limit = (key_id - self.node_id) % (2 ** M)
+        for node in nodes:
+            distance = (node.node_id - self.node_id) % (2 ** M)
+            if best_distance < distance < limit:
+                best, best_distance = node, distance
+        return best
+
+    async def _init_finger_table(self, successor: Node):
+        """加入时建立 finger table，做法见 chord_finger_table.ChordNode._init_finger_table"""
+        known = [successor]
+        try:
+            known.extend(await (await connect_node_aio(successor)).get_fingers())
+        except Exception as e:
+            self.logger.warning(f'failed to fetch fingers of successor {successor.node_id}: {e}')
+        previous = successor
+        for i in range(M):
+            start = self.finger_table[i][0]
+            if not is_between(Node(start, "", 0), self.self_node, previous):
+                helper = self._closest_known_preceding(known, start)
+                conn_helper = await connect_node_aio(helper) or await connect_node_aio(successor)
+                previous = await conn_helper.find_successor(start)
+                known.append(previous)
+            self.finger_table[i][1] = previous
+        self.next_finger = 0
+
+    async def notify(self, node: Node):
+        # 通知当前节点的前驱节点
+        if not self.predecessor.valid or is_between(node, self.predecessor, self.self_node):
+            self._accept_predecessor(node)
+
+    async def _stabilize(self):
+        if self.stability_test_paused:
+            return
+        node = await connect_node_aio(self.successor)
+        if node:
+            try:
+                for _ in range(STABILIZE_STEPS):
+                    x = await node.get_predecessor()
+
+                    # 确保 x 是有效节点
+                    if not (x and x.valid and is_between(x, self.self_node, self.successor)):
+                        break
+                    self.logger.info(f"Updating successor from {self.successor.node_id} to {x.node_id}.")
+                    self._set_successor(x)
+                    node = await connect_node_aio(x)  # 新后继的前驱可能仍在本节点与它之间，继续收紧
+                    if node is None:
+                        break
+                # 通知（更新后的）后继节点当前节点
+                if node:
+                    await node.notify(self.self_node)
+                    await self._refresh_successor_list(node)  # 同一轮稳定化中刷新后继列表
+
+            except Exception as e:
+                self.logger.warning(f"An error occurred during stabilization: {e}")
+        else:
+            self.logger.warning(f"Successor {self.successor.node_id} is not reachable.")
+            await self.fix_chord()
+
+    async def pause_stability_tests(self):
+        self.stability_test_paused = True
+
+    async def resume_stability_tests(self):
+        self.stability_test_paused = False
+
+    async def find_finger(self, key_id: int) -> Node:
+        # 查找指定键的后继节点
+        key_id_node = Node(key_id, "", 0)
+        if is_between(key_id_node, self.self_node, self.successor):
+            return self.successor
+        else:
+            conn_next_node = await connect_node_aio(self.successor)
+            if conn_next_node:
+                return await conn_next_node.find_finger(key_id)
+            else:
+                return self.self_node
+
+    async def _fix_fingers(self):
+        index = self.next_finger
+        self.next_finger = (self.next_finger + 1) % M  # 更新下一个需要更新的finger位置的索引
+        start_id = (self.node_id + 2 ** index) % (2 ** M)
+        # 借助已有的 finger 路由，O(log N) 跳；find_finger 沿后继逐个前进，大环中每次需要 O(N) 跳
+        self.finger_table[index][1] = await self.find_successor(start_id)
+
+    async def _check_predecessor(self):
+        # 前驱不可达时标记为无效，此后任何节点的 notify 都会被接受；
+        # 否则失效的前驱会一直被前一个节点的稳定化取回并当作后继
+        predecessor = self.predecessor
+        if predecessor.valid and predecessor.node_id != self.node_id and await connect_node_aio(predecessor) is None:
+            if self.predecessor is not predecessor:
+                return
+            self.predecessor = Node(predecessor.node_id, predecessor.address, predecessor.port, valid=False)
+            # 失效前驱的区间由本节点接管，不依赖前一个节点的 fix_chord：它的后继列表可能还没有本节点
+            await self.merge_replica("predecessor")
+
+    async def update_data(self):
+        """周期性更新数据"""
+        # 获取前驱节点和后继节点的数据
+        predecessor_client, successor_client = await asyncio.gather(connect_node_aio(self.predecessor),
+                                                                    connect_node_aio(self.successor))
+        if predecessor_client and successor_client:
+            # 只拉取副本上次同步之后的变更，原数据与副本取并集（不删除本地数据），两侧并发拉取
+            await asyncio.gather(
+                self._sync_from(predecessor_client, self.predecessor, "successor", self.kv_store, "merge_predecessor", mirror=False),
+                self._sync_from(successor_client, self.successor, "predecessor", self.kv_store, "merge_successor", mirror=False))
+            await self.check_and_clean_data()  # 检查本地的键值对是否属于自己
+            # 更新后继与前驱中的副本
+            await asyncio.gather(successor_client.update_predecessor_kv_store(),
+                                 predecessor_client.update_successor_kv_store())
+
+    async def _sync_from(self, client, peer: Node, place: str, store: KVStore, sync_key: str, mirror: bool):
+        """
+        将对端 place 存储区的数据同步到本地 store，sync_key 标识本地的同步进度。
+        优先拉取增量变更；对端换了节点或变更日志出现缺口时，通过 Merkle 树只拉取不一致的桶。
+        mirror 为 True 时 store 与对端保持一致（同步删除），否则只合并新增与修改
+        """
+        async with self._sync_locks.setdefault(sync_key, asyncio.Lock()):
+            peer_id, epoch, seq = self.sync_state.get(sync_key, (None, "", -1))
+            if peer_id != peer.node_id:
+                epoch, seq = "", -1
+            changes = await client.get_changes_since(place, seq, epoch)
+            if changes.resync:
+                arcs = await self._diff_arcs(client, place, store)
+                # 不一致的桶按连续的弧分页扫描，同步过程中只持有一页
+                await self._sync_buckets(client, place, store, arcs, sync_key, mirror)
+            else:
+                self._record_sync(sync_key, changes.upserts, changes.deletes)
+                if mirror:
+                    store.apply_changes(changes)
+                else:
+                    store.update(changes.upserts)
+            self.sync_state[sync_key] = (peer.node_id, changes.epoch, changes.seq)
+
+    async def check_and_clean_data(self):
+        """对当前节点的所有数据进行检查，删除不符合条件的数据"""
+        for key in self.kv_store.keys_outside(self.predecessor.node_id, self.node_id):
+            self.kv_store.pop(key, None)
+        self.kv_store.set_merkle_arc(self.predecessor.node_id, self.node_id)  # 前驱变化时重建 Merkle 树
+
+    def _get_store(self, place: str):
+        if place == "self":
+            return self.kv_store
+        elif place == "successor":
+            return self.successor_kv_store
+        else:
+            return self._replica_store(place)
+
+    def _open_store(self, place: str):
+        return self.storage.open(store_name(self.node_id, place))
+
+    def is_key_for_node(self, key: str):
+        """判断一个键是否应当属于某个节点，由节点ID决定键是否属于该节点"""
+        tmp_key_node = Node(hash_func(key), "", 0)
+        return is_between(tmp_key_node, self.predecessor, self.self_node)
+
+    async def update_successor_kv_store(self):
+        successor_client = await connect_node_aio(self.successor)
+        # 增量更新successor_kv_store
+        await self._sync_from(successor_client, self.successor, "self", self.successor_kv_store, "successor", mirror=True)
+
+    async def update_predecessor_kv_store(self):
+        predecessor_client = await connect_node_aio(self.predecessor)
+        # 增量更新predecessor_kv_store
+        await self._sync_from(predecessor_client, self.predecessor, "self", self.predecessor_kv_store, "predecessor", mirror=True)
+        await self._update_chain_replicas()
+
+    async def _update_chain_replicas(self):
+        """
+        复制因子 N 大于 2 时本节点还保存前面第 2..N-1 个节点的副本，put 时按后继顺序写入；
+        这里沿前驱链找到这些节点增量同步，环上节点变动后副本随之换成新位置上节点的数据
+        """
+        node, seen = self.predecessor, {self.node_id}
+        for distance in range(2, self.replicas):
+            if not node.valid or node.node_id in seen:
+                return
+            seen.add(node.node_id)
+            client = await connect_node_aio(node)
+            node = await client.get_predecessor() if client else None
+            if node is None or not node.valid or node.node_id in seen:
+                return
+            place = replica_place(distance)
+            await self._sync_from(await connect_node_aio(node), node, "self", self._get_store(place), place, mirror=True)
+
+    async def leave_network(self):
+        # 分块移交数据并确认之后再离开，返回移交报告
+        return await self._graceful_leave()
+
+    async def update_predecessor(self, predecessor):
+        self.predecessor = predecessor  # 更新前驱
+        self._handed_off = None  # 前驱离开，原先交出的区间已归还本节点
+        self._membership_changed()
+
+    async def update_successor(self, successor):
+        self._set_successor(successor)  # 更新后继，后继列表在下一轮稳定化时刷新
+        self._membership_changed()
+
+    async def fix_chord(self):
+        await self.pause_stability_tests()
+        try:
+            new_successor = await self.find_alive_successor()
+            skipped = self._skipped_failed_successors(new_successor)
+            failed = self._failed_before(new_successor)
+            successor_client = await connect_node_aio(new_successor)
+            await successor_client.pause_stability_tests()
+            try:
+                # 在环重建之前，先将successor_client原来前驱的数据保存在本地以防丢失
+                await successor_client.merge_replica("predecessor")
+                # 连续多个节点一起失效时，新后继更远的副本中保存着更前面失效节点的数据，一并并入
+                for distance in range(2, min(failed, self.replicas - 1) + 1):
+                    await successor_client.merge_replica(replica_place(distance))
+                self._set_successor(new_successor)
+                await successor_client.update_predecessor(self.self_node)
+                if skipped:
+                    # 连续多个节点一起失效：第一个失效节点的数据只在本节点的后继副本中，交给接管这段区间的新后继
+                    await self._hand_off_store(successor_client, "self", self.successor_kv_store, LeaveReport(),
+                                               await negotiate_codec_aio(successor_client))
+            finally:
+                await successor_client.resume_stability_tests()
+        finally:
+            # 切换失败时也要恢复稳定化，否则节点停在失效的后继上不再重试
+            await self.resume_stability_tests()
+
+    async def merge_replica(self, place: str):
+        """将本地保存的副本并入自身数据，用于接管失效节点的数据"""
+        self._merge_store(self._get_store(place))
+
+    async def find_alive_successor(self):
+        # 后继列表中第一个存活的节点就是新的后继，一轮探测即可完成切换
+        new_successor = await self._next_alive_successor()
+        if new_successor is not None:
+            return new_successor
+        # 后继列表中的节点都已失效时，才经由 finger table 沿前驱链查找
+        for finger in self.finger_table:
+            finger_node = finger[1]
+            if finger_node is None:
+                continue
+            node = await connect_node_aio(finger_node)
+            if node:
+                return await node.check_predecessor()  # 返回第一个存活的后继节点
+
+        return self.self_node  # 如果没有找到存活的后继节点，返回自身
+
+    async def check_predecessor(self):
+        node = await connect_node_aio(self.predecessor)
+        if node:
+            return await node.check_predecessor()
+        else:
+            return self.self_node
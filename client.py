@@ -1,18 +1,43 @@
 from chord_simulation.chord.struct_class import KeyValueResult, KVStatus
 from chord_simulation.chord.chord_base import connect_address
+from chord_simulation.chord.tracing import new_trace
+from chord_simulation.chord.wire import WireFormat, set_wire_format
+
+# 批量操作时单次 RPC 携带的最大键数量
+BATCH_SIZE = 1000
+
+
+def _status_name(status):
+    if status == KVStatus.VALID:
+        return 'valid'
+    elif status == KVStatus.NOT_FOUND:
+        return 'not_found'
+    elif status == KVStatus.UNAVAILABLE:
+        return 'unavailable'
+    return 'else status'
+
 
 class Client:
-    def __init__(self, address, port):
+    def __init__(self, address, port, wire: WireFormat = None):
+        """wire: 入口节点服务端的协议与传输层（server.py 的 --protocol/--transport），不指定时使用本进程的默认格式"""
         self.address = address
         self.port = port
+        if wire is not None:
+            set_wire_format(wire, address, port)
         self.node = connect_address(address, port)
 
+    def _node(self):
+        """返回到入口节点的客户端，初次连接失败时重新尝试"""
+        if self.node is None:
+            self.node = connect_address(self.address, self.port)
+        return self.node
+
     def put(self, key: str, value: str):
         """
          return put_status: bool and put_node_position: int
         """
 
-        put_res: KeyValueResult = connect_address(self.address, self.port).put(key, value)
+        put_res: KeyValueResult = self._node().put(key, value)
         put_status = True if put_res.status == KVStatus.VALID else False
         return put_status, put_res.node_id
 
@@ -20,14 +45,48 @@ class Client:
         """
          return get_status: str, get_result: k-v, get_node_position: int
         """
-        get_res: KeyValueResult = connect_address(self.address, self.port).lookup(key)
-        status = get_res.status
-        if status == KVStatus.VALID:
-            status = 'valid'
-        elif status == KVStatus.NOT_FOUND:
-            status = 'not_found'
-        else:
-            status = 'else status'
-        return status, get_res.key, get_res.value, get_res.node_id
+        get_res: KeyValueResult = self._node().lookup(key)
+        return _status_name(get_res.status), get_res.key, get_res.value, get_res.node_id
+
+    def trace_get(self, key: str):
+        """
+         return get_status: str, get_result: k-v, get_node_position: int, trace: [TraceHop]
+        """
+        get_res: KeyValueResult = self._node().lookup(key, new_trace())
+        return _status_name(get_res.status), get_res.key, get_res.value, get_res.node_id, get_res.trace or []
+
+    def trace_put(self, key: str, value: str):
+        """
+         return put_status: bool, put_node_position: int, trace: [TraceHop]
+        """
+        put_res: KeyValueResult = self._node().put(key, value, new_trace())
+        return put_res.status == KVStatus.VALID, put_res.node_id, put_res.trace or []
 
+    def trace_find_successor(self, key_id: int):
+        """
+         return successor: Node, trace: [TraceHop]
+        """
+        route = self._node().trace_find_successor(key_id, new_trace())
+        return route.node, route.trace or []
 
+    def put_many(self, kvs: dict, batch_size: int = BATCH_SIZE):
+        """
+         return {key: (put_status: bool, put_node_position: int)}
+        """
+        items = list(kvs.items())
+        results = {}
+        for i in range(0, len(items), batch_size):
+            for put_res in self._node().multi_put(dict(items[i:i + batch_size])):
+                results[put_res.key] = (put_res.status == KVStatus.VALID, put_res.node_id)
+        return results
+
+    def get_many(self, keys: list, batch_size: int = BATCH_SIZE):
+        """
+         return {key: (get_status: str, get_result: k-v, get_node_position: int)}
+        """
+        keys = list(keys)
+        results = {}
+        for i in range(0, len(keys), batch_size):
+            for get_res in self._node().multi_lookup(keys[i:i + batch_size]):
+                results[get_res.key] = (_status_name(get_res.status), get_res.key, get_res.value, get_res.node_id)
+        return results
@@ -1,8 +1,20 @@
+import asyncio
 import thriftpy2
 import argparse
 from thriftpy2.rpc import make_server
+from thriftpy2.contrib.aio.rpc import make_server as make_aio_server
+from chord_simulation.chord.chord_base import READ_QUORUM, REPLICATION_FACTOR, WRITE_QUORUM, check_replication
+from chord_simulation.chord.compression import CODECS, set_codecs
+from chord_simulation.chord.metrics import serve_prometheus
+from chord_simulation.chord.storage import STORE_CLASSES, DiskStorage, MemoryStorage
+from thriftpy2.server import TThreadedServer
+from thriftpy2.transport import TServerSocket
+from chord_simulation.chord.thread_pool_server import make_thread_pool_server, DEFAULT_WORKERS, DEFAULT_BACKLOG
+from chord_simulation.chord.virtual_nodes import DEFAULT_VNODES, VirtualNodeProcessor, make_virtual_nodes
+from chord_simulation.chord.wire import PROTOCOLS, TRANSPORTS, WireFormat, set_wire_format
 from chord_simulation.implement.chord_basic_query import ChordNode as ChordNodeBasicQuery
 from chord_simulation.implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+from chord_simulation.implement.chord_finger_table_aio import ChordNode as ChordNodeFingerTableAio
 
 chord_thrift = thriftpy2.load('chord_simulation/idl/chord.thrift', module_name='chord_thrift')
 
@@ -12,14 +24,116 @@ parser.add_argument('-t', '--task_type', type=str, default='basic_query',
                     help='simulation type:[basic_query|finger_table]')
 parser.add_argument('-a', '--address', type=str, default='localhost', help='server address')
 parser.add_argument('-p', '--port', type=int, help='server port')
+parser.add_argument('-r', '--runtime', type=str, default='thread',
+                    choices=['thread', 'asyncio'],
+                    help='node runtime:[thread(blocking RPCs, maintenance on the shared timer wheel)|asyncio(coroutines on one event loop, finger_table only)]')
+parser.add_argument('-s', '--server_mode', type=str, default='threaded',
+                    choices=['threaded', 'thread_pool'],
+                    help='server mode:[threaded(one thread per connection)|thread_pool(bounded worker pool)]')
+parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS, help='worker threads in thread_pool mode')
+parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG, help='accept backlog in thread_pool mode')
+parser.add_argument('--metrics_port', type=int, default=None,
+                    help='serve node metrics in Prometheus text format at http://<address>:<metrics_port>/metrics')
+parser.add_argument('-v', '--vnodes', type=int, default=DEFAULT_VNODES,
+                    help='virtual nodes hosted by this server, sharing its endpoint, connection pool and process; '
+                         'the others join the ring through virtual node 0')
+parser.add_argument('-d', '--data_dir', type=str, default=None,
+                    help='keep node data in an append-only log with snapshots under this directory, '
+                         'restored on restart; in memory only when omitted')
+parser.add_argument('--store', type=str, default='dict', choices=list(STORE_CLASSES),
+                    help='in-memory store:[dict(a Python dict per store with set indexes, fastest local reads)|'
+                         'compact(keys and values packed into a byte arena, about 0.7x the memory of a plain str '
+                         'dict and 0.35x of dict, local reads about 3.5x slower)]')
+parser.add_argument('--client_timeout', type=int, default=30000,
+                    help='idle timeout of a client connection in ms, must exceed the client pool idle timeout')
+parser.add_argument('--protocol', type=str, default='binary', choices=list(PROTOCOLS),
+                    help='thrift protocol served and used towards other nodes:[binary|compact(smaller messages, '
+                         'more cpu)]; every node and client of a ring must agree')
+parser.add_argument('--transport', type=str, default='buffered', choices=list(TRANSPORTS),
+                    help='thrift transport served and used towards other nodes:[buffered|framed]; '
+                         'every node and client of a ring must agree')
+parser.add_argument('--compression', type=str, nargs='+', default=list(CODECS), choices=list(CODECS) + ['none'],
+                    help='codecs accepted for bulk transfers (scan pages and handoff chunks) in order of preference, '
+                         'negotiated with each peer; none disables compression')
+parser.add_argument('--replicas', type=int, default=REPLICATION_FACTOR,
+                    help='replication factor N: copies of each key, on its owner and the next N-1 successors')
+parser.add_argument('--write_quorum', type=int, default=WRITE_QUORUM,
+                    help='copies W, counting the owner, that must acknowledge a put before it returns')
+parser.add_argument('--read_quorum', type=int, default=READ_QUORUM,
+                    help='copies R, counting the owner, read by a lookup before it returns; '
+                         'the fastest replicas answer, 1 reads only the owner')
+
+
+
+def serve_asyncio(args, storage, wire):
+    """在单个事件循环中运行协程版本的节点"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    node = ChordNodeFingerTableAio(args.address, args.port, storage=storage)
+    node.configure_replication(args.replicas, args.write_quorum, args.read_quorum)
+    if args.metrics_port:
+        serve_prometheus(node.collect_stats, args.address, args.metrics_port)
+    # 协程服务端的 client_timeout 限制的是整条连接的存活时间而不是空闲时间，会切断连接池中的长连接，
+    # 因此不设上限，空闲连接由客户端连接池回收
+    server = make_aio_server(chord_thrift.ChordNode, node, args.address, args.port,
+                             proto_factory=wire.protocol_factory(aio=True),
+                             trans_factory=wire.transport_factory(aio=True), client_timeout=None, loop=loop)
+    node.start(loop)
+    server.serve()
+
 
 if __name__ == '__main__':
     args = parser.parse_args()
-    node = None
-    if args.task_type == 'basic_query':
-        node = ChordNodeBasicQuery(args.address, args.port)
-    elif args.task_type == 'finger_table':
-        node = ChordNodeFingerTable(args.address, args.port)
+    # 服务端与本进程访问其他节点的连接使用同一种协议与传输层
+    wire = WireFormat(args.protocol, args.transport)
+    set_wire_format(wire)
+    set_codecs([] if 'none' in args.compression else args.compression)
+    try:
+        check_replication(args.replicas, args.write_quorum, args.read_quorum)
+    except ValueError as e:
+        parser.error(str(e))
+    # 同一数据目录中按节点 ID 区分文件，重启时载入快照与日志，不必从邻居重新拉取
+    store_class = STORE_CLASSES[args.store]
+    storage = DiskStorage(args.data_dir, store_class=store_class) if args.data_dir else MemoryStorage(store_class)
+    if args.runtime == 'asyncio':
+        if args.task_type != 'finger_table':
+            parser.error('--runtime asyncio is only implemented for --task_type finger_table')
+        if args.vnodes != 1:
+            parser.error('--vnodes is only implemented for --runtime thread')
+        if args.protocol != 'binary':
+            # thriftpy2 的协程版 compact 协议读 map<string, string> 时类型比对出错，整个 map 被当作空值跳过
+            parser.error('--runtime asyncio only supports --protocol binary')
+        try:
+            serve_asyncio(args, storage, wire)
+        finally:
+            storage.close()
+        raise SystemExit
+    if args.vnodes < 1:
+        parser.error('--vnodes must be at least 1')
+    node_class = ChordNodeBasicQuery if args.task_type == 'basic_query' else ChordNodeFingerTable
+    nodes = make_virtual_nodes(node_class, args.address, args.port, args.vnodes, storage=storage)
+    for vnode in nodes:
+        vnode.configure_replication(args.replicas, args.write_quorum, args.read_quorum)
+    node = nodes[0]
+    if args.metrics_port:
+        serve_prometheus(node.collect_stats, args.address, args.metrics_port)
 
-    server = make_server(chord_thrift.ChordNode, node, args.address, args.port)
-    server.serve()
+    # 多个虚拟节点时按 RPC 名中的虚拟节点 ID 分发，只有一个时与原来一样直接交给节点处理
+    processor = VirtualNodeProcessor(chord_thrift.ChordNode, nodes) if len(nodes) > 1 else None
+    if args.server_mode == 'thread_pool':
+        server = make_thread_pool_server(chord_thrift.ChordNode, node, args.address, args.port,
+                                         workers=args.workers, backlog=args.backlog,
+                                         client_timeout=args.client_timeout, processor=processor,
+                                         proto_factory=wire.protocol_factory(), trans_factory=wire.transport_factory())
+    elif processor is not None:
+        server = TThreadedServer(processor, TServerSocket(host=args.address, port=args.port,
+                                                          client_timeout=args.client_timeout),
+                                 itrans_factory=wire.transport_factory(), iprot_factory=wire.protocol_factory())
+    else:
+        server = make_server(chord_thrift.ChordNode, node, args.address, args.port,
+                             proto_factory=wire.protocol_factory(), trans_factory=wire.transport_factory(),
+                             client_timeout=args.client_timeout)
+    try:
+        server.serve()
+    finally:
+        storage.close()  # 退出前把缓冲中的变更写完
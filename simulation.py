@@ -4,85 +4,147 @@ import argparse
 import traceback
 import subprocess
 import os
+import sys
 from client import Client
 from loguru import logger
-from chord_simulation.chord.chord_base import connect_node, hash_func
+from chord_simulation.chord.chord_base import connect_address, connect_node, hash_func, scan_items
+from chord_simulation.chord.metrics import render_prometheus
 from chord_simulation.chord.struct_class import Node
-import tkinter as tk
-import matplotlib.pyplot as plt
-import numpy as np
-import mplcursors
-import matplotlib.font_manager as fm
-# 指定中文字体路径，替换为你的字体文件路径
+from chord_simulation.chord.transport import InMemoryTransport, get_transport, set_transport
+from chord_simulation.chord.wire import PROTOCOLS, TRANSPORTS, WireFormat, get_wire_format, set_wire_format
+from chord_simulation.implement.chord_basic_query import ChordNode as ChordNodeBasicQuery
+from chord_simulation.implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+# 指定中文字体路径，替换为你的字体文件路径；文件不存在时使用 matplotlib 的默认字体
 font_path = 'C:/Windows/Fonts/simhei.ttf'  # Windows系统的路径示例
-# 加载字体
-prop1 = fm.FontProperties(fname=font_path,size=16)
-prop2 = fm.FontProperties(fname=font_path,size=10)
 parser = argparse.ArgumentParser(description='chord simulation.')
 parser.add_argument('-t', '--task_type', type=str, default='finger_table',
                     choices=['basic_query', 'finger_table'],
                     help='simulation type:[basic_query|finger_table]')
 parser.add_argument('-n', '--num_nodes', type=int, default=3)
 parser.add_argument('-k', '--key_nums', type=int, default=50)
+parser.add_argument('-m', '--transport', type=str, default='thrift',
+                    choices=['thrift', 'memory'],
+                    help='node transport:[thrift(one server.py process per node)|memory(all nodes in this process)]')
+parser.add_argument('-u', '--ui', type=str, default='window',
+                    choices=['window', 'cmd'],
+                    help='interaction:[window(tkinter window)|cmd(command line, works without a display)]')
+parser.add_argument('--protocol', type=str, default='binary', choices=list(PROTOCOLS),
+                    help='thrift protocol of the started servers and of this client:[binary|compact]')
+parser.add_argument('--wire_transport', type=str, default='buffered', choices=list(TRANSPORTS),
+                    help='thrift transport of the started servers and of this client:[buffered|framed]')
 
 global key_nums,num_nodes,existing_node
+transport_type = 'thrift'
+
+
+def load_gui():
+    """
+    窗口界面才导入 tkinter 与 matplotlib 并加载字体，
+    命令行界面可以在没有显示器、也没有安装这些依赖的环境中运行
+    """
+    global tk, plt, np, mplcursors, prop1, prop2
+    import tkinter as tk
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import mplcursors
+    import matplotlib.font_manager as fm
+    font = {'fname': font_path} if os.path.exists(font_path) else {}
+    prop1 = fm.FontProperties(size=16, **font)
+    prop2 = fm.FontProperties(size=10, **font)
+
+
+def wait_for_stabilization(seconds=5):
+    """thrift 节点之间的指针要经过几轮周期性的稳定化才调整好；进程内的节点已由 stabilize_after_join 立即调整"""
+    if transport_type != 'memory':
+        time.sleep(seconds)
 
 
 def open_terminal_and_run_command(table_type, port):
     # 获取当前工作目录
     current_directory = os.getcwd()
 
-    # 在此目录下打开命令提示符并运行指定的命令
+    # 在此目录下打开命令提示符并运行指定的命令，服务端与本进程使用同一种协议与传输层
+    wire = get_wire_format()
     command = [
-        'cmd', '/c', 'start', 'cmd', '/k', f'cd /d "{current_directory}" & python server.py -t {table_type} -p {port}'
+        'cmd', '/c', 'start', 'cmd', '/k', f'cd /d "{current_directory}" & python server.py -t {table_type} -p {port} '
+                                           f'--protocol {wire.protocol} --transport {wire.transport}'
     ]
     subprocess.Popen(command)
 
 
-def build_chord_ring_for_basic_query(num_nodes):
-    nodes = []  # 用于存储节点的列表
-    global existing_node
-    # 创建节点并添加到列表中
-    for i in range(num_nodes):
-        open_terminal_and_run_command('basic_query',50000 + i + 1)
+def use_in_memory_transport(num_nodes):
+    """所有节点运行在本进程中，节点之间直接调用对象方法"""
+    global transport_type
+    transport_type = 'memory'
+    set_transport(InMemoryTransport())
+    # 进程内的路由是嵌套的函数调用，每一跳约占两层栈帧，按环的规模放宽递归深度限制
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * num_nodes))
+
+
+def start_node(table_type, address, port):
+    """启动一个节点：thrift 方式在新终端中运行 server.py，memory 方式在本进程中创建节点对象并注册"""
+    if transport_type == 'memory':
+        node_class = ChordNodeBasicQuery if table_type == 'basic_query' else ChordNodeFingerTable
+        get_transport().register(address, port, node_class(address, port))
+    else:
+        open_terminal_and_run_command(table_type, port)
         time.sleep(2)
-        node = Node(hash_func(f'localhost:50000{i+1:02d}'), 'localhost', 50000 + i + 1)
-        nodes.append(node)
-    existing_node = nodes[0]
-    # 连接节点
-    for i in range(1, num_nodes):
-        conn_prev = connect_node(nodes[i])
-        conn_prev.join(nodes[0])  # 所有节点加入到第一个节点
 
-    logger.info("build chord ring...")
-    time.sleep(5)  # 等待一段时间以确保所有节点都已加入
 
+def stabilize_after_join(node: Node):
+    """
+    进程内模拟时立即完成新节点与前后节点之间的指针调整，不等待周期任务，
+    后续节点加入时就能沿正确的后继链路由
+    """
+    transport = get_transport()
+    joined = transport.node_at(node.address, node.port)
+    successor = transport.node_at(joined.successor.address, joined.successor.port)
+    old_predecessor = successor.predecessor
+    joined._stabilize()  # 后继把新节点设为前驱
+    # 原前驱把后继改为新节点，并通知新节点更新前驱；环中只有一个节点时前驱无效，其地址就是后继自身
+    transport.node_at(old_predecessor.address, old_predecessor.port)._stabilize()
 
-def build_chord_ring_for_finger_table(num_nodes):
+
+def build_chord_ring(table_type, num_nodes):
     nodes = []  # 用于存储节点的列表
     global existing_node
+    node_ids = set()
+    port = 50000
     # 创建节点并添加到列表中
-    for i in range(num_nodes):
-        open_terminal_and_run_command('finger_table', 50000 + i + 1)
-        time.sleep(2)
-        node = Node(hash_func(f'localhost:50000{i + 1:02d}'), 'localhost', 50000 + i + 1)
+    while len(nodes) < num_nodes:
+        port += 1
+        node = Node(hash_func(f'localhost:{port}'), 'localhost', port)
+        if node.node_id in node_ids:
+            # 环上只有 2^M 个 ID，节点较多时端口的哈希可能冲突，ID 相同的两个节点无法共存于环中
+            logger.warning(f"skip port {port}: node id {node.node_id} is already taken")
+            continue
+        node_ids.add(node.node_id)
+        start_node(table_type, 'localhost', port)
         nodes.append(node)
     existing_node = nodes[0]
     # 连接节点
     for i in range(1, num_nodes):
         conn_prev = connect_node(nodes[i])
         conn_prev.join(nodes[0])  # 所有节点加入到第一个节点
+        if transport_type == 'memory':
+            stabilize_after_join(nodes[i])
 
     logger.info("build chord ring...")
-    time.sleep(5)  # 等待一段时间以确保所有节点都已加入
+    wait_for_stabilization()  # 等待一段时间以确保所有节点都已加入
+
+
+def build_chord_ring_for_basic_query(num_nodes):
+    build_chord_ring('basic_query', num_nodes)
+
+
+def build_chord_ring_for_finger_table(num_nodes):
+    build_chord_ring('finger_table', num_nodes)
 
 
 def init_data_content(client):
     logger.info("init data content...")
     global key_nums
-    for i in range(key_nums):
-        client.put(f"key-{i}", f"value-{i}")
-        time.sleep(0.5)
+    client.put_many({f"key-{i}": f"value-{i}" for i in range(key_nums)})
 
 
 def kv_output(node):
@@ -92,25 +154,20 @@ def kv_output(node):
     # 获取节点 ID
     output_data['node_id'] = conn_current.get_id()
 
-    # 获取前驱、后继和本地数据
-    predecessor_kv_store = conn_current.get_all_data("predecessor")
-    successor_kv_store = conn_current.get_all_data("successor")
-    kv_store = conn_current.get_all_data("self")
-
-    # 组织输出数据
+    # 分页获取前驱、后继和本地数据并组织输出数据
     output_data['predecessor'] = {
         key: f'hash({key}) = {hash_func(key)}: {value}'
-        for key, value in predecessor_kv_store.items()
+        for key, value in scan_items(conn_current, "predecessor")
     }
 
     output_data['local'] = {
         key: f'hash({key}) = {hash_func(key)}: {value}'
-        for key, value in kv_store.items()
+        for key, value in scan_items(conn_current, "self")
     }
 
     output_data['successor'] = {
         key: f'hash({key}) = {hash_func(key)}: {value}'
-        for key, value in successor_kv_store.items()
+        for key, value in scan_items(conn_current, "successor")
     }
 
     return output_data
@@ -128,10 +185,11 @@ def cmd_interaction(client: Client):
         # 用于记录验证结果
         validation_results = {}
 
+        query_results = client.get_many(list(expected_kv_store.keys()))  # 批量获取实际的值
         for i in range(key_nums):
             key = f"key-{i}"
             expected_value = expected_kv_store[key]  # 获取预期的值
-            query_result = client.get(key)  # 获取实际的值
+            query_result = query_results[key]  # 获取实际的值
             # 解析查询结果
             status, returned_key, actual_value, node_id = query_result
             # 验证返回的值是否与预期相符
@@ -172,11 +230,12 @@ def cmd_interaction(client: Client):
         try:
             node_id = hash_func(node_id)  # 确保节点ID为整数
             port = int(port)  # 确保端口为整数
-            open_terminal_and_run_command('finger_table', port)
-            time.sleep(2)
-            conn_prev = connect_node(Node(node_id, address, port))
+            start_node('finger_table', address, port)
+            conn_prev = connect_address(address, port)  # 按地址访问服务端的第 0 个虚拟节点
             conn_prev.join(existing_node)
-            time.sleep(5)
+            if transport_type == 'memory':
+                stabilize_after_join(Node(node_id, address, port))
+            wait_for_stabilization()
 
         except ValueError:
             print("> Node ID and port must be integers.")
@@ -194,15 +253,45 @@ def cmd_interaction(client: Client):
             port = int(port)  # 确保端口为整数
 
             # 创建当前节点的连接
-            current_node = Node(node_id, address, port)
-            conn_current = connect_node(current_node)
+            conn_current = connect_address(address, port)
 
-            conn_current.leave_network()
+            report = conn_current.leave_network()
+            print(f'> handed off {report.keys} keys ({report.bytes} bytes, {report.chunks} chunks) '
+                  f'in {report.duration:.3f}s, complete: {report.complete}')
 
         except ValueError:
             print("> Node ID and port must be integers.")
         return
 
+    if cmd.startswith("stats"):
+        params = cmd.split(' ')
+        if len(params) != 3:
+            print("> Usage: stats <address> <port>")
+            return
+        try:
+            conn = connect_address(params[1], int(params[2]))
+        except ValueError:
+            print("> Port must be an integer.")
+            return
+        if conn is None:
+            print(f"> node {params[1]}:{params[2]} is not reachable")
+            return
+        print(render_prometheus(conn.get_stats()), end='')
+        return
+
+    if cmd.startswith("trace"):
+        params = cmd.split(' ')
+        if len(params) != 2:
+            print("> Usage: trace <key>")
+            return
+        status, key, value, node_id, trace = client.trace_get(params[1])
+        print(f'> hash func({key}) == {hash_func(key)}, find key in server-{node_id}, get status is {status}.')
+        for i, hop in enumerate(trace):
+            via = f'finger[{hop.finger_index}]' if hop.finger_index >= 0 else '-'
+            print(f'> hop {i}: server-{hop.node_id}, forwarded via {via}, '
+                  f'queue {hop.queue_time * 1000:.3f} ms, service {hop.service_time * 1000:.3f} ms')
+        return
+
     params = cmd.split(' ')
 
     if len(params[0]) == 0:
@@ -340,11 +429,12 @@ def window_interaction(client: Client):
             node_id = address + ":" + port
             node_id = hash_func(node_id)  # 确保节点ID为整数
             port = int(port)  # 确保端口为整数
-            open_terminal_and_run_command('finger_table', port)
-            time.sleep(2)
-            conn_prev = connect_node(Node(node_id, address, port))
+            start_node('finger_table', address, port)
+            conn_prev = connect_address(address, port)  # 按地址访问服务端的第 0 个虚拟节点
             conn_prev.join(existing_node)
-            time.sleep(5)
+            if transport_type == 'memory':
+                stabilize_after_join(Node(node_id, address, port))
+            wait_for_stabilization()
             output.delete(1.0, tk.END)
             output.insert(tk.END, "加入节点成功")
 
@@ -361,11 +451,13 @@ def window_interaction(client: Client):
             port = int(port)  # 确保端口为整数
 
             # 创建当前节点的连接
-            current_node = Node(node_id, address, port)
-            conn_current = connect_node(current_node)
-            conn_current.leave_network()
+            conn_current = connect_address(address, port)
+            report = conn_current.leave_network()
             output.delete(1.0, tk.END)
-            output.insert(tk.END, "删除节点成功")
+            if report.complete:
+                output.insert(tk.END, f"删除节点成功，移交 {report.keys} 个键（{report.bytes} 字节），耗时 {report.duration:.3f} 秒")
+            else:
+                output.insert(tk.END, "数据移交失败，节点未离开")
 
         except ValueError:
             output.delete(1.0, tk.END)
@@ -476,6 +568,9 @@ def main():
     global key_nums, num_nodes
     key_nums = args.key_nums
     num_nodes = args.num_nodes
+    set_wire_format(WireFormat(args.protocol, args.wire_transport))
+    if args.transport == 'memory':
+        use_in_memory_transport(num_nodes)
     if args.task_type == 'basic_query':
         build_chord_ring_for_basic_query(num_nodes)
     elif args.task_type == 'finger_table':
@@ -483,7 +578,12 @@ def main():
 
     client = Client("localhost", 50001)
     init_data_content(client)
-    window_interaction(client)
+    if args.ui == 'cmd':
+        while True:
+            cmd_interaction(client)
+    else:
+        load_gui()
+        window_interaction(client)
 
 
 if __name__ == '__main__':
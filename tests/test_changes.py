@@ -0,0 +1,170 @@
+import contextlib
+import pytest
+from chord_simulation.chord.merkle import arc_length
+from chord_simulation.chord.storage import STORE_CLASSES
+from chord_simulation.des.simulator import ChordSimulator
+from chord_simulation.implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+
+
+@pytest.fixture(params=list(STORE_CLASSES))
+def store_class(request):
+    return STORE_CLASSES[request.param]
+
+
+def test_unchanged_writes_are_not_logged(store_class):
+    """写入相同的值不分配序号，副本之间不会因此来回同步"""
+    store = store_class()
+    store.update({'a': '1', 'b': '2'})
+    seq = store.seq
+    store['a'] = '1'
+    store.update({'a': '1', 'b': '2'})
+    assert store.seq == seq
+    changes = store.changes_since(seq, store.epoch)
+    assert not changes.resync and changes.upserts == {} and changes.deletes == []
+
+
+def test_changes_keep_the_latest_value_per_key(store_class):
+    store = store_class()
+    store.update({'a': '1', 'b': '2', 'c': '3'})
+    seq = store.seq
+    store['a'] = 'x'
+    store['a'] = 'y'
+    del store['b']
+    store['b'] = 'back'
+    store.pop('c')
+    store['d'] = '4'
+    changes = store.changes_since(seq, store.epoch)
+    assert (changes.seq, changes.epoch, changes.resync) == (store.seq, store.epoch, False)
+    assert changes.upserts == {'a': 'y', 'b': 'back', 'd': '4'}
+    assert changes.deletes == ['c']
+
+
+def test_log_gap_requires_resync(store_class):
+    """日志只保留最近 max_log 条，更早的序号无法增量回答；清空之后旧序号也要对账"""
+    store = store_class(max_log=5)
+    for i in range(12):
+        store[f'key-{i}'] = 'v'
+    assert store.changes_since(0, store.epoch).resync
+    assert store.changes_since(store.seq - 6, store.epoch).resync
+    assert store.changes_since(store.seq - 5, store.epoch).upserts == {f'key-{i}': 'v' for i in range(7, 12)}
+    seq = store.seq
+    store.clear()
+    assert store.changes_since(seq, store.epoch).resync
+    assert not store.changes_since(store.seq, store.epoch).resync
+
+
+def test_unknown_epoch_or_future_seq_requires_resync(store_class):
+    """epoch 不同（对端重启换了存储实例）或序号超过当前序号时返回 resync"""
+    store = store_class()
+    store['a'] = '1'
+    restarted = store_class()
+    restarted['a'] = '1'
+    assert restarted.epoch != store.epoch
+    assert restarted.changes_since(store.seq, store.epoch).resync
+    assert store.changes_since(store.seq + 1, store.epoch).resync
+
+
+@pytest.fixture
+def pair():
+    """进程内环上的两个节点：peer 的本节点存储是同步的来源，reader 把它同步到独立的本地存储"""
+    sim = ChordSimulator(ChordNodeFingerTable)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(sim.installed())
+        reader, peer = sim.bootstrap(2)
+        resyncs = []
+        sync_buckets = reader._sync_buckets
+        reader._sync_buckets = lambda *args, **kwargs: resyncs.append(args[3]) or sync_buckets(*args, **kwargs)
+        peer.kv_store.update({f'key-{i}': f'value-{i}' for i in range(500)})
+
+        def sync(store, sync_key='test', mirror=True):
+            reader._sync_from(sim.client(peer), peer.self_node, 'self', store, sync_key, mirror)
+
+        yield reader, peer, sync, resyncs
+
+
+def test_first_sync_then_deltas(pair):
+    """第一次同步经 Merkle 对账，之后只拉取增量；增量同步的键数计入 sync_keys_total"""
+    reader, peer, sync, resyncs = pair
+    store = STORE_CLASSES['dict']()
+    sync(store)
+    assert store.snapshot() == peer.kv_store.snapshot() and len(resyncs) == 1
+    peer.kv_store['key-1'] = 'changed'
+    peer.kv_store['new'] = 'x'
+    before = reader.metrics.counters['sync_keys_total{store="test"}']
+    sync(store)
+    assert store.snapshot() == peer.kv_store.snapshot() and len(resyncs) == 1
+    assert reader.metrics.counters['sync_keys_total{store="test"}'] - before == 2
+    peer.kv_store['key-1'] = 'changed'  # 值未变化，不产生增量
+    sync(store)
+    assert reader.metrics.counters['sync_keys_total{store="test"}'] - before == 2
+
+
+def test_log_gap_falls_back_to_merkle(pair):
+    """两次同步之间对端的变更超出日志长度时，改为对账不一致的桶，结果仍与对端一致"""
+    reader, peer, sync, resyncs = pair
+    small_log = STORE_CLASSES['dict'](max_log=5)
+    small_log.update(peer.kv_store.snapshot())
+    peer.kv_store = small_log
+    store = STORE_CLASSES['dict']()
+    sync(store)
+    for i in range(20):
+        peer.kv_store[f'key-{i}'] = 'rewritten'
+    del peer.kv_store['key-100']
+    sync(store)
+    assert len(resyncs) == 2
+    assert 0 < len(resyncs[1]) < 2 ** 8  # 只拉取不一致的桶
+    assert store.snapshot() == peer.kv_store.snapshot()
+
+
+def test_epoch_change_after_peer_restart(pair):
+    """对端重启后换了存储实例，序号从头开始：按 epoch 识别出来并重新对账，不会把新序号当作增量"""
+    reader, peer, sync, resyncs = pair
+    store = STORE_CLASSES['dict']()
+    sync(store)
+    restarted = STORE_CLASSES['dict']()
+    restarted.update({f'key-{i}': f'value-{i}' for i in range(400)})
+    restarted['key-0'] = 'after restart'
+    for i in range(peer.kv_store.seq):
+        restarted[f'pad-{i % 3}'] = str(i)  # 新实例的序号追上旧实例
+    assert restarted.seq >= peer.kv_store.seq
+    peer.kv_store = restarted
+    sync(store)
+    assert len(resyncs) == 2
+    assert store.snapshot() == restarted.snapshot()
+
+
+def test_mirror_follows_deletes_and_merge_keeps_them(pair):
+    """mirror 同步删除对端已没有的键；合并（mirror=False）只写入新增与修改，增量与对账两条路径一致"""
+    reader, peer, sync, resyncs = pair
+    mirror, merge = STORE_CLASSES['dict'](), STORE_CLASSES['dict']()
+    merge['local-only'] = 'mine'
+    sync(mirror, 'mirror')
+    sync(merge, 'merge', mirror=False)
+    assert merge['local-only'] == 'mine'  # 对账路径
+    del peer.kv_store['key-7']
+    peer.kv_store['key-8'] = 'changed'
+    sync(mirror, 'mirror')
+    sync(merge, 'merge', mirror=False)
+    assert len(resyncs) == 2  # 第二次都是增量同步
+    assert 'key-7' not in mirror and mirror['key-8'] == 'changed'
+    assert merge['key-7'] == 'value-7' and merge['key-8'] == 'changed' and merge['local-only'] == 'mine'
+
+
+def test_resync_uses_the_peers_arc(pair):
+    """对端按 (predecessor, self] 分桶，本地改用同一段弧对账，一个键不一致只拉取弧上 1/256 的一段"""
+    reader, peer, sync, resyncs = pair
+    small_log = STORE_CLASSES['dict'](max_log=5)
+    small_log.update(peer.kv_store.snapshot())
+    peer.kv_store = small_log
+    arc = (reader.node_id, peer.node_id)
+    small_log.set_merkle_arc(*arc)
+    store = STORE_CLASSES['dict']()
+    sync(store)
+    assert store.merkle.arc == arc
+    key = small_log.keys_in_arc(*arc)[0]
+    for i in range(10):
+        small_log[key] = str(i)
+    sync(store)
+    assert len(resyncs) == 2
+    assert len(resyncs[1]) == 1 and arc_length(resyncs[1][0]) <= -(-arc_length(arc) // 2 ** 8)
+    assert store.snapshot() == small_log.snapshot()
@@ -0,0 +1,122 @@
+import random
+import pytest
+from chord_simulation.chord import compact_store
+from chord_simulation.chord.compact_store import CompactKVStore
+from chord_simulation.chord.kv_store import KVStore
+
+
+def _random_ops(rng, count, key_space):
+    """随机的写入、覆盖（更长或更短的值）与删除，键集中在 key_space 个之内以便反复命中"""
+    for _ in range(count):
+        key = f'key-{rng.randrange(key_space)}'
+        op = rng.random()
+        if op < 0.6:
+            yield 'set', key, 'v' * rng.randrange(0, 40) + str(rng.random())
+        elif op < 0.9:
+            yield 'delete', key, None
+        else:
+            yield 'get', key, None
+
+
+def _apply(store, reference, ops):
+    for op, key, value in ops:
+        if op == 'set':
+            store[key] = value
+            reference[key] = value
+        elif op == 'delete':
+            assert store.pop(key, None) == reference.pop(key, None)
+        else:
+            assert store.get(key) == reference.get(key)
+
+
+def _assert_same(store, reference):
+    assert len(store) == len(reference)
+    assert store.snapshot() == reference
+    for key, value in reference.items():
+        assert key in store
+        assert store[key] == value
+    assert sorted(store) == sorted(reference)
+
+
+def test_matches_plain_dict_under_random_operations():
+    """随机操作序列下与普通字典的内容始终一致，覆盖散列表扩容、墓碑与空闲条目复用"""
+    rng = random.Random(22)
+    store, reference = CompactKVStore(), {}
+    ops = list(_random_ops(rng, 20000, 3000))
+    for start in range(0, len(ops), 2000):
+        _apply(store, reference, ops[start:start + 2000])
+        _assert_same(store, reference)
+
+
+def test_matches_kv_store_indexes():
+    """按弧取键、Merkle 摘要与变更日志与 KVStore 的结果相同"""
+    rng = random.Random(7)
+    compact, kv, reference = CompactKVStore(), KVStore(), {}
+    ops = list(_random_ops(rng, 5000, 800))
+    _apply(compact, reference, ops)
+    _apply(kv, {}, ops)
+    assert compact.snapshot() == kv.snapshot() == reference
+    assert compact.changes_since(0, compact.epoch).upserts == kv.changes_since(0, kv.epoch).upserts
+    assert compact.merkle.levels == kv.merkle.levels
+    for start_id, end_id in [(0, 0), (100, 30000), (60000, 500), (2 ** 16 - 1, 2 ** 16 - 1)]:
+        # 同一 ID 上的键在两种存储中的先后不同，只比较 ID 的顺序与键的集合
+        compact_keys, kv_keys = compact.keys_in_arc(start_id, end_id), kv.keys_in_arc(start_id, end_id)
+        assert [compact.key_id(k) for k in compact_keys] == [kv.key_id(k) for k in kv_keys]
+        assert sorted(compact_keys) == sorted(kv_keys)
+    assert sorted(compact.keys_in_buckets(range(0, 256, 3))) == sorted(kv.keys_in_buckets(range(0, 256, 3)))
+
+
+def test_missing_keys_raise():
+    store = CompactKVStore()
+    store['a'] = '1'
+    with pytest.raises(KeyError):
+        store['b']
+    with pytest.raises(KeyError):
+        del store['b']
+    with pytest.raises(KeyError):
+        store.pop('b')
+    assert store.pop('b', 'default') == 'default'
+    assert 1 not in store
+
+
+def test_unchanged_value_records_no_change():
+    store = CompactKVStore()
+    store['a'] = '1'
+    seq = store.seq
+    store['a'] = '1'
+    assert store.seq == seq
+
+
+def test_non_ascii_keys_and_values():
+    store = CompactKVStore()
+    store['键'] = '值'
+    store['key'] = ''
+    store['键'] = '更长的值'
+    assert store.snapshot() == {'键': '更长的值', 'key': ''}
+
+
+def test_compaction_keeps_contents(monkeypatch):
+    """失效字节超过有效字节时整理 arena，整理前后内容不变，已删除的条目被移出"""
+    monkeypatch.setattr(compact_store, 'COMPACT_MIN_GARBAGE', 1024)
+    store, reference = CompactKVStore(), {}
+    for i in range(2000):
+        store[f'key-{i}'] = f'value-{i}'
+        reference[f'key-{i}'] = f'value-{i}'
+    for i in range(0, 2000, 2):
+        del store[f'key-{i}']
+        del reference[f'key-{i}']
+    for i in range(1, 2000, 4):
+        store[f'key-{i}'] = f'a longer value for key {i}'
+        reference[f'key-{i}'] = f'a longer value for key {i}'
+    assert b'key-0' not in store._arena  # 整理之后已删除的条目不再占用 arena
+    assert store._garbage <= len(store._arena) - store._garbage
+    _assert_same(store, reference)
+
+
+def test_clear_and_reuse():
+    store = CompactKVStore()
+    store.update({f'key-{i}': str(i) for i in range(100)})
+    store.clear()
+    assert len(store) == 0 and store.snapshot() == {}
+    store['key-1'] = 'again'
+    assert store.snapshot() == {'key-1': 'again'}
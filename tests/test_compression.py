@@ -0,0 +1,89 @@
+import importlib.util
+import sys
+import pytest
+from thriftpy2.thrift import TApplicationException
+from chord_simulation.chord import compression
+from chord_simulation.chord.compression import choose_codec, decode_items, encode_items, negotiate_codec
+from chord_simulation.chord.transport import InMemoryTransport, get_transport, set_transport
+
+DATA = {f'key-{i}': f'value-{i}' * 4 for i in range(500)}
+
+
+class _Peer:
+    def __init__(self, codecs):
+        self.codecs = codecs
+
+    def get_codecs(self):
+        if self.codecs is None:
+            raise TApplicationException(TApplicationException.UNKNOWN_METHOD, 'get_codecs')
+        return self.codecs
+
+
+@pytest.fixture
+def codecs(monkeypatch):
+    """在测试内设置本进程启用的算法，结束后恢复"""
+    monkeypatch.setattr(compression, '_enabled', list(compression._enabled))
+    return compression.set_codecs
+
+
+@pytest.mark.parametrize('codec', list(compression.CODECS))
+def test_round_trip(codec):
+    name, payload = encode_items(DATA, codec)
+    assert name == codec and len(payload) < len(str(DATA))
+    assert decode_items(name, payload) == DATA
+
+
+def test_small_blocks_are_sent_as_is():
+    """不足 COMPRESS_MIN_BYTES 的块与未协商出算法时照常以 map 发送"""
+    assert encode_items({'a': 'b'}, 'zlib') == (None, None)
+    assert encode_items(DATA, None) == (None, None)
+    assert encode_items({}, 'zlib') == (None, None)
+
+
+def test_unknown_codec_is_rejected(codecs):
+    with pytest.raises(ValueError):
+        decode_items('brotli', b'')
+    with pytest.raises(ValueError):
+        codecs(['brotli'])
+
+
+def test_negotiation_with_mismatched_peers(codecs):
+    """按本进程的优先顺序选出对端也能解压的算法；没有共同算法、对端关闭压缩或不支持 get_codecs 时不压缩"""
+    codecs(['zlib'])
+    assert negotiate_codec(_Peer(['lz4', 'zlib'])) == 'zlib'
+    assert negotiate_codec(_Peer(['lz4'])) is None
+    assert negotiate_codec(_Peer([])) is None
+    assert negotiate_codec(_Peer(None)) is None  # 旧版本的节点
+    codecs([])
+    assert negotiate_codec(_Peer(['zlib'])) is None
+
+
+def test_choose_codec_follows_the_callers_order(codecs):
+    codecs(['zlib'])
+    assert choose_codec(['lz4', 'zlib']) == 'zlib'
+    assert choose_codec(['lz4']) is None
+    assert choose_codec(None) is None
+
+
+def test_in_memory_transport_disables_compression():
+    previous = get_transport()
+    set_transport(InMemoryTransport())
+    try:
+        assert compression.enabled_codecs() == []
+        assert negotiate_codec(_Peer(['zlib'])) is None
+    finally:
+        set_transport(previous)
+
+
+def test_lz4_is_optional(monkeypatch):
+    """没有安装 lz4 时模块照常导入，只提供 zlib，要求 lz4 的配置报错"""
+    monkeypatch.setitem(sys.modules, 'lz4', None)
+    monkeypatch.setitem(sys.modules, 'lz4.frame', None)
+    spec = importlib.util.spec_from_file_location('chord_simulation.chord._compression_without_lz4', compression.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.lz4_frame is None
+    assert list(module.CODECS) == ['zlib']
+    with pytest.raises(ValueError):
+        module.set_codecs(['lz4'])
+    assert module.decode_items(*module.encode_items(DATA, 'zlib')) == DATA
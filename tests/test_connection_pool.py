@@ -0,0 +1,52 @@
+import threading
+import time
+import pytest
+from chord_simulation.chord.chord_base import chord_thrift
+from chord_simulation.chord.connection_pool import ConnectionPool, connect, get_pool
+from chord_simulation.chord.thread_pool_server import make_thread_pool_server
+
+
+class _Handler:
+    def get_id(self):
+        return 7
+
+
+@pytest.fixture
+def port():
+    server = make_thread_pool_server(chord_thrift.ChordNode, _Handler(), 'localhost', 0, workers=2)
+    threading.Thread(target=server.serve, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while server.trans.sock is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield server.trans.sock.getsockname()[1]
+    server.close()
+
+
+def test_idle_connections_to_other_peers_are_closed(port):
+    """空闲超时的连接在访问其他地址时也被关闭，不再访问的对端不会一直占用文件描述符"""
+    pool = ConnectionPool(chord_thrift.ChordNode, idle_timeout=0.2)
+    forgotten = pool.acquire('127.0.0.1', port)
+    pool.release('127.0.0.1', port, forgotten)
+    time.sleep(0.3)
+    conn = pool.acquire('localhost', port)
+    pool.release('localhost', port, conn)
+    assert ('127.0.0.1', port) not in pool._idle
+    assert forgotten.sock.sock is None
+    assert pool._idle[('localhost', port)] == [conn]
+
+
+def test_connect_does_not_probe_a_live_idle_connection(port, monkeypatch):
+    """已有可用的空闲连接时 connect 不检出连接，每次调用只经过连接池一次"""
+    pool = get_pool(chord_thrift.ChordNode)
+    acquired = []
+    acquire = pool.acquire
+    monkeypatch.setattr(pool, 'acquire', lambda *args: acquired.append(args) or acquire(*args))
+    assert connect(chord_thrift.ChordNode, 'localhost', port).get_id() == 7
+    assert len(acquired) == 2  # 第一次没有空闲连接，新建一条确认对端在线
+    assert connect(chord_thrift.ChordNode, 'localhost', port).get_id() == 7
+    assert len(acquired) == 3
+
+
+def test_connect_returns_none_for_an_offline_peer():
+    assert connect(chord_thrift.ChordNode, 'localhost', 1) is None
+    assert ('localhost', 1) not in get_pool(chord_thrift.ChordNode)._idle
@@ -0,0 +1,183 @@
+import asyncio
+import contextlib
+import pytest
+from chord_simulation.chord import chord_base, chord_base_aio
+from chord_simulation.chord.struct_class import KVStatus, Node
+from chord_simulation.des.simulator import ChordSimulator
+from chord_simulation.implement.chord_basic_query import ChordNode as ChordNodeBasicQuery
+from chord_simulation.implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+from chord_simulation.implement.chord_finger_table_aio import ChordNode as AioChordNode
+
+
+@pytest.fixture(params=[ChordNodeFingerTable, ChordNodeBasicQuery], ids=['finger_table', 'basic_query'])
+def sim(request, monkeypatch):
+    """写入 2000 个键的 8 节点进程内环；移交块改小，一个节点的数据分成多块"""
+    monkeypatch.setattr(chord_base, 'TRANSFER_CHUNK_SIZE', 50)
+    sim = ChordSimulator(request.param)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(sim.installed())
+        sim.bootstrap(8)
+        sim.put_keys(2000)
+        yield sim
+
+
+def _leaver(sim):
+    """数据最多的节点，移交需要多块"""
+    return max(sim.alive.values(), key=lambda node: len(node.kv_store))
+
+
+def _successor(sim, node):
+    ids = sim._sorted_ids()
+    return sim.alive[ids[(ids.index(node.node_id) + 1) % len(ids)]]
+
+
+@pytest.mark.parametrize('wraps_zero', [False, True], ids=['most_keys', 'wraps_zero'])
+def test_no_key_is_lost_on_leave(sim, wraps_zero):
+    """
+    离开的节点分块移交全部数据，报告的键数覆盖它自己的数据，离开后每个键仍能查到；
+    ID 最小的节点负责的区间跨越 0 点，分块从它自己的 ID 之后绕环一周
+    """
+    leaver = sim.alive[sim._sorted_ids()[0]] if wraps_zero else _leaver(sim)
+    own = leaver.kv_store.snapshot()
+    successor = _successor(sim, leaver)
+    report = sim.client(leaver).leave_network()
+    sim._remove_node(leaver)
+    assert report.complete
+    assert report.keys >= len(own) and report.chunks >= -(-len(own) // 50)
+    assert report.bytes > 0 and report.duration >= 0
+    assert all(successor.kv_store.get(key) == value for key, value in own.items())
+    assert len(leaver.kv_store) == 0 and leaver.successor == leaver.self_node
+    assert sim.check_data()['lost'] == 0
+    assert all(sim.client(successor).lookup(key).status == KVStatus.VALID for key in own)
+
+
+def _predecessor(sim, node):
+    ids = sim._sorted_ids()
+    return sim.alive[ids[ids.index(node.node_id) - 1]]
+
+
+def test_unacknowledged_chunks_are_retried(sim):
+    """对端确认的键数不符或调用失败时重试同一块，报告只计入最终确认的一次"""
+    leaver = _leaver(sim)
+    own = leaver.kv_store.snapshot()
+    successor = _successor(sim, leaver)
+    failures = iter(['short', 'error'])
+    acked = []  # 每次完整确认的键数
+
+    def flaky(accept_range, fail):
+        def call(place, data, deletes, codec=None, payload=None):
+            failure = next(failures, None) if fail and place == 'self' else None
+            if failure == 'error':
+                raise ConnectionError('connection reset')
+            count = accept_range(place, data, deletes, codec, payload)
+            if failure == 'short':
+                return count - 1
+            acked.append(count)
+            return count
+        return call
+
+    successor.accept_range = flaky(successor.accept_range, True)
+    predecessor = _predecessor(sim, leaver)
+    predecessor.accept_range = flaky(predecessor.accept_range, False)
+    report = sim.client(leaver).leave_network()
+    assert report.complete
+    assert next(failures, None) is None  # 两次失败都发生过
+    assert all(successor.kv_store.get(key) == value for key, value in own.items())
+    assert report.chunks == len(acked)
+    assert report.keys == sum(acked)
+
+
+def test_exhausted_retries_keep_the_node_in_the_ring(sim):
+    """本节点数据始终没有被确认时放弃离开：数据与指针不变，报告标记为未完成"""
+    leaver = _leaver(sim)
+    own = leaver.kv_store.snapshot()
+    successor = _successor(sim, leaver)
+    calls = []
+
+    def refuse(place, data, deletes, codec=None, payload=None):
+        calls.append(place)
+        return 0
+
+    successor.accept_range = refuse
+    report = sim.client(leaver).leave_network()
+    assert not report.complete and report.keys == 0
+    assert calls == ['self'] * chord_base.HANDOFF_RETRIES
+    assert leaver.kv_store.snapshot() == own
+    assert leaver.successor.node_id == successor.node_id
+    assert not successor.stability_test_paused and not leaver.stability_test_paused
+
+
+def test_writes_during_leave_are_handed_off(sim):
+    """移交期间写入本节点的键在前驱与后继互指之后补发给后继"""
+    leaver = _leaver(sim)
+    successor = _successor(sim, leaver)
+    accept_range = successor.accept_range
+    written = []
+
+    def write_while_leaving(place, data, deletes, codec=None, payload=None):
+        if not written:
+            key = next(iter(leaver.kv_store.snapshot()))
+            leaver.kv_store[key] = 'written while leaving'
+            written.append(key)
+        return accept_range(place, data, deletes, codec, payload)
+
+    successor.accept_range = write_while_leaving
+    assert sim.client(leaver).leave_network().complete
+    assert successor.kv_store[written[0]] == 'written while leaving'
+
+
+class _AioPeer:
+    """协程离开流程中的邻居：记录收到的移交数据，第一次确认的键数不符"""
+
+    def __init__(self, node):
+        self.node = node
+        self.stores = {}
+        self.calls = 0
+
+    async def pause_stability_tests(self):
+        pass
+
+    async def resume_stability_tests(self):
+        pass
+
+    async def get_codecs(self):
+        return []
+
+    async def accept_range(self, place, data, deletes, codec=None, payload=None):
+        self.calls += 1
+        self.stores.setdefault(place, {}).update(data)
+        return len(data) + len(deletes) - (self.calls == 1)
+
+    async def update_predecessor(self, predecessor):
+        pass
+
+    async def update_successor(self, successor):
+        pass
+
+
+def test_aio_leave_shares_chunking_and_report(monkeypatch):
+    """协程实现与同步实现按同样的块移交，确认不符的块重试后只计入一次"""
+    monkeypatch.setattr(chord_base, 'TRANSFER_CHUNK_SIZE', 50)
+    node = AioChordNode('localhost', 60001)
+    node.kv_store.update({f'key-{i}': f'value-{i}' for i in range(120)})
+    node.predecessor_kv_store.update({'p': '1'})
+    successor_node = Node((node.node_id + 100) % 2 ** 16, 'localhost', 60002)
+    predecessor_node = Node((node.node_id - 100) % 2 ** 16, 'localhost', 60003)
+    node.successor, node.predecessor = successor_node, predecessor_node
+    peers = {successor_node.port: _AioPeer(successor_node), predecessor_node.port: _AioPeer(predecessor_node)}
+
+    async def connect(target):
+        return peers[target.port]
+
+    monkeypatch.setattr(chord_base_aio, 'connect_node_aio', connect)
+    own = node.kv_store.snapshot()
+    report = asyncio.run(node.leave_network())
+    assert report.complete
+    assert peers[successor_node.port].stores['self'] == own
+    assert peers[successor_node.port].stores['predecessor'] == {'p': '1'}
+    assert peers[predecessor_node.port].stores['successor'] == own
+    # 本节点 3 块、前驱的副本 1 块、交给前驱的本节点数据 3 块，第一块重试一次
+    assert report.chunks == 7
+    assert report.keys == 2 * len(own) + 1
+    assert peers[successor_node.port].calls == 5
+    assert len(node.kv_store) == 0
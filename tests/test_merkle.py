@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+from chord_simulation.chord.chord_base import hash_func
+from chord_simulation.chord.kv_store import KVStore
+from chord_simulation.chord.merkle import (BUCKET_BITS, WHOLE_RING, MerkleTree, arc_length, bucket_arcs, bucket_of,
+                                           bucket_range, buckets_in_arc, diff_buckets, diff_buckets_async)
+
+
+def _pair():
+    local, remote = KVStore(), KVStore()
+    data = {f'key-{i}': f'value-{i}' for i in range(2000)}
+    local.update(data)
+    remote.update(data)
+    return local, remote
+
+
+def _diff(local, remote, calls=None):
+    def fetch(level, indexes):
+        if calls is not None:
+            calls.append((level, list(indexes)))
+        return remote.merkle_hashes(level, indexes)
+    return diff_buckets(local.merkle, fetch)
+
+
+def test_identical_stores_stop_at_the_root():
+    local, remote = _pair()
+    calls = []
+    assert _diff(local, remote, calls) == []
+    assert calls == [(0, [0])]
+
+
+def test_diff_finds_exactly_the_changed_buckets():
+    """修改、新增、删除的键所在的叶子桶都被找出，其余的桶不出现"""
+    local, remote = _pair()
+    remote['key-1'] = 'changed'
+    remote['only-remote'] = 'x'
+    del remote['key-2']
+    expected = sorted({bucket_of(local.key_id(key)) for key in ('key-1', 'only-remote', 'key-2')})
+    calls = []
+    assert sorted(_diff(local, remote, calls)) == expected
+    assert len(calls) == BUCKET_BITS + 1  # 每层一次调用
+    for bucket in expected:
+        assert local.bucket_data([bucket]) != remote.bucket_data([bucket])
+
+
+def test_syncing_differing_buckets_converges():
+    local, remote = _pair()
+    for i in range(0, 2000, 97):
+        remote[f'key-{i}'] = 'new'
+    buckets = _diff(local, remote)
+    for key in local.keys_in_buckets(buckets):
+        local.pop(key, None)
+    local.update(remote.bucket_data(buckets))
+    assert _diff(local, remote) == []
+    assert local.snapshot() == remote.snapshot()
+
+
+def test_hash_is_order_independent():
+    """摘要只取决于内容，与写入顺序和中间的增删无关"""
+    first, second = MerkleTree(), MerkleTree()
+    items = [(i * 37 % 2 ** 16, f'k{i}', f'v{i}') for i in range(300)]
+    for key_id, key, value in items:
+        first.add(key_id, key, value)
+    second.add(5, 'temp', 'x')
+    for key_id, key, value in reversed(items):
+        second.add(key_id, key, value)
+    second.remove(5, 'temp', 'x')
+    assert first.levels == second.levels
+
+
+def test_load_leaves_rebuilds_inner_levels():
+    local, _ = _pair()
+    rebuilt = MerkleTree()
+    rebuilt.load_leaves(local.merkle.levels[BUCKET_BITS])
+    assert rebuilt.levels == local.merkle.levels
+
+
+def test_async_diff_matches():
+    local, remote = _pair()
+    remote['key-5'] = 'changed'
+
+    async def fetch(level, indexes):
+        return remote.merkle_hashes(level, indexes)
+
+    assert asyncio.run(diff_buckets_async(local.merkle, fetch)) == _diff(local, remote)
+
+
+@pytest.mark.parametrize('arc', [WHOLE_RING, (1000, 1200), (65500, 40), (7, 7), (300, 301)])
+def test_bucket_ranges_partition_the_ring(arc):
+    """每个 ID 落在 bucket_range 给出的区间内，各桶的区间合起来恰好是整个环，弧外的 ID 都在最后一个桶"""
+    ranges = [bucket_range(bucket, BUCKET_BITS, arc) for bucket in range(2 ** BUCKET_BITS)]
+    assert sum(arc_length(bounds) for bounds in ranges if bounds) == 2 ** 16
+    for key_id in range(2 ** 16):
+        start_id, end_id = ranges[bucket_of(key_id, BUCKET_BITS, arc)]
+        assert (key_id - start_id - 1) % 2 ** 16 < arc_length((start_id, end_id))
+    assert bucket_arcs(range(2 ** BUCKET_BITS), BUCKET_BITS, arc) == [(arc[0], arc[0])]
+
+
+def test_buckets_in_arc_keeps_overlapping_buckets():
+    """与弧 (65500, 100] 相交的桶恰好是其中各 ID 所在的桶，跨越 0 点的桶合并成一段连续的弧"""
+    arc = (65000, 1000)
+    buckets = buckets_in_arc(range(2 ** BUCKET_BITS), 65500, 100, BUCKET_BITS, arc)
+    inside = [key_id % 2 ** 16 for key_id in range(65501, 2 ** 16 + 101)]
+    assert buckets == sorted({bucket_of(key_id, BUCKET_BITS, arc) for key_id in inside})
+    (start_id, end_id), = bucket_arcs(buckets, BUCKET_BITS, arc)
+    assert all((key_id - start_id - 1) % 2 ** 16 < arc_length((start_id, end_id)) for key_id in inside)
+
+
+def test_short_arc_isolates_a_single_difference():
+    """
+    按节点自己的短弧分桶时，一个键不一致只需取出它所在的 ID 上的键；
+    按整个环分桶时这段弧落在同一个桶里，要取出整个弧上的键
+    """
+    arc = (1030, 1230)
+    data = {key: 'v' for key in (f'key-{i}' for i in range(100000)) if 1030 < hash_func(key) <= 1230}
+    changed = next(iter(data))
+    fetched = {}
+    for tree_arc in (arc, WHOLE_RING):
+        local, remote = KVStore(), KVStore()
+        local.set_merkle_arc(*tree_arc)
+        remote.set_merkle_arc(*tree_arc)
+        local.update(data)
+        remote.update(data)
+        remote[changed] = 'changed'
+        buckets = diff_buckets(local.merkle, lambda level, indexes: remote.merkle_hashes(level, indexes, tree_arc))
+        fetched[tree_arc] = local.keys_in_buckets(buckets)
+    assert {hash_func(key) for key in fetched[arc]} == {hash_func(changed)}
+    assert sorted(fetched[WHOLE_RING]) == sorted(data)
+
+
+def test_set_merkle_arc_rebuilds_the_tree():
+    local, _ = _pair()
+    tree = local.set_merkle_arc(5000, 30000)
+    fresh = KVStore()
+    fresh.set_merkle_arc(5000, 30000)
+    fresh.update(local.snapshot())
+    assert tree.levels == fresh.merkle.levels
+    assert local.set_merkle_arc(5000, 30000) is tree  # 弧不变时不重建
+
+
+def test_changed_arc_falls_back_to_every_bucket():
+    """对端的树已改用其他弧分桶时不再逐个对比，返回全部叶子桶"""
+    local, remote = _pair()
+    remote.set_merkle_arc(10, 20)
+    fetch = lambda level, indexes: remote.merkle_hashes(level, indexes, local.merkle.arc)
+    assert diff_buckets(local.merkle, fetch) == list(range(2 ** BUCKET_BITS))
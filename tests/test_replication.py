@@ -0,0 +1,148 @@
+import contextlib
+import threading
+import time
+import pytest
+from chord_simulation.chord.chord_base import hash_func
+from chord_simulation.chord.struct_class import KVStatus
+from chord_simulation.chord.transport import InMemoryTransport, ThriftTransport
+from chord_simulation.des.simulator import ChordSimulator
+from chord_simulation.implement.chord_basic_query import ChordNode as ChordNodeBasicQuery
+from chord_simulation.implement.chord_finger_table import ChordNode as ChordNodeFingerTable
+
+
+@pytest.fixture(params=[ChordNodeFingerTable, ChordNodeBasicQuery], ids=['finger_table', 'basic_query'])
+def make_ring(request):
+    """
+    按给定的复制参数建立已收敛的 6 个节点的进程内环。维护任务不运行，
+    崩溃的节点只从传输中注销，其他节点在读写副本时才发现它不可达
+    """
+    with contextlib.ExitStack() as stack:
+        def make(**replication):
+            sim = ChordSimulator(request.param, replication=replication)
+            stack.enter_context(sim.installed())
+            sim.bootstrap(6)
+            return sim
+
+        yield make
+
+
+def _owner_and_key(sim, index=0):
+    """环上第 index 个节点及归属于它的一个键"""
+    ids = sim._sorted_ids()
+    owner = sim.alive[ids[index]]
+    key = next(f'key-{i}' for i in range(10 ** 6) if sim.owner_of(hash_func(f'key-{i}'), ids) == owner.node_id)
+    return owner, key
+
+
+def _successors(sim, node, count):
+    ids = sim._sorted_ids()
+    index = ids.index(node.node_id)
+    return [sim.alive[ids[(index + k) % len(ids)]] for k in range(1, count + 1)]
+
+
+def _crash(sim, node):
+    sim._remove_node(node)
+
+
+def test_replicas_are_placed_on_the_next_successors(make_ring):
+    """N=3 时键存于归属节点、第 1 个后继的 predecessor 存储区与第 2 个后继的 predecessor2 存储区"""
+    sim = make_ring(replicas=3, write_quorum=3)
+    owner, key = _owner_and_key(sim)
+    assert sim.client(owner).put(key, 'v').status == KVStatus.VALID
+    first, second, third = _successors(sim, owner, 3)
+    assert owner.kv_store[key] == 'v'
+    assert first.predecessor_kv_store[key] == 'v'
+    assert second.replica_kv_stores[2][key] == 'v'
+    assert key not in third.kv_store and key not in third.predecessor_kv_store
+    assert all(key not in store for store in third.replica_kv_stores.values())
+
+
+def test_write_quorum_tolerates_one_replica_down(make_ring):
+    """N=3、W=2：一个副本节点失效时本地与另一个副本凑齐两份，写入成功"""
+    sim = make_ring(replicas=3, write_quorum=2)
+    owner, key = _owner_and_key(sim)
+    first, second = _successors(sim, owner, 2)
+    _crash(sim, first)
+    assert sim.client(owner).put(key, 'v').status == KVStatus.VALID
+    assert second.replica_kv_stores[2][key] == 'v'
+
+
+def test_write_quorum_not_reached(make_ring):
+    """N=3、W=2：两个副本节点都失效时只有本地一份，put 与 multi_put 返回 UNAVAILABLE，本地仍然写入"""
+    sim = make_ring(replicas=3, write_quorum=2)
+    owner, key = _owner_and_key(sim)
+    for node in _successors(sim, owner, 2):
+        _crash(sim, node)
+    assert sim.client(owner).put(key, 'v').status == KVStatus.UNAVAILABLE
+    assert owner.kv_store[key] == 'v'
+    results = sim.client(owner).multi_put({key: 'w'})
+    assert [result.status for result in results] == [KVStatus.UNAVAILABLE]
+    assert owner.metrics.counters['quorum_failures_total{op="put"}'] == 2
+
+
+def test_read_quorum(make_ring):
+    """N=3、R=2：一个副本节点失效时仍能读到，两个都失效时 lookup 返回 UNAVAILABLE"""
+    sim = make_ring(replicas=3, write_quorum=3, read_quorum=2)
+    owner, key = _owner_and_key(sim)
+    assert sim.client(owner).put(key, 'v').status == KVStatus.VALID
+    first, second = _successors(sim, owner, 2)
+    _crash(sim, first)
+    result = sim.client(owner).lookup(key)
+    assert (result.status, result.value) == (KVStatus.VALID, 'v')
+    _crash(sim, second)
+    assert sim.client(owner).lookup(key).status == KVStatus.UNAVAILABLE
+    assert [result.status for result in sim.client(owner).multi_lookup([key])] == [KVStatus.UNAVAILABLE]
+
+
+def test_read_quorum_takes_the_majority_value(make_ring):
+    """N=3、R=3：归属节点本地的值与两个副本不一致时取多数的值；本地缺失时取副本上找到的值"""
+    sim = make_ring(replicas=3, write_quorum=3, read_quorum=3)
+    owner, key = _owner_and_key(sim)
+    sim.client(owner).put(key, 'v')
+    owner.kv_store[key] = 'stale'
+    assert sim.client(owner).lookup(key).value == 'v'
+    del owner.kv_store[key]
+    result = sim.client(owner).lookup(key)
+    assert (result.status, result.value) == (KVStatus.VALID, 'v')
+
+
+def test_quorum_is_capped_by_ring_size(make_ring):
+    """环中节点不足 N 个时法定数按现有节点计算，不会因为副本不够而一直失败"""
+    sim = make_ring(replicas=3, write_quorum=3, read_quorum=3)
+    owner, key = _owner_and_key(sim)
+    for node in list(sim.alive.values()):
+        if node is not owner:
+            _crash(sim, node)
+    owner.successor = owner.predecessor = owner.self_node
+    owner.successor_list = []
+    assert sim.client(owner).put(key, 'v').status == KVStatus.VALID
+    assert sim.client(owner).lookup(key).value == 'v'
+
+
+def _raise():
+    raise ConnectionError('node is unreachable')
+
+
+@pytest.mark.parametrize('transport', [InMemoryTransport(), ThriftTransport()], ids=['memory', 'thrift'])
+def test_call_quorum_counts_only_successes(transport):
+    """返回 None 或抛出异常的调用不计入法定数；成功的不足 needed 个时等所有调用结束后返回已成功的结果"""
+    assert transport.call_quorum([_raise, lambda: None, lambda: 'a', lambda: 'b'], 3) in (['a', 'b'], ['b', 'a'])
+    assert transport.call_quorum([], 1) == []
+
+
+def test_thrift_call_quorum_returns_before_slow_calls():
+    """凑齐 needed 个成功后立即返回，慢的副本在后台继续完成"""
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow():
+        release.wait(5)
+        finished.set()
+        return 'slow'
+
+    started = time.monotonic()
+    assert ThriftTransport().call_quorum([lambda: 'fast', slow], 1) == ['fast']
+    assert time.monotonic() - started < 1
+    assert not finished.is_set()
+    release.set()
+    assert finished.wait(5)
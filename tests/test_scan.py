@@ -0,0 +1,90 @@
+import random
+import pytest
+from chord_simulation.chord.storage import STORE_CLASSES
+
+ARCS = [(None, None), (1000, 40000), (60000, 3000), (5, 5)]
+
+
+@pytest.fixture(params=list(STORE_CLASSES))
+def store(request):
+    # 5000 个键落在 2^16 个 ID 上，必然有多个键共用一个 ID，分页可能从一个 ID 的中间断开
+    store = STORE_CLASSES[request.param]()
+    store.update({f'key-{i}': f'value-{i}' for i in range(5000)})
+    return store
+
+
+def _pages(store, limit, start_id, end_id):
+    cursor, pages = '', []
+    while True:
+        data, next_cursor, done = store.scan(cursor, limit, start_id, end_id)
+        pages.append((cursor, next_cursor, data))
+        if done:
+            return pages
+        assert len(data) == limit
+        cursor = next_cursor
+
+
+def _expected(store, start_id, end_id):
+    if start_id is None or start_id == end_id:
+        return store.snapshot()
+    return store.items_in_arc(start_id, end_id)
+
+
+def test_shared_ids_exist(store):
+    ids = [store.key_id(key) for key in store.snapshot()]
+    assert len(set(ids)) < len(ids)
+
+
+@pytest.mark.parametrize('limit', [1, 7, 1000, 0])
+@pytest.mark.parametrize('start_id, end_id', ARCS)
+def test_scan_returns_every_key_once(store, limit, start_id, end_id):
+    """按页扫描一段弧，每个键恰好出现一次；limit 为 0 时一页取完"""
+    seen = {}
+    for _, _, data in _pages(store, limit, start_id, end_id):
+        assert not seen.keys() & data.keys()
+        seen.update(data)
+    assert seen == _expected(store, start_id, end_id)
+
+
+def test_scan_order_follows_the_ring(store):
+    """整个环按 ID 从 0 开始，弧从起点顺时针，同一 ID 上的键按字典序"""
+    keys = [key for _, _, data in _pages(store, 9, 60000, 3000) for key in data]
+    ranks = [((store.key_id(key) - 60000 - 1) % 2 ** 16, key) for key in keys]
+    assert ranks == sorted(ranks)
+    keys = [key for _, _, data in _pages(store, 9, None, None) for key in data]
+    assert [store.key_id(key) for key in keys] == sorted(store.key_id(key) for key in keys)
+
+
+def test_cursor_survives_writes_between_pages(store):
+    """翻页之间增删其他键，游标不失效：期间一直存在的键恰好返回一次"""
+    rng = random.Random(23)
+    stable = set(store.snapshot())
+    cursor, seen, done = '', [], False
+    while not done:
+        data, cursor, done = store.scan(cursor, 50, None, None)
+        seen.extend(data)
+        for _ in range(10):
+            victim = f'key-{rng.randrange(5000)}'
+            store.pop(victim, None)
+            stable.discard(victim)
+            store[f'new-{rng.randrange(10 ** 6)}'] = 'x'
+    assert len(seen) == len(set(seen))
+    assert stable <= set(seen)
+
+
+@pytest.mark.parametrize('start_id, end_id', ARCS)
+def test_keys_between_matches_each_page(store, start_id, end_id):
+    """keys_between(游标, 下一页游标) 与该页的键相同，最后一页 upto 为空串时直到弧的终点"""
+    for cursor, next_cursor, data in _pages(store, 37, start_id, end_id):
+        assert store.keys_between(cursor, next_cursor, start_id, end_id) == list(data)
+
+
+def test_keys_between_sees_local_only_keys(store):
+    """本地多出的键落在页的范围内时也被列出，同步时据此删除对端已没有的键"""
+    data, cursor, _ = store.scan('', 100, None, None)
+    first, last = store.key_id(next(iter(data))), store.key_id(list(data)[-1])
+    extra = next(f'extra-{i}' for i in range(10 ** 6)
+                 if first < store.key_id(f'extra-{i}') < last)
+    store[extra] = 'local'
+    assert extra in store.keys_between('', cursor, None, None)
+    assert extra not in data
@@ -0,0 +1,141 @@
+import glob
+import os
+import time
+import pytest
+from chord_simulation.chord.storage import STORE_CLASSES, DiskStorage, DurableLog
+
+
+@pytest.fixture(params=list(STORE_CLASSES))
+def store_class(request):
+    return STORE_CLASSES[request.param]
+
+
+def _reopen(path, store_class, **kwargs):
+    log = DurableLog(path, store_class=store_class, **kwargs)
+    return log, log.open()
+
+
+def test_replay_restores_contents(tmp_path, store_class):
+    """写入、覆盖、删除与清空都写进日志，重新打开后内容与序号不变"""
+    path = str(tmp_path / 'node-self')
+    log, store = _reopen(path, store_class)
+    store.update({f'key-{i}': f'value-{i}' for i in range(200)})
+    store.clear()
+    store.update({f'key-{i}': f'value-{i}' for i in range(100)})
+    store['key-1'] = 'changed'
+    del store['key-2']
+    store.commit()
+    expected, seq = store.snapshot(), store.seq
+    log.close()
+
+    log, store = _reopen(path, store_class)
+    assert store.snapshot() == expected
+    assert store.seq == seq
+    store['key-3'] = 'after restart'  # 重启后继续追加，序号接着增长
+    store.commit()
+    log.close()
+
+    log, store = _reopen(path, store_class)
+    assert store['key-3'] == 'after restart'
+    assert store.seq == seq + 1
+    log.close()
+
+
+def test_torn_tail_is_truncated(tmp_path, store_class):
+    """崩溃时写了一半的最后一条记录在重放时丢弃，日志段截断到完整记录处，之后可以继续追加"""
+    path = str(tmp_path / 'node-self')
+    log, store = _reopen(path, store_class)
+    for i in range(50):
+        store[f'key-{i}'] = f'value-{i}'
+    store.commit()
+    log.close()
+    segment = glob.glob(path + '.*.log')[0]
+    intact = os.path.getsize(segment)
+    with open(segment, 'ab') as f:
+        f.write(b'\x01\x02\x03')  # 只写出了记录头的前几个字节
+
+    log, store = _reopen(path, store_class)
+    assert store.snapshot() == {f'key-{i}': f'value-{i}' for i in range(50)}
+    assert os.path.getsize(segment) == intact
+    log.close()
+
+    # 最后一条完整记录被截掉一部分时，它之前的记录仍然全部保留
+    os.truncate(segment, intact - 2)
+    log, store = _reopen(path, store_class)
+    assert store.snapshot() == {f'key-{i}': f'value-{i}' for i in range(49)}
+    assert store.seq == 49
+    store['key-49'] = 'rewritten'
+    store.commit()
+    log.close()
+
+    log, store = _reopen(path, store_class)
+    assert store['key-49'] == 'rewritten' and len(store) == 50
+    log.close()
+
+
+def test_corrupted_record_stops_replay(tmp_path, store_class):
+    """CRC 不符的记录及其之后的内容不再重放"""
+    path = str(tmp_path / 'node-self')
+    log, store = _reopen(path, store_class)
+    store['a'] = '1'
+    store.commit()
+    boundary = os.path.getsize(glob.glob(path + '.*.log')[0])
+    store['b'] = '2'
+    store['c'] = '3'
+    store.commit()
+    log.close()
+    segment = glob.glob(path + '.*.log')[0]
+    with open(segment, 'r+b') as f:
+        f.seek(boundary + 20)
+        f.write(b'\xff')
+
+    log, store = _reopen(path, store_class)
+    assert store.snapshot() == {'a': '1'}
+    log.close()
+
+
+def test_snapshot_replaces_old_segments(tmp_path, store_class):
+    """日志超过阈值后写快照并删除旧日志段，从快照与新日志段恢复出相同的内容"""
+    path = str(tmp_path / 'node-self')
+    log, store = _reopen(path, store_class, snapshot_log_bytes=4096)
+    store.set_merkle_arc(1000, 40000)  # 快照同时记录分桶的弧
+    for i in range(500):
+        store[f'key-{i}'] = f'value-{i}'
+        store.commit()
+    deadline = time.monotonic() + 10
+    while (not os.path.exists(path + '.snapshot') or log._snapshotting) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    store['last'] = 'write'
+    store.commit()
+    expected = store.snapshot()
+    log.close()
+    assert os.path.exists(path + '.snapshot')
+    assert not os.path.exists(path + '.snapshot.tmp')
+
+    log, store = _reopen(path, store_class)
+    assert store.snapshot() == expected
+    assert store.merkle.arc == (1000, 40000)
+    assert store.merkle.levels == _rebuilt_merkle(store_class, expected, (1000, 40000))
+    log.close()
+
+
+def _rebuilt_merkle(store_class, contents, arc):
+    store = store_class()
+    store.set_merkle_arc(*arc)
+    store.update(contents)
+    return store.merkle.levels
+
+
+def test_disk_storage_keeps_stores_apart(tmp_path, store_class):
+    storage = DiskStorage(str(tmp_path), store_class=store_class)
+    own, replica = storage.open('1-self'), storage.open('1-predecessor')
+    own['a'] = 'own'
+    replica['a'] = 'replica'
+    own.commit()
+    replica.commit()
+    storage.close()
+
+    storage = DiskStorage(str(tmp_path), store_class=store_class)
+    assert storage.open('1-self').snapshot() == {'a': 'own'}
+    assert storage.open('1-predecessor').snapshot() == {'a': 'replica'}
+    storage.close()
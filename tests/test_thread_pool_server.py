@@ -0,0 +1,57 @@
+import threading
+import time
+import pytest
+from thriftpy2.rpc import make_client
+from chord_simulation.chord.chord_base import chord_thrift
+from chord_simulation.chord.thread_pool_server import make_thread_pool_server
+
+
+class _Handler:
+    def __init__(self, parties):
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def get_id(self):
+        # 所有调用都到达之后才返回，只有在多个工作线程中同时处理时才不会超时
+        return self.barrier.wait()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(handler, workers):
+        server = make_thread_pool_server(chord_thrift.ChordNode, handler, 'localhost', 0, workers=workers)
+        threading.Thread(target=server.serve, daemon=True).start()
+        deadline = time.monotonic() + 5
+        while server.trans.sock is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        servers.append(server)
+        return server.trans.sock.getsockname()[1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _client(port):
+    return make_client(chord_thrift.ChordNode, 'localhost', port, timeout=10000)
+
+
+def test_requests_are_served_concurrently(serve):
+    port = serve(_Handler(3), workers=3)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_client(port).get_id())) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [0, 1, 2]
+
+
+def test_idle_connections_do_not_hold_workers(serve):
+    """空闲的长连接不占用工作线程：只有一个工作线程时，其他连接上的请求仍依次得到处理"""
+    port = serve(_Handler(1), workers=1)
+    idle = [_client(port) for _ in range(3)]
+    active = _client(port)
+    assert [active.get_id() for _ in range(3)] == [0, 0, 0]
+    assert [client.get_id() for client in idle] == [0, 0, 0]
@@ -0,0 +1,98 @@
+import threading
+import time
+from chord_simulation.chord.timer_wheel import LEVELS, SLOTS, TimerHandle, TimerWheel
+
+
+def _fire_ticks(wheel, expires_list, ticks):
+    """不启动驱动线程，直接放入定时并逐刻度推进，返回 {到期刻度: [定时的 expires]}"""
+    handles = []
+    with wheel._lock:
+        for expires in expires_list:
+            handle = TimerHandle(wheel, expires, None)
+            wheel._add(handle)
+            wheel._pending += 1
+            handles.append(handle)
+    fired = {}
+    with wheel._lock:
+        for _ in range(ticks):
+            tick = wheel._current
+            for handle in wheel._advance():
+                fired.setdefault(tick, []).append(handle.expires)
+    return handles, fired
+
+
+def test_cascade_fires_each_timer_on_its_tick():
+    """跨越各层时间轮的定时逐层下放后恰好在到期的刻度执行，每个只执行一次"""
+    wheel = TimerWheel()
+    expires_list = [0, 1, SLOTS - 1, SLOTS, SLOTS + 1, 2 * SLOTS - 1, 5 * SLOTS + 3,
+                    SLOTS ** 2 - 1, SLOTS ** 2, SLOTS ** 2 + 7, 3 * SLOTS ** 2 + 5 * SLOTS + 11,
+                    SLOTS ** 3, SLOTS ** 3 + SLOTS ** 2 + SLOTS + 1]
+    _, fired = _fire_ticks(wheel, expires_list, SLOTS ** 3 + SLOTS ** 2 + SLOTS + 2)
+    assert fired == {expires: [expires] for expires in expires_list}
+    assert len(wheel) == 0
+
+
+def test_cascade_from_a_later_start():
+    """当前刻度不在 0 时加入的定时同样按时执行，不因高层槽的索引绕回而提前或丢失"""
+    wheel = TimerWheel()
+    wheel._current = SLOTS ** 2 - 3
+    start = wheel._current
+    expires_list = [start + delta for delta in (0, 2, 3, 4, SLOTS, SLOTS ** 2, 2 * SLOTS ** 2 + 1)]
+    _, fired = _fire_ticks(wheel, expires_list, 2 * SLOTS ** 2 + 2)
+    assert fired == {expires: [expires] for expires in expires_list}
+
+
+def test_cancelled_timer_never_fires():
+    wheel = TimerWheel()
+    handles, _ = _fire_ticks(wheel, [10, SLOTS * 3], 0)
+    handles[1].cancel()
+    assert len(wheel) == 1
+    _, fired = _fire_ticks(wheel, [], SLOTS * 4)
+    assert fired == {10: [10]}
+    handles[1].cancel()  # 重复取消没有影响
+    assert len(wheel) == 0
+
+
+def test_far_timers_wait_in_the_last_slot():
+    """超出各层总跨度的定时先放在最高层，逐次下放直到到期"""
+    wheel = TimerWheel()
+    handles, _ = _fire_ticks(wheel, [SLOTS ** LEVELS + 5], 0)
+    assert handles[0]._slot is not None and handles[0]._slot in wheel._wheels[LEVELS - 1]
+
+
+def test_schedule_runs_callbacks_on_workers():
+    """真实时钟下回调在工作线程中执行，取消的定时不执行"""
+    wheel = TimerWheel(tick=0.001, workers=2)
+    done = threading.Event()
+    fired = []
+    wheel.schedule(0.05, lambda: fired.append('cancelled')).cancel()
+    wheel.schedule(0.01, lambda: fired.append('first'))
+    wheel.schedule(0.08, lambda: (fired.append('second'), done.set()))
+    assert done.wait(5)
+    assert fired == ['first', 'second']
+
+
+def test_next_due_skips_empty_ticks():
+    """驱动线程睡到最近的非空槽或需要下放的整圈刻度，而不是逐个刻度醒来"""
+    wheel = TimerWheel()
+    wheel._current = 1  # 刻度 0 上各层都要下放
+    _fire_ticks(wheel, [5 * SLOTS + 20], 0)
+    assert wheel._next_due() == 5 * SLOTS  # 第 1 层的槽在这一圈开始时下放
+    _fire_ticks(wheel, [], 5 * SLOTS + 1)
+    assert wheel._next_due() == 5 * SLOTS + 20
+    _fire_ticks(wheel, [5 * SLOTS + 3], 0)
+    assert wheel._next_due() == 5 * SLOTS + 3
+
+
+def test_idle_driver_does_not_poll(monkeypatch):
+    """只有远处的定时时，驱动线程在等待期间几乎不醒来；新的定时会提前唤醒它"""
+    wheel = TimerWheel(tick=0.01, workers=1)
+    wakeups = []
+    next_due = wheel._next_due
+    monkeypatch.setattr(wheel, '_next_due', lambda: wakeups.append(1) or next_due())
+    wheel.schedule(30, lambda: None)
+    time.sleep(0.5)
+    assert len(wakeups) <= 3  # 逐刻度轮询时约 50 次
+    done = threading.Event()
+    wheel.schedule(0.02, done.set)
+    assert done.wait(2)
@@ -0,0 +1,101 @@
+import threading
+import time
+import pytest
+from chord_simulation.chord import wire as wire_module
+from chord_simulation.chord.chord_base import chord_thrift, make_scan_page, scan_pages
+from chord_simulation.chord.compression import decode_items, enabled_codecs, encode_items
+from chord_simulation.chord.connection_pool import PooledConnection, connect
+from chord_simulation.chord.kv_store import KVStore
+from chord_simulation.chord.thread_pool_server import make_thread_pool_server
+from chord_simulation.chord.wire import PROTOCOLS, TRANSPORTS, WireFormat, get_wire_format, set_wire_format
+
+FORMATS = [WireFormat(protocol, transport) for protocol in PROTOCOLS for transport in TRANSPORTS]
+
+
+class _Handler:
+    """只实现测试用到的 RPC：分页扫描一个存储，接收压缩的移交数据"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def get_id(self):
+        return 7
+
+    def get_codecs(self):
+        return enabled_codecs()
+
+    def scan(self, place, cursor, limit, start_id=None, end_id=None, codecs=None):
+        return make_scan_page(*self.store.scan(cursor, limit, start_id, end_id), codecs)
+
+    def accept_range(self, place, data, deletes, codec=None, payload=None):
+        return len(decode_items(codec, payload) if codec else data) + len(deletes)
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """按给定的格式启动服务端，返回端口；按地址单独指定的客户端格式在测试结束后恢复"""
+    monkeypatch.setattr(wire_module, '_overrides', {})
+    servers = []
+
+    def start(wire, store=None):
+        server = make_thread_pool_server(chord_thrift.ChordNode, _Handler(store or KVStore()), 'localhost', 0,
+                                         proto_factory=wire.protocol_factory(), trans_factory=wire.transport_factory())
+        threading.Thread(target=server.serve, daemon=True).start()
+        deadline = time.monotonic() + 5
+        while server.trans.sock is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        servers.append(server)
+        return server.trans.sock.getsockname()[1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.mark.parametrize('wire', FORMATS, ids=repr)
+def test_compressed_pages_round_trip(serve, wire):
+    """各种协议与传输层下，压缩的扫描页与移交块经 binary 字段完整往返"""
+    store = KVStore()
+    store.update({f'key-{i}': f'value-{i}' * 4 for i in range(3000)})
+    port = serve(wire, store)
+    set_wire_format(wire, 'localhost', port)
+    client = connect(chord_thrift.ChordNode, 'localhost', port)
+    pages = list(scan_pages(client, 'self'))
+    assert all(page.codec == 'zlib' for page in pages)
+    assert {key: value for page in pages for key, value in page.data.items()} == store.snapshot()
+    codec, payload = encode_items(store.snapshot(), 'zlib')
+    assert client.accept_range('self', {}, ['gone'], codec, payload) == len(store) + 1
+
+
+def test_override_applies_to_one_address(serve):
+    """按地址指定的格式只影响该地址，其余地址仍用本进程的默认格式"""
+    compact = WireFormat('compact', 'framed')
+    compact_port, binary_port = serve(compact), serve(WireFormat())
+    set_wire_format(compact, 'localhost', compact_port)
+    assert get_wire_format('localhost', compact_port) == compact
+    assert get_wire_format('localhost', binary_port) == WireFormat()
+    assert connect(chord_thrift.ChordNode, 'localhost', compact_port).get_id() == 7
+    assert connect(chord_thrift.ChordNode, 'localhost', binary_port).get_id() == 7
+
+
+@pytest.mark.parametrize('server_wire, client_wire', [
+    (WireFormat('compact', 'framed'), WireFormat()),
+    (WireFormat(), WireFormat('binary', 'framed')),
+    (WireFormat('compact', 'buffered'), WireFormat('binary', 'buffered')),
+], ids=repr)
+def test_mismatched_formats_fail_instead_of_hanging(serve, server_wire, client_wire):
+    """两端格式不一致时调用在超时内报错，不会误读出结果"""
+    port = serve(server_wire)
+    conn = PooledConnection(chord_thrift.ChordNode, 'localhost', port, timeout=1000, wire=client_wire)
+    started = time.monotonic()
+    with pytest.raises(Exception):
+        conn.client.get_id()
+    assert time.monotonic() - started < 5
+    conn.close()
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        WireFormat('json')
+    with pytest.raises(ValueError):
+        WireFormat('binary', 'http')